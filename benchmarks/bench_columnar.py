@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Compares the columnar numpy checker (cafa_columnar_checker) with the line by line
+record state machine on a generated submission of --lines lines (50M by default).
+
+Run from the project's base directory:
+python benchmarks/bench_columnar.py --lines 50000000
+'''
+import argparse
+import os
+import sys
+import tempfile
+
+from bench_record_engine import ONTOLOGIES, write_submission, time_checker
+
+from cafa_record_engine import check_records
+from cafa_columnar_checker import columnar_cafa_checker, np
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=50000000, help="prediction lines per generated file")
+    parser.add_argument("--ontology", choices=sorted(ONTOLOGIES), action="append",
+                        help="ontology to benchmark, may be repeated (default: all)")
+    args = parser.parse_args()
+
+    if np is None:
+        print("numpy is not installed, the columnar checker would fall back to check_records")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for ontology in args.ontology or sorted(ONTOLOGIES):
+            module, prediction_check, prefix, filename = ONTOLOGIES[ontology]
+            path = os.path.join(tmp_dir, filename)
+            write_submission(path, prefix, args.lines)
+            spec = module.RECORD_SPEC
+
+            lines = time_checker(lambda handle: check_records(handle, filename, spec), path)
+            columnar = time_checker(lambda handle: columnar_cafa_checker(handle, filename, spec), path)
+            print("{ontology:>4}: line by line {lines:7.2f}s ({lines_rate:,.0f} lines/s)  "
+                  "columnar {columnar:7.2f}s ({columnar_rate:,.0f} lines/s)  speedup x{speedup:.2f}".format(
+                      ontology=ontology, lines=lines, columnar=columnar,
+                      lines_rate=args.lines / lines, columnar_rate=args.lines / columnar,
+                      speedup=lines / columnar))
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
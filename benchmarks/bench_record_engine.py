@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Compares the shared record state machine (cafa_record_engine) against the per-ontology
+if/elif loops it replaced, on a generated submission of --lines lines (10M by default).
+
+Run from the project's base directory:
+python benchmarks/bench_record_engine.py --lines 10000000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cafa_go_format_checker as go_module
+import cafa_hpo_format_checker as hpo_module
+import cafa_do_format_checker as do_module
+
+ONTOLOGIES = {
+    # ontology: (module, prediction check, term prefix, filename)
+    'go': (go_module, go_module.go_prediction_check, "GO", "bench_1_9606_go.txt"),
+    'hpo': (hpo_module, hpo_module.hpo_prediction_check, "HP", "bench_1_hpo.txt"),
+    'do': (do_module, do_module.do_prediction_check, "DO", "bench_1_9606_do.txt"),
+}
+
+
+def handle_error(correct, errmsg, inrec, line_num, fileName):
+    """ The error message builder of the per-ontology loop, see legacy_cafa_checker """
+    if not correct:
+        line = "Error in %s, line %s, " % (fileName, line_num)
+        return False,  line + errmsg
+    else:
+        return True, "Nothing wrong here"
+
+
+def legacy_cafa_checker(infile, fileName, prediction_check, prediction_state):
+    """ The per-ontology loop as it was before cafa_record_engine, kept here as the reference """
+    m = go_module
+    visited_states = []
+    n_accuracy = 0
+    first_prediction = True
+    first_accuracy = True
+    first_keywords = True
+    n_models = 0
+    line_num = 0
+    for inline in infile:
+        try:
+            inline = inline.decode()
+        except AttributeError:
+            pass
+
+        line_num += 1
+        inrec = [i.strip() for i in inline.strip().split()]
+        field1 = inrec[0]
+
+        if field1 == "AUTHOR":
+            state = "author"
+        elif field1 == "MODEL":
+            state = "model"
+        elif field1 == "KEYWORDS":
+            state = "keywords"
+        elif field1 == "ACCURACY":
+            state = "accuracy"
+        elif field1 == "END":
+            state = "end"
+        else:
+            state = prediction_state
+
+        if state == "author":
+            correct, errmsg = m.author_check(inline)
+            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
+            if not correct:
+                return correct, errmsg
+            visited_states.append(state)
+        elif state == "model":
+            n_models += 1
+            n_accuracy = 0
+            if n_models > 3:
+                return False, "Too many models. Only up to 3 allowed"
+            correct, errmsg = m.model_check(inline)
+            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
+            if not correct:
+                return correct, errmsg
+            if n_models == 1:
+                visited_states.append(state)
+        elif state == "keywords":
+            if first_keywords:
+                visited_states.append(state)
+                first_keywords = False
+            correct, errmsg = m.keywords_check(inline)
+            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
+            if not correct:
+                return correct, errmsg
+        elif state == "accuracy":
+            if first_accuracy:
+                visited_states.append(state)
+                first_accuracy = False
+            n_accuracy += 1
+            correct, errmsg = m.accuracy_check(inline)
+            if not correct:
+                return correct, errmsg
+        elif state == prediction_state:
+            correct, errmsg = prediction_check(inline)
+            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
+            if not correct:
+                return correct, errmsg
+            if first_prediction:
+                visited_states.append(state)
+                first_prediction = False
+        elif state == "end":
+            correct, errmsg = m.end_check(inline)
+            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
+            if not correct:
+                return correct, errmsg
+            visited_states.append(state)
+    return True, "%s, passed" % fileName
+
+
+def write_submission(path, prefix, lines):
+    with open(path, "w") as write_handle:
+        write_handle.write("AUTHOR bench\nMODEL 1\nKEYWORDS sequence alignment.\n")
+        for i in range(lines):
+            write_handle.write("T9606%07d\t%s:%07d\t0.%02d\n" % (i // 50, prefix, i % 100000, i % 100))
+        write_handle.write("END\n")
+
+
+def time_checker(checker, path):
+    with open(path, "rb") as read_handle:
+        start = time.perf_counter()
+        is_valid, message = checker(read_handle)
+        elapsed = time.perf_counter() - start
+    assert is_valid, message
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=10000000, help="prediction lines per generated file")
+    parser.add_argument("--ontology", choices=sorted(ONTOLOGIES), action="append",
+                        help="ontology to benchmark, may be repeated (default: all)")
+    args = parser.parse_args()
+
+    slower = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for ontology in args.ontology or sorted(ONTOLOGIES):
+            module, prediction_check, prefix, filename = ONTOLOGIES[ontology]
+            path = os.path.join(tmp_dir, filename)
+            write_submission(path, prefix, args.lines)
+            state = module.RECORD_SPEC.prediction_state
+
+            legacy = time_checker(lambda handle: legacy_cafa_checker(handle, filename, prediction_check, state), path)
+            engine = time_checker(lambda handle: module.cafa_checker(handle, filename), path)
+            slower = slower or engine > legacy
+            print("{ontology:>4}: legacy {legacy:7.2f}s ({legacy_rate:,.0f} lines/s)  "
+                  "engine {engine:7.2f}s ({engine_rate:,.0f} lines/s)  speedup x{speedup:.2f}".format(
+                      ontology=ontology, legacy=legacy, engine=engine,
+                      legacy_rate=args.lines / legacy, engine_rate=args.lines / engine,
+                      speedup=legacy / engine))
+            os.remove(path)
+
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
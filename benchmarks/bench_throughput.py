@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Measures the throughput (lines/s, MB/s) and peak memory (RSS) of the cafa_checker of each
+ontology and of cafa4_file_validator on submissions generated by generate_submission, of
+--lines prediction lines each, and on a team zip of them.
+
+Each measure runs in a fresh process, so that its peak RSS is its own. The results are
+written as JSON, with the commit they were measured on; --compare prints the change of
+throughput from an earlier run.
+
+Run from the project's base directory:
+python benchmarks/bench_throughput.py --lines 10000000 -o results.json
+python benchmarks/bench_throughput.py --lines 10000000 --compare results.json
+'''
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from generate_submission import (TERM_PREFIXES, DEFAULT_TERMS_PER_TARGET, generate_submission, generate_team_zip,
+                                 targets_for)
+
+CHECKER_MODULES = {'go': "cafa_go_format_checker", 'hpo': "cafa_hpo_format_checker", 'do': "cafa_do_format_checker"}
+
+
+def _run_checker(ontology, path):
+    module = __import__(CHECKER_MODULES[ontology])
+    with open(path, "rb") as read_handle:
+        return module.cafa_checker(read_handle, os.path.basename(path))
+
+
+def _run_file_validator(path, workers):
+    from cafa4_format_checker import cafa4_file_validator
+    with contextlib.redirect_stdout(io.StringIO()):
+        return cafa4_file_validator(path, workers=workers), None
+
+
+def _measure(function, args, results):
+    """ Body of a measuring process: puts (seconds, peak RSS in bytes, verdict) in results """
+    start = time.perf_counter()
+    verdict = function(*args)
+    seconds = time.perf_counter() - start
+    # Kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    results.put((seconds, peak_rss, verdict))
+
+
+def measure(name, function, args, lines, size):
+    """ Result of function(*args) run in a fresh process, as a dict """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(function, args, results))
+    process.start()
+    seconds, peak_rss, (is_valid, message) = results.get()
+    process.join()
+    if not is_valid:
+        raise ValueError("{}: the generated submission is not valid: {}".format(name, message))
+    return {"name": name, "lines": lines, "bytes": size, "seconds": round(seconds, 4),
+            "lines_per_sec": round(lines / seconds), "mb_per_sec": round(size / seconds / 1e6, 2),
+            "peak_rss_mb": round(peak_rss / 1e6, 1)}
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def count_lines(path):
+    with open(path, "rb") as read_handle:
+        return sum(block.count(b"\n") for block in iter(lambda: read_handle.read(1 << 20), b""))
+
+
+def run_benchmarks(directory, lines, terms_per_target, ontologies, models, workers):
+    """ Yields the result of each benchmark, on submissions generated in directory """
+    targets = targets_for(lines, terms_per_target)
+    total_lines = total_size = 0
+    for ontology in ontologies:
+        path = generate_submission(directory, ontology, targets, terms_per_target)
+        file_lines, size = count_lines(path), os.path.getsize(path)
+        total_lines += file_lines * models
+        total_size += size * models
+        yield measure("%s cafa_checker" % ontology, _run_checker, (ontology, path), file_lines, size)
+        yield measure("%s cafa4_file_validator" % ontology, _run_file_validator, (path, workers), file_lines, size)
+        os.remove(path)
+
+    # Members of the same ontology differ only by their confidences, hence the same sizes
+    path = generate_team_zip(directory, targets, terms_per_target, ontologies, models)
+    yield measure("zip cafa4_file_validator", _run_file_validator, (path, workers), total_lines, total_size)
+    os.remove(path)
+
+
+def compare(results, previous):
+    """ Prints the change of throughput of each benchmark from the previous run """
+    before = {result["name"]: result for result in previous["results"]}
+    print("Compared with {}:".format(previous.get("commit")), file=sys.stderr)
+    for result in results:
+        old = before.get(result["name"])
+        if old is not None:
+            print("{name:>28}: {old:>12,} -> {new:>12,} lines/s  x{ratio:.2f}  "
+                  "peak RSS {old_rss} -> {new_rss} MB".format(
+                name=result["name"], old=old["lines_per_sec"], new=result["lines_per_sec"],
+                ratio=result["lines_per_sec"] / old["lines_per_sec"], old_rss=old["peak_rss_mb"],
+                new_rss=result["peak_rss_mb"]), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1000000, help="prediction lines per file (default: 10^6)")
+    parser.add_argument("--terms-per-target", type=int, default=DEFAULT_TERMS_PER_TARGET)
+    parser.add_argument("--ontology", choices=sorted(TERM_PREFIXES), action="append",
+                        help="ontology to benchmark, may be repeated (default: all)")
+    parser.add_argument("--models", type=int, default=1, choices=(1, 2, 3), help="models per ontology in the zip")
+    parser.add_argument("--workers", type=int, default=1, help="workers of cafa4_file_validator (default: 1)")
+    parser.add_argument("-o", "--output", default=None, help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", default=None, metavar="JSON", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for result in run_benchmarks(tmp_dir, args.lines, args.terms_per_target, args.ontology or ["go", "hpo", "do"],
+                                     args.models, args.workers):
+            print("{name:>28}: {seconds:8.2f}s {lines_per_sec:>12,} lines/s {mb_per_sec:8.2f} MB/s  "
+                  "peak RSS {peak_rss_mb} MB".format(**result), file=sys.stderr)
+            results.append(result)
+
+    report = {"commit": current_commit(), "python": platform.python_version(), "platform": platform.platform(),
+              "cpus": os.cpu_count(), "settings": {"lines": args.lines, "terms_per_target": args.terms_per_target,
+                                                   "models": args.models, "workers": args.workers},
+              "results": results}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as write_handle:
+            json.dump(report, write_handle, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as read_handle:
+            compare(results, json.load(read_handle))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
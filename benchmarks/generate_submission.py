@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Generates valid synthetic CAFA 4 submissions of any size, for benchmarks: a prediction
+file, or with --zip the archive of a team holding a file per ontology and model.
+
+Each file predicts --terms-per-target distinct terms for each of its targets, with random
+confidences, and has about --lines prediction lines (10^3 to 10^8 and more). The same
+--seed always gives the same files.
+
+Run from the project's base directory:
+python benchmarks/generate_submission.py --lines 1000000 --ontology go out/
+python benchmarks/generate_submission.py --lines 1000000 --zip --models 3 out/
+'''
+import argparse
+import os
+import random
+import sys
+import zipfile
+
+# ontology: term prefix
+TERM_PREFIXES = {'go': "GO", 'hpo': "HP", 'do': "DO"}
+DEFAULT_TAXONOMY = 9606
+DEFAULT_TERMS_PER_TARGET = 50
+# Distinct terms predictions are drawn from, about the size of GO
+TERM_POOL = 45000
+# Prediction lines generated and written at once
+CHUNK_LINES = 100000
+CONFIDENCES = ["%.2f" % (confidence / 100) for confidence in range(1, 101)]
+
+
+def submission_name(team, model, ontology, taxonomy=DEFAULT_TAXONOMY):
+    """ File name of a submission, HPO ones having the implied human taxonomy """
+    if ontology == 'hpo':
+        return "%s_%d_hpo.txt" % (team, model)
+    return "%s_%d_%d_%s.txt" % (team, model, taxonomy, ontology)
+
+
+def prediction_chunks(ontology, targets, terms_per_target=DEFAULT_TERMS_PER_TARGET, taxonomy=DEFAULT_TAXONOMY,
+                      seed=0, team="bench", model=1):
+    """ Yields the text of a submission in chunks, its predictions grouped by target """
+    rng = random.Random(seed)
+    prefix = TERM_PREFIXES[ontology]
+    yield "AUTHOR %s\nMODEL %d\nKEYWORDS sequence alignment, machine learning.\n" % (team, model)
+    target_taxonomy = DEFAULT_TAXONOMY if ontology == 'hpo' else taxonomy
+    lines = []
+    for target in range(targets):
+        line_start = "T%d%07d\t%s:" % (target_taxonomy, target, prefix)
+        first_term = rng.randrange(TERM_POOL)
+        confidences = rng.choices(CONFIDENCES, k=terms_per_target)
+        lines.extend("%s%07d\t%s\n" % (line_start, (first_term + term) % TERM_POOL, confidence)
+                     for term, confidence in enumerate(confidences))
+        if len(lines) >= CHUNK_LINES:
+            yield "".join(lines)
+            lines = []
+    lines.append("END\n")
+    yield "".join(lines)
+
+
+def targets_for(lines, terms_per_target=DEFAULT_TERMS_PER_TARGET):
+    """ Number of targets giving at least `lines` prediction lines """
+    return max(1, -(-lines // terms_per_target))
+
+
+def write_submission(handle, ontology, targets, terms_per_target=DEFAULT_TERMS_PER_TARGET,
+                     taxonomy=DEFAULT_TAXONOMY, seed=0, team="bench", model=1):
+    """ Writes a submission to the binary handle, returns its number of bytes """
+    size = 0
+    for chunk in prediction_chunks(ontology, targets, terms_per_target, taxonomy, seed, team, model):
+        data = chunk.encode()
+        handle.write(data)
+        size += len(data)
+    return size
+
+
+def generate_submission(directory, ontology, targets, terms_per_target=DEFAULT_TERMS_PER_TARGET,
+                        taxonomy=DEFAULT_TAXONOMY, seed=0, team="bench", model=1):
+    """ Writes a submission file to directory, returns its path """
+    path = os.path.join(directory, submission_name(team, model, ontology, taxonomy))
+    with open(path, "wb") as handle:
+        write_submission(handle, ontology, targets, terms_per_target, taxonomy, seed, team, model)
+    return path
+
+
+def generate_team_zip(directory, targets, terms_per_target=DEFAULT_TERMS_PER_TARGET, ontologies=("go", "hpo", "do"),
+                      models=1, taxonomy=DEFAULT_TAXONOMY, seed=0, team="bench"):
+    """ Writes the zip archive of a team to directory, with a submission per ontology and
+    model, streamed into the archive. Returns its path """
+    path = os.path.join(directory, "%s.zip" % team)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for model in range(1, models + 1):
+            for ontology in ontologies:
+                name = submission_name(team, model, ontology, taxonomy)
+                with archive.open(name, "w", force_zip64=True) as member:
+                    write_submission(member, ontology, targets, terms_per_target, taxonomy,
+                                     "%s-%d-%s" % (seed, model, ontology), team, model)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="directory to write the submission to")
+    parser.add_argument("--lines", type=int, default=1000000, help="prediction lines per file (default: 10^6)")
+    parser.add_argument("--terms-per-target", type=int, default=DEFAULT_TERMS_PER_TARGET,
+                        help="terms predicted for each target (default: %(default)s)")
+    parser.add_argument("--ontology", choices=sorted(TERM_PREFIXES), action="append",
+                        help="ontology of the files, may be repeated (default: go, or all with --zip)")
+    parser.add_argument("--models", type=int, default=1, choices=(1, 2, 3), help="models per ontology in a --zip")
+    parser.add_argument("--taxonomy", type=int, default=DEFAULT_TAXONOMY, help="taxonomy of the targets")
+    parser.add_argument("--team", default="bench", help="team name of the files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zip", action="store_true", help="write the zip archive of a team")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    targets = targets_for(args.lines, args.terms_per_target)
+    if args.zip:
+        print(generate_team_zip(args.directory, targets, args.terms_per_target,
+                                args.ontology or ("go", "hpo", "do"), args.models, args.taxonomy, args.seed,
+                                args.team))
+    else:
+        for ontology in args.ontology or ["go"]:
+            print(generate_submission(args.directory, ontology, targets, args.terms_per_target, args.taxonomy,
+                                      args.seed, args.team))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
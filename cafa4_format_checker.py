@@ -14,55 +14,460 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import zipfile
+import argparse
+import contextlib
+import functools
+import importlib
 import sys
 import os
-from cafa_hpo_format_checker import cafa_checker as hpo
-from cafa_go_format_checker import cafa_checker as go
-from cafa_do_format_checker import cafa_checker as do_checker
-from cafa_validation_utils import validate_filename, validate_archive_name
+from collections import namedtuple, deque
+from cafa_mmap_reader import MappedTextFile
+from cafa_pipelined_reader import PipelinedReader, compression_module, uncompressed_path
+from cafa_error_store import ErrorStore, error_limits, DEFAULT_MAX_ERRORS, DEFAULT_MAX_MESSAGES
+from cafa_target_counter import TargetTermCounter, DEFAULT_MAX_TERMS
+from cafa_validation_utils import (validate_filename, validate_archive_name, validate_tar_archive_name, team_name_of,
+                                   TAR_SUFFIXES)
 
 CAFA_VERSION = 4
 
+# Checker module of each ontology. They are imported when a file of their ontology is first
+# checked, and the columnar, sharded and ontology DAG modules (numpy) when they are used, as
+# are the archive, compression, index and cache modules, so that checking one small file
+# only loads what it needs
+VALIDATORS = {
+    'do': 'cafa_do_format_checker',
+    'go': 'cafa_go_format_checker',
+    'hpo': 'cafa_hpo_format_checker'
+}
 
+submission_result = namedtuple(
+    "submission_result",
+    ("filepath", "is_valid", "message")
+)
 
-def ontology_validator(ontology, read_handle, filepath):
-    """ A helper wrapper around the individual ontology checkers for go, do, hpo """
 
-    # Map ontology strings to validation functions:
-    VALIDATORS = {
-        'do': do_checker,
-        'go': go,
-        'hpo': hpo
-    }
+def ontology_validator(ontology, read_handle, filepath, columnar=False, workers=1, all_errors=None,
+                       duplicates_budget=None, term_indexes=None, target_index=None, taxonomy=None, max_terms=None,
+                       dags=None, verdicts=None, stored_hash=None):
+    """ A helper wrapper around the individual ontology checkers for go, do, hpo
 
-    validator = VALIDATORS.get(ontology)
+    With columnar=True the prediction block is validated in bulk by
+    cafa_columnar_checker, read_handle must then have a read() method returning bytes.
+    Otherwise, a large MappedTextFile is split into shards validated by up to `workers`
+    processes (None: one per CPU), see cafa_sharded_checker.
 
-    if validator is None:
+    With an error_limits as all_errors, the whole file is checked and the message reports
+    every error found, see cafa_error_store.
+
+    With a memory budget (in bytes) as duplicates_budget, repeated (target, term) pairs
+    are looked for too, see cafa_duplicate_detector. They are only looked for by the line
+    by line checker, so columnar and workers are then ignored.
+
+    term_indexes maps ontologies to the TermIndex their predicted terms must be in. With a
+    TargetIndex as target_index, the predicted targets must be targets of taxonomy, and the
+    message of a valid file gives the share of those that were predicted.
+
+    With max_terms set, targets with more than max_terms terms in a model are errors. Like
+    duplicates, they are only counted by the line by line checker. So are the predictions
+    scoring higher than an ancestor when dags maps the ontology to its OntologyDAG.
+
+    With a VerdictCache as verdicts, a file whose content was already checked with the same
+    options and index files, under any name, gets the stored verdict without being parsed,
+    see cafa_verdict_cache. When read_handle decompresses its content, stored_hash is a
+    function returning the hash of the compressed bytes, to key the verdict on instead.
+    """
+
+    checker_module = VALIDATORS.get(ontology)
+
+    if checker_module is None:
         return False, "Could not process ontology {}".format(ontology)
+    checker_module = importlib.import_module(checker_module)
+
+    errors = None if all_errors is None else ErrorStore(*all_errors)
+    terms = None if term_indexes is None else term_indexes.get(ontology)
+    targets = None if target_index is None or taxonomy is None else target_index.for_taxonomy(taxonomy)
 
-    is_valid, message = validator(read_handle, filepath)
+    dag = None if dags is None else dags.get(ontology)
+
+    verdict_key = None
+    settings = None
+    if verdicts is not None:
+        settings = verdict_settings(ontology, validate_filename(filepath).team_name, all_errors, duplicates_budget,
+                                    term_indexes, target_index, taxonomy, max_terms, dags)
+    if settings is not None:
+        verdict_key = verdicts.key(read_handle, settings, stored_hash)
+        verdict = verdicts.get(verdict_key, filepath)
+        if verdict is not None:
+            return verdict
+
+    is_valid, message = _check_ontology_file(checker_module.cafa_checker, checker_module.RECORD_SPEC, read_handle,
+                                             filepath, columnar, workers, errors, duplicates_budget, terms, targets,
+                                             max_terms, dag)
+    if verdict_key is not None:
+        verdicts.put(verdict_key, is_valid, message, filepath)
     return is_valid, message
 
 
-def cafa4_file_validator(filepath):
-    """ Validates the filenaming of CAFA submissions """
+def verdict_settings(ontology, team_name, all_errors=None, duplicates_budget=None, term_indexes=None,
+                     target_index=None, taxonomy=None, max_terms=None, dags=None):
+    """ Everything but its content that the verdict on a prediction file depends on, see
+    ontology_validator, or None when an index was not loaded from a file and has no digest.
+    team_name is the one in the file name, which the DO checker expects in the AUTHOR record.
+    """
+    indexes = [None if term_indexes is None else term_indexes.get(ontology),
+               None if taxonomy is None else target_index,
+               None if dags is None else dags.get(ontology)]
+    indexes = [index for index in indexes if index is not None]
+    if any(index.digest is None for index in indexes):
+        return None
+    return (CAFA_VERSION, ontology, team_name, taxonomy, all_errors, duplicates_budget is not None, max_terms,
+            [index.digest for index in indexes])
+
+
+def _check_ontology_file(validator, spec, read_handle, filepath, columnar, workers, errors, duplicates_budget,
+                         terms, targets, max_terms, dag):
+    if duplicates_budget is not None or max_terms is not None or dag is not None:
+        if duplicates_budget is None:
+            duplicates = None
+        else:
+            from cafa_duplicate_detector import DuplicateDetector
+            duplicates = DuplicateDetector(duplicates_budget)
+        term_counts = None if max_terms is None else TargetTermCounter(max_terms)
+        if dag is None:
+            propagation = None
+        else:
+            from cafa_ontology_dag import PropagationChecker
+            propagation = PropagationChecker(dag)
+        return validator(read_handle, filepath, errors, duplicates, terms, targets, term_counts, propagation)
+
+    if columnar:
+        from cafa_columnar_checker import columnar_cafa_checker
+        return columnar_cafa_checker(read_handle, filepath, spec, errors=errors, terms=terms, targets=targets)
+
+    if workers != 1 and isinstance(read_handle, MappedTextFile):
+        from cafa_sharded_checker import sharded_cafa_checker
+        return sharded_cafa_checker(read_handle, filepath, spec, workers, errors=errors, terms=terms,
+                                    targets=targets)
+
+    is_valid, message = validator(read_handle, filepath, errors, terms=terms, targets=targets)
+    return is_valid, message
+
+
+# Archive opened once per zip member worker process, see validate_zip_members
+_worker_archive = None
+
+
+def _open_worker_archive(filepath):
+    import zipfile
+    global _worker_archive
+    _worker_archive = zipfile.ZipFile(filepath)
+
+
+def _validate_zip_member(zip_reader, child_file, columnar, all_errors, duplicates_budget, term_indexes,
+                         target_index, max_terms, dags, verdicts):
+    from cafa_verdict_cache import hash_zip_member
+    # Members are inflated by a reader thread while they are parsed, see cafa_pipelined_reader
+    with zip_reader.open(child_file.filepath, 'r') as member, PipelinedReader(member) as file_contents:
+        return ontology_validator(child_file.ontology, file_contents, child_file.filename, columnar,
+                                  all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                  term_indexes=term_indexes, target_index=target_index,
+                                  taxonomy=child_file.taxonomy_id, max_terms=max_terms, dags=dags,
+                                  verdicts=verdicts,
+                                  stored_hash=functools.partial(hash_zip_member, zip_reader, child_file.filepath))
+
+
+def _validate_worker_zip_member(child_file, columnar, all_errors, duplicates_budget, term_indexes, target_index,
+                                max_terms, dags, verdicts):
+    return _validate_zip_member(_worker_archive, child_file, columnar, all_errors, duplicates_budget, term_indexes,
+                                target_index, max_terms, dags, verdicts)
+
+
+def validate_zip_members(filepath, child_files, columnar=False, workers=None, all_errors=None,
+                         duplicates_budget=None, term_indexes=None, target_index=None, max_terms=None, dags=None,
+                         verdicts=None):
+    """ Validates the prediction files of a zip archive, returns (is_valid, message) of the first
+    invalid member in archive order, or (True, None).
+    With all_errors, every member is validated and the messages of all invalid members are
+    returned, in archive order.
+
+    Members are validated in parallel by up to `workers` processes (default: one per CPU),
+    each with its own handle on the archive. With a single worker or member, the archive is
+    opened once and its members are validated in turn.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(child_files))
+
+    error_messages = []
+
+    if workers <= 1:
+        import zipfile
+        with zipfile.ZipFile(filepath) as zip_reader:
+            for child_file in child_files:
+                child_file_is_valid, child_file_message = _validate_zip_member(
+                    zip_reader, child_file, columnar, all_errors, duplicates_budget, term_indexes, target_index,
+                    max_terms, dags, verdicts)
+                if not child_file_is_valid:
+                    if all_errors is None:
+                        return child_file_is_valid, child_file_message
+                    error_messages.append(child_file_message)
+
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_archive,
+                                 initargs=(filepath,)) as pool:
+            futures = [pool.submit(_validate_worker_zip_member, child_file, columnar, all_errors,
+                                   duplicates_budget, term_indexes, target_index, max_terms, dags, verdicts)
+                       for child_file in child_files]
+            # Results are taken in member order so that the reported error does not depend on
+            # which worker finishes first
+            for future in futures:
+                child_file_is_valid, child_file_message = future.result()
+                if not child_file_is_valid:
+                    if all_errors is None:
+                        for pending in futures:
+                            pending.cancel()
+                        return child_file_is_valid, child_file_message
+                    error_messages.append(child_file_message)
+
+    if error_messages:
+        return False, "\n\n".join(error_messages)
+    return True, None
+
+
+# Tar archive opened once per tar member worker process, see validate_tar_members
+_worker_tar = None
+
+
+def _open_worker_tar(filepath):
+    import tarfile
+    global _worker_tar
+    _worker_tar = tarfile.open(filepath, "r:")
+
+
+def _validate_tar_member(tar_reader, member, child_file, columnar, all_errors, duplicates_budget, term_indexes,
+                         target_index, max_terms, dags, verdicts):
+    with tar_reader.extractfile(member) as contents, PipelinedReader(contents) as file_contents:
+        return ontology_validator(child_file.ontology, file_contents, child_file.filename, columnar,
+                                  all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                  term_indexes=term_indexes, target_index=target_index,
+                                  taxonomy=child_file.taxonomy_id, max_terms=max_terms, dags=dags,
+                                  verdicts=verdicts)
+
+
+def _validate_worker_tar_member(member, child_file, columnar, all_errors, duplicates_budget, term_indexes,
+                                target_index, max_terms, dags, verdicts):
+    return _validate_tar_member(_worker_tar, member, child_file, columnar, all_errors, duplicates_budget,
+                                term_indexes, target_index, max_terms, dags, verdicts)
+
+
+@contextlib.contextmanager
+def open_tar_archive(filepath):
+    """ Opens a tar archive, compressed or not, as (tar_reader, seekable). The members of a
+    seekable archive can be opened in any order, those of the others as they stream out
+    """
+    import tarfile
+    if filepath.endswith(".tar"):
+        with tarfile.open(filepath, "r:") as tar_reader:
+            yield tar_reader, True
+    elif filepath.endswith(".tar.zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise tarfile.ReadError("reading .tar.zst archives needs the zstandard package")
+        with open(filepath, "rb") as raw, zstandard.ZstdDecompressor().stream_reader(raw) as stream, \
+                tarfile.open(fileobj=stream, mode="r|") as tar_reader:
+            yield tar_reader, False
+    else:
+        with tarfile.open(filepath, "r|*") as tar_reader:
+            yield tar_reader, False
+
+
+def _tar_member_results(tar_reader, team_name, pool, window, checks, verdicts):
+    """ (is_valid, message) of the members of tar_reader in archive order, see validate_tar_members """
+    pending = deque()
+    team_names = set()
+    for member in tar_reader:
+        if not member.isfile() or 'DS_Store' in member.name or '__MACOSX' in member.name:
+            continue
+        child_file = validate_filename(member.name)
+
+        message = None
+        if member.name.endswith(".txt"):
+            team_names.add(team_name_of(child_file.filename))
+            if len(team_names) > 1:
+                message = "Only one team is allowed per tar archive"
+            elif team_name not in team_names:
+                message = 'Only one team is allowed per tar archive. "{}" and "{}" do not match.'.format(
+                    team_name, team_name_of(child_file.filename))
+        if message is None and not child_file.is_valid:
+            message = child_file.message
+
+        if message is not None:
+            pending.append((False, message))
+        elif pool is not None:
+            pending.append(pool.submit(_validate_worker_tar_member, member, child_file, *checks, verdicts))
+        else:
+            pending.append(_validate_tar_member(tar_reader, member, child_file, *checks, verdicts))
+
+        # Workers only get a few members ahead of the results
+        while len(pending) > window:
+            result = pending.popleft()
+            yield result if isinstance(result, tuple) else result.result()
+    while pending:
+        result = pending.popleft()
+        yield result if isinstance(result, tuple) else result.result()
+    # Like a zip archive without prediction files (see validate_one_team_per_archive)
+    if not team_names:
+        yield False, "Only one team is allowed per tar archive"
+
+
+def validate_tar_members(filepath, team_name, columnar=False, workers=None, all_errors=None,
+                         duplicates_budget=None, term_indexes=None, target_index=None, max_terms=None, dags=None,
+                         verdicts=None):
+    """ validate_zip_members for a tar archive (.tar, possibly compressed with gzip, bzip2, xz or zstd),
+    which is never extracted: members are validated as they are read.
+
+    A tar archive has no central directory, so the name of each member is checked (see
+    validate_archive_name) when it is reached, and errors are reported in archive order.
+    Members of an uncompressed .tar are validated by up to `workers` processes (default: one
+    per CPU), which read them from their own handle on the archive. Compressed archives can
+    only be read in order, their members are validated in turn and their verdicts are not
+    cached, since computing their content hash would need a second read.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    checks = (columnar, all_errors, duplicates_budget, term_indexes, target_index, max_terms, dags)
+
+    error_messages = []
+    with open_tar_archive(filepath) as (tar_reader, seekable):
+        with contextlib.ExitStack() as stack:
+            pool = None
+            if seekable and workers > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_tar,
+                                                               initargs=(filepath,)))
+            results = _tar_member_results(tar_reader, team_name, pool, 2 * workers if pool else 0, checks,
+                                          verdicts if seekable else None)
+            for child_file_is_valid, child_file_message in results:
+                if not child_file_is_valid:
+                    if all_errors is None:
+                        if pool is not None:
+                            pool.shutdown(cancel_futures=True)
+                        return child_file_is_valid, child_file_message
+                    error_messages.append(child_file_message)
+
+    if error_messages:
+        return False, "\n\n".join(error_messages)
+    return True, None
+
+
+def validate_changed_zip_members(filepath, team_name, child_files, verdicts, columnar=False, workers=None,
+                                 all_errors=None, duplicates_budget=None, term_indexes=None, target_index=None,
+                                 max_terms=None, dags=None):
+    """ validate_zip_members, for the members that changed since the last valid archive of team_name
+
+    A member is unchanged when its name, CRC32 and size in the central directory, and the
+    settings it is checked with (see verdict_settings), are those of a member of that archive:
+    it is then valid, and its data is not read. When all members are valid, the archive
+    becomes the last valid one of the team in verdicts, a VerdictCache.
+    """
+    import zipfile
+    with zipfile.ZipFile(filepath) as zip_reader:
+        members = {}
+        for child_file in child_files:
+            info = zip_reader.getinfo(child_file.filepath)
+            settings = verdict_settings(child_file.ontology, child_file.team_name, all_errors, duplicates_budget,
+                                        term_indexes, target_index, child_file.taxonomy_id, max_terms, dags)
+            if settings is not None:
+                members[child_file.filepath] = [info.CRC, info.file_size, verdicts.settings_digest(settings)]
+
+    accepted = verdicts.accepted_members(team_name)
+    changed_files = [child_file for child_file in child_files
+                     if child_file.filepath not in members or
+                     accepted.get(child_file.filepath) != members[child_file.filepath]]
+
+    is_valid, message = True, None
+    if changed_files:
+        is_valid, message = validate_zip_members(filepath, changed_files, columnar, workers, all_errors,
+                                                 duplicates_budget, term_indexes, target_index, max_terms, dags,
+                                                 verdicts)
+    if is_valid:
+        verdicts.accept_archive(team_name, members)
+    return is_valid, message
+
+
+def validate_submission(filepath, columnar=False, workers=None, all_errors=None, duplicates_budget=None,
+                        term_indexes=None, target_index=None, max_terms=None, dags=None, verdicts=None,
+                        incremental=False):
+    """ Validates the filenaming and contents of a CAFA submission (txt file, possibly compressed
+    with gzip, bzip2 or xz, or zip or tar archive)
+    and returns a submission_result instead of printing it.
+    all_errors is an error_limits to report every error instead of the first one,
+    duplicates_budget the memory budget of the duplicate prediction check (None to skip it),
+    term_indexes a dict of ontology -> TermIndex of the existing terms, target_index the
+    TargetIndex of the released targets, max_terms the cap on the terms per target and
+    model (None to skip it), dags a dict of ontology -> OntologyDAG to check that no term
+    scores higher than its ancestors, verdicts a VerdictCache of the verdicts on files
+    already checked. With incremental=True and verdicts, only the zip members that changed
+    since the last valid archive of the team are validated
+    """
     is_valid = True
     filepath_short = filepath.split("/")[-1]
     message = "VALIDATION SUCCESSFUL\n{filepath} meets CAFA4 file naming specifications".format(filepath=filepath_short)
-    error_preamble = "\nVALIDATION FAILED"
 
-    if filepath.endswith(".txt"):
+    compression = compression_module(filepath)
+
+    if filepath.endswith(TAR_SUFFIXES):
+        validation_result = validate_tar_archive_name(filepath)
+        if validation_result.is_valid is False:
+            message = validation_result.message
+            is_valid = False
+        else:
+            import tarfile
+            try:
+                child_files_are_valid, child_file_message = validate_tar_members(
+                    filepath, validation_result.team_name, columnar, workers, all_errors, duplicates_budget,
+                    term_indexes, target_index, max_terms, dags, verdicts)
+            except tarfile.TarError as e:
+                child_files_are_valid, child_file_message = False, "Could not read {filepath}: {error}".format(
+                    filepath=filepath_short, error=e)
+
+            if not child_files_are_valid:
+                is_valid = False
+                message = child_file_message
+
+    elif compression is not None:
+        # A gzip, bzip2 or xz compressed txt file, named and checked after its content
+        inner_path = uncompressed_path(filepath)
+        parsed = validate_filename(inner_path)
+
+        if not parsed.is_valid:
+            message = parsed.message
+            is_valid = False
+        else:
+            from cafa_verdict_cache import hash_stored_file
+            with compression.open(filepath, "rb") as compressed, PipelinedReader(compressed) as read_handle:
+                is_valid, message = ontology_validator(parsed.ontology, read_handle, inner_path, columnar,
+                                                       all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                                       term_indexes=term_indexes, target_index=target_index,
+                                                       taxonomy=parsed.taxonomy_id, max_terms=max_terms, dags=dags,
+                                                       verdicts=verdicts,
+                                                       stored_hash=functools.partial(hash_stored_file, filepath))
+
+    elif filepath.endswith(".txt"):
         parsed = validate_filename(filepath)
 
         if not parsed.is_valid:
             message = parsed.message
             is_valid = False
         else:
-            with open(filepath, "r") as read_handle:
-                is_valid, message = ontology_validator(parsed.ontology, read_handle, filepath)
+            with MappedTextFile(filepath) as read_handle:
+                is_valid, message = ontology_validator(parsed.ontology, read_handle, filepath, columnar, workers,
+                                                       all_errors, duplicates_budget, term_indexes, target_index,
+                                                       parsed.taxonomy_id, max_terms, dags, verdicts)
 
-    elif zipfile.is_zipfile(filepath):
+    elif _is_zipfile(filepath):
         # Check that the zipfile contains the team name and that team name is
         # consistent with the individual files within the zip:
         validation_result = validate_archive_name(filepath)
@@ -72,34 +477,215 @@ def cafa4_file_validator(filepath):
 
         else:
             # we need to validate the contained txt files:
+            if incremental and verdicts is not None:
+                child_files_are_valid, child_file_message = validate_changed_zip_members(
+                    filepath, validation_result.team_name, validation_result.files, verdicts, columnar, workers,
+                    all_errors, duplicates_budget, term_indexes, target_index, max_terms, dags)
+            else:
+                child_files_are_valid, child_file_message = validate_zip_members(
+                    filepath, validation_result.files, columnar, workers, all_errors, duplicates_budget,
+                    term_indexes, target_index, max_terms, dags, verdicts)
 
-            for child_file in validation_result.files:
-                zip_reader = zipfile.ZipFile(filepath)
-                file_contents = zip_reader.open(child_file.filepath, 'r')
-                child_file_is_valid, child_file_message = ontology_validator(child_file.ontology, file_contents, child_file.filename)
-
-                if not child_file_is_valid:
-                    is_valid = False
-                    message = child_file_message
-                    break
+            if not child_files_are_valid:
+                is_valid = False
+                message = child_file_message
 
     else:
         is_valid = False
         message = "Could not parse {filepath}".format(filepath=filepath_short)
 
-    if not is_valid:
-        print(error_preamble)
+    return submission_result(filepath, is_valid, message)
+
+
+def _is_zipfile(filepath):
+    import zipfile
+    return zipfile.is_zipfile(filepath)
+
 
-    print(message)
-    return is_valid
+def cafa4_file_validator(filepath, columnar=False, workers=None, all_errors=None, duplicates_budget=None,
+                         term_indexes=None, target_index=None, max_terms=None, dags=None, verdicts=None,
+                         incremental=False):
+    """ Validates the filenaming of CAFA submissions """
+    result = validate_submission(filepath, columnar, workers, all_errors, duplicates_budget, term_indexes,
+                                 target_index, max_terms, dags, verdicts, incremental)
+
+    if not result.is_valid:
+        print("\nVALIDATION FAILED")
+
+    print(result.message)
+    return result.is_valid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checks the format of CAFA 4 prediction files")
+    parser.add_argument("paths", nargs="*", metavar="filepath",
+                        help="path to input file or zipped archive; with --batch, any number of "
+                             "files, directories or glob patterns")
+    parser.add_argument("--columnar", action="store_true",
+                        help="validate the prediction block in bulk with numpy (falls back to the "
+                             "line by line checker when numpy is not installed)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes validating the members of a zip archive, or the shards of a "
+                             "large text file (default: one per CPU)")
+    parser.add_argument("--all-errors", action="store_true",
+                        help="check whole files and report every error instead of stopping at the first one")
+    parser.add_argument("--max-errors", type=int, default=DEFAULT_MAX_ERRORS,
+                        help="with --all-errors, errors kept per file (the others are only counted)")
+    parser.add_argument("--error-messages", type=int, default=DEFAULT_MAX_MESSAGES,
+                        help="with --all-errors, errors printed in full per file")
+    parser.add_argument("--check-duplicates", action="store_true",
+                        help="report (target, term) pairs predicted more than once in a model "
+                             "(uses the line by line checker)")
+    parser.add_argument("--duplicates-memory", type=int, default=None,
+                        help="memory budget of the duplicate check in MB, beyond which it spills to "
+                             "temporary files (default: 256)")
+    parser.add_argument("--max-terms-per-target", type=int, default=None, metavar="N",
+                        help="report targets with more than N terms in a model (CAFA allows %s; uses the "
+                             "line by line checker)" % DEFAULT_MAX_TERMS)
+    for ontology in sorted(VALIDATORS):
+        parser.add_argument("--%s-obo" % ontology, metavar="OBO_FILE",
+                            help="check that the predicted %s terms are in this ontology file" % ontology.upper())
+    parser.add_argument("--check-propagation", action="store_true",
+                        help="report terms scoring higher than one of their predicted ancestors, in the "
+                             "ontologies given with --go-obo, --hpo-obo or --do-obo (uses the line by line "
+                             "checker)")
+    parser.add_argument("--propagate", metavar="DIR", default=None,
+                        help="after a successful validation, write to DIR a copy of the prediction files "
+                             "in which every ancestor of a predicted term has the highest score of its "
+                             "predicted descendants (needs the ontology files)")
+    parser.add_argument("--targets", metavar="FASTA_FILE", action="append", default=[],
+                        help="check that the predicted targets are in these target files, and of the "
+                             "taxonomy of the prediction file (may be repeated)")
+    parser.add_argument("--term-cache", metavar="DIR", default=None,
+                        help="directory of the term and target indexes built from the OBO and FASTA files "
+                             "(default: ~/.cache/cafa_format_checker)")
+    parser.add_argument("--verdict-cache", action="store_true",
+                        help="remember the verdict on every file checked, in a database in the --term-cache "
+                             "directory, and reuse it for files checked again unchanged")
+    parser.add_argument("--verdict-cache-size", type=int, default=None, metavar="MB",
+                        help="size of the verdict cache, beyond which the least recently used verdicts are "
+                             "evicted (default: 64)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only validate the zip members that changed (by name, CRC32 and size) since the "
+                             "last valid archive of the team; implies --verdict-cache")
+    parser.add_argument("--serve", metavar="SOCKET", default=None,
+                        help="run as a daemon validating the submissions sent to this Unix socket by "
+                             "cafa_client.py, with the indexes loaded once")
+    parser.add_argument("--http", metavar="PORT", type=int, default=None,
+                        help="run as a local HTTP service validating the prediction files POSTed to "
+                             "/validate/<file name> as they are uploaded, see cafa_http_service")
+    batch = parser.add_argument_group("batch mode", "validate many submissions in one run, writing "
+                                                    "one JSON result per line as each one finishes")
+    batch.add_argument("--batch", action="store_true", help="validate every submission named by the paths")
+    batch.add_argument("--manifest", action="append", default=[],
+                       help="file listing one submission path per line (implies --batch, may be repeated)")
+    batch.add_argument("-j", "--jobs", type=int, default=None,
+                       help="processes validating submissions (default: one per CPU)")
+    batch.add_argument("-o", "--output", default=None, help="file to write the results to (default: stdout)")
+    args = parser.parse_args(argv)
+    all_errors = error_limits(args.max_errors, args.error_messages) if args.all_errors else None
+    duplicates_budget = None
+    if args.check_duplicates:
+        from cafa_duplicate_detector import DEFAULT_MEMORY_BUDGET
+        duplicates_budget = DEFAULT_MEMORY_BUDGET
+        if args.duplicates_memory is not None:
+            duplicates_budget = args.duplicates_memory * 1024 * 1024
+    term_indexes = {}
+    obo_paths = {ontology: getattr(args, "%s_obo" % ontology) for ontology in VALIDATORS}
+    obo_paths = {ontology: obo_path for ontology, obo_path in obo_paths.items() if obo_path is not None}
+    if obo_paths:
+        from cafa_term_index import load_term_index, TERM_PREFIXES
+        for ontology, obo_path in obo_paths.items():
+            term_indexes[ontology] = load_term_index(obo_path, TERM_PREFIXES[ontology], args.term_cache)
+    ontology_dags = {}
+    if args.check_propagation or args.propagate:
+        if not term_indexes:
+            parser.error("--check-propagation and --propagate need the ontology files, see --go-obo, "
+                         "--hpo-obo and --do-obo")
+        if args.propagate and (args.batch or args.manifest):
+            parser.error("--propagate validates a single submission, not a --batch")
+        from cafa_ontology_dag import load_ontology_dag
+        from cafa_term_index import TERM_PREFIXES
+        ontology_dags = {ontology: load_ontology_dag(getattr(args, "%s_obo" % ontology),
+                                                     TERM_PREFIXES[ontology], args.term_cache)
+                         for ontology in term_indexes}
+    dags = ontology_dags if args.check_propagation else None
+    target_index = None
+    if args.targets:
+        from cafa_target_index import load_target_index
+        target_index = load_target_index(args.targets, args.term_cache)
+    verdicts = None
+    if args.verdict_cache or args.incremental:
+        from cafa_term_index import DEFAULT_CACHE_DIR
+        from cafa_verdict_cache import VerdictCache, DEFAULT_CACHE_NAME, DEFAULT_MAX_BYTES
+        max_bytes = DEFAULT_MAX_BYTES
+        if args.verdict_cache_size is not None:
+            max_bytes = args.verdict_cache_size * 1024 * 1024
+        verdicts = VerdictCache(os.path.join(args.term_cache or DEFAULT_CACHE_DIR, DEFAULT_CACHE_NAME), max_bytes)
+
+    if args.http is not None:
+        if args.serve or args.batch or args.manifest or args.propagate:
+            parser.error("--http cannot be used with --serve, --batch or --propagate")
+        # Imported here, the service imports this module
+        from cafa_http_service import serve_http
+
+        # Uploads cannot be read twice, so their verdicts are not cached
+        serve_http(args.http, workers=args.workers, columnar=args.columnar, all_errors=all_errors,
+                   duplicates_budget=duplicates_budget, term_indexes=term_indexes, target_index=target_index,
+                   max_terms=args.max_terms_per_target, dags=dags)
+        return 0
+
+    if args.serve:
+        if args.batch or args.manifest or args.propagate:
+            parser.error("--serve cannot be used with --batch or --propagate")
+        # Imported here, the daemon imports this module through the batch module
+        from cafa_daemon import serve
+
+        serve(args.serve, columnar=args.columnar, all_errors=all_errors, duplicates_budget=duplicates_budget,
+              term_indexes=term_indexes, target_index=target_index, max_terms=args.max_terms_per_target,
+              dags=dags, verdicts=verdicts, incremental=args.incremental)
+        return 0
+
+    if args.batch or args.manifest:
+        # Imported here, the batch module imports this one
+        from cafa_batch_validator import collect_submissions, run_batch
+
+        filepaths = collect_submissions(args.paths, args.manifest)
+        if args.output is None:
+            n_invalid = run_batch(filepaths, sys.stdout, columnar=args.columnar, jobs=args.jobs,
+                                  all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                  term_indexes=term_indexes, target_index=target_index,
+                                  max_terms=args.max_terms_per_target, dags=dags, verdicts=verdicts,
+                                  incremental=args.incremental)
+        else:
+            with open(args.output, "w") as output:
+                n_invalid = run_batch(filepaths, output, columnar=args.columnar, jobs=args.jobs,
+                                      all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                      term_indexes=term_indexes, target_index=target_index,
+                                      max_terms=args.max_terms_per_target, dags=dags, verdicts=verdicts,
+                                      incremental=args.incremental)
+        print("{n_invalid} of {n_files} submissions failed validation".format(
+            n_invalid=n_invalid, n_files=len(filepaths)), file=sys.stderr)
+        return 0 if n_invalid == 0 else 1
 
+    if len(args.paths) != 1:
+        parser.error("expected one filepath (use --batch to validate several)")
 
-def usage():
-    print("Usage: cafa4_format_check.py <path to input file or zipped archive>")
+    is_valid = cafa4_file_validator(args.paths[0], columnar=args.columnar, workers=args.workers,
+                                    all_errors=all_errors, duplicates_budget=duplicates_budget,
+                                    term_indexes=term_indexes, target_index=target_index,
+                                    max_terms=args.max_terms_per_target, dags=dags, verdicts=verdicts,
+                                    incremental=args.incremental)
+    if is_valid and args.propagate:
+        from cafa_propagator import propagate_submission
+        try:
+            for output_path in propagate_submission(args.paths[0], args.propagate, ontology_dags, args.workers):
+                print("Propagated predictions written to %s" % output_path)
+        except ValueError as e:
+            print(e)
+            return 1
+    return 0 if is_valid else 1
 
 
 if __name__ == "__main__":
-    try:
-        cafa4_file_validator(sys.argv[1])
-    except IndexError:
-        usage()
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import contextlib
+import io
+import os
+import zipfile
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from cafa4_format_checker import validate_submission, submission_result, ontology_validator, _validate_zip_member
+from cafa_mmap_reader import MappedTextFile
+from cafa_pipelined_reader import compression_module
+from cafa_validation_utils import validate_archive_name, validate_filename, TAR_SUFFIXES
+
+'''
+Asynchronous counterparts of cafa4_file_validator, validate_submission and the per-ontology
+cafa_checker functions, for applications running an asyncio event loop.
+
+An AsyncValidator runs the parsing in a pool of worker processes shared by all the requests
+made through it, so the event loop is never blocked. Each request has at most per_request
+tasks in the pool at once (a zip archive has one per member), leaving room for the others:
+a small file does not wait behind every member of a large archive. events() yields the
+progress of a request, and cancelling a request cancels its tasks that have not started
+(a member that is being checked runs to its end in its worker, and its result is dropped).
+'''
+
+# kind is "started", "member" (a zip member was checked, in archive order) or "finished"
+validation_event = namedtuple("validation_event", ("kind", "filepath", "member", "is_valid", "message"))
+
+
+def _archive_members(filepath):
+    # validate_archive_name prints its progress, which only makes sense on a terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        return validate_archive_name(filepath)
+
+
+# Zip archives kept open by a worker process, the most recently used last: the pool is
+# shared by all the requests, so a worker checks the members of several archives in turn
+WORKER_ARCHIVES = 4
+_worker_archives = OrderedDict()
+
+
+def _worker_zip_archive(filepath):
+    """ The ZipFile of filepath in this worker process, opened again only when the file changed """
+    stat = os.stat(filepath)
+    identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    opened = _worker_archives.pop(filepath, None)
+    if opened is not None and opened[0] != identity:
+        opened[1].close()
+        opened = None
+    if opened is None:
+        opened = (identity, zipfile.ZipFile(filepath))
+    _worker_archives[filepath] = opened
+    while len(_worker_archives) > WORKER_ARCHIVES:
+        _worker_archives.popitem(last=False)[1][1].close()
+    return opened[1]
+
+
+def _validate_zip_member_task(filepath, child_file, checks):
+    return _validate_zip_member(_worker_zip_archive(filepath), child_file, *checks)
+
+
+def _validate_submission_task(filepath, checks):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return validate_submission(filepath, checks[0], 1, *checks[1:])
+
+
+def _check_file_task(ontology, filepath, taxonomy, checks):
+    columnar, all_errors, duplicates_budget, term_indexes, target_index, max_terms, dags, verdicts = checks
+    with MappedTextFile(filepath) as read_handle:
+        return ontology_validator(ontology, read_handle, filepath, columnar, 1, all_errors, duplicates_budget,
+                                  term_indexes, target_index, taxonomy, max_terms, dags, verdicts)
+
+
+class AsyncValidator(object):
+    """
+    Validates submissions in up to `workers` processes (default: one per CPU), with at most
+    per_request tasks of a request in the pool at once (default: all the workers but one).
+    The other arguments are the checks of validate_submission. Use it as an async context
+    manager, or close() it, to stop the workers.
+    """
+
+    def __init__(self, workers=None, per_request=None, columnar=False, all_errors=None, duplicates_budget=None,
+                 term_indexes=None, target_index=None, max_terms=None, dags=None, verdicts=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.per_request = per_request or max(1, self.workers - 1)
+        # In the order of the arguments of _validate_zip_member
+        self.checks = (columnar, all_errors, duplicates_budget, term_indexes, target_index, max_terms, dags,
+                       verdicts)
+        self._pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def _run(self, slots, function, *args):
+        """ Result of function(*args) in the pool, once the request has one of its slots free """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        async with slots:
+            # Cancelling the awaiting task cancels the pool task too, if it has not started
+            return await asyncio.wrap_future(self._pool.submit(function, *args))
+
+    async def events(self, filepath):
+        """ Yields the validation_events of the validation of a submission, the last one being
+        "finished" with its verdict """
+        yield validation_event("started", filepath, None, None, None)
+        slots = asyncio.Semaphore(self.per_request)
+        all_errors = self.checks[1]
+
+        # Only zip archives are split in tasks, the other submissions are a task each
+        is_zip = (not filepath.endswith(TAR_SUFFIXES + (".txt",)) and compression_module(filepath) is None
+                  and zipfile.is_zipfile(filepath))
+        if not is_zip:
+            result = await self._run(slots, _validate_submission_task, filepath, self.checks)
+            yield validation_event("finished", filepath, None, result.is_valid, result.message)
+            return
+
+        archive = await self._run(slots, _archive_members, filepath)
+        if not archive.is_valid:
+            yield validation_event("finished", filepath, None, False, archive.message)
+            return
+
+        tasks = [asyncio.ensure_future(self._run(slots, _validate_zip_member_task, filepath, child_file, self.checks))
+                 for child_file in archive.files]
+        error_messages = []
+        try:
+            # Results are taken in member order, as by validate_zip_members
+            for child_file, task in zip(archive.files, tasks):
+                is_valid, message = await task
+                yield validation_event("member", filepath, child_file.filename, is_valid, message)
+                if not is_valid:
+                    error_messages.append(message)
+                    if all_errors is None:
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if error_messages:
+            yield validation_event("finished", filepath, None, False, "\n\n".join(error_messages))
+        else:
+            yield validation_event("finished", filepath, None, True, "VALIDATION SUCCESSFUL\n{} meets CAFA4 file "
+                                   "naming specifications".format(filepath.split("/")[-1]))
+
+    async def validate_submission(self, filepath):
+        """ Counterpart of validate_submission, returns a submission_result """
+        async for event in self.events(filepath):
+            if event.kind == "finished":
+                return submission_result(filepath, event.is_valid, event.message)
+
+    async def cafa4_file_validator(self, filepath):
+        """ Counterpart of cafa4_file_validator: prints the verdict, returns whether the submission is valid """
+        result = await self.validate_submission(filepath)
+        if not result.is_valid:
+            print("\nVALIDATION FAILED")
+        print(result.message)
+        return result.is_valid
+
+    async def cafa_checker(self, ontology, filepath, taxonomy=None):
+        """ Counterpart of the cafa_checker of an ontology ("go", "hpo" or "do"), for the text file
+        at filepath: returns (is_valid, message) on its content. With a target_index, the targets
+        must be of taxonomy, by default the one in the name of the file """
+        if taxonomy is None:
+            parsed = validate_filename(filepath)
+            taxonomy = parsed.taxonomy_id if parsed.is_valid else None
+        return await self._run(asyncio.Semaphore(self.per_request), _check_file_task, ontology, filepath, taxonomy,
+                               self.checks)
@@ -0,0 +1,116 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import glob
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cafa4_format_checker import validate_submission, submission_result
+from cafa_pipelined_reader import COMPRESSION_SUFFIXES
+from cafa_validation_utils import TAR_SUFFIXES
+
+'''
+Batch validation of many submissions in one run.
+
+Submissions are gathered from directories, glob patterns and manifests (text files listing
+one path per line) and validated by a pool of worker processes, which pay for the
+interpreter start-up and the imports once. Results are reported as they finish, one JSON
+object per line.
+'''
+
+SUBMISSION_EXTENSIONS = (".txt", ".zip") + tuple(".txt" + suffix for suffix in COMPRESSION_SUFFIXES) + TAR_SUFFIXES
+
+
+def collect_submissions(sources=(), manifests=()):
+    """
+    Paths of the submissions named by sources, in order and without duplicates.
+    A source is a directory (its .txt, compressed .txt, .zip and tar files), a glob pattern or a file path.
+    Every non-empty line of a manifest, other than # comments, is a source.
+    """
+    sources = list(sources)
+    for manifest in manifests:
+        with open(manifest) as manifest_handle:
+            for line in manifest_handle:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    sources.append(line)
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.endswith(SUBMISSION_EXTENSIONS) and os.path.isfile(os.path.join(source, name))))
+        elif glob.has_magic(source):
+            paths.extend(sorted(path for path in glob.glob(source) if os.path.isfile(path)))
+        else:
+            paths.append(source)
+
+    seen = set()
+    return [path for path in paths if not (path in seen or seen.add(path))]
+
+
+def _validate_quietly(filepath, columnar, all_errors, duplicates_budget, term_indexes, target_index, max_terms,
+                      dags, verdicts, incremental):
+    """ validate_submission in a batch worker: one process per submission, no nested pool """
+    # validate_archive_name prints its progress, which would be mixed up with the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return validate_submission(filepath, columnar=columnar, workers=1, all_errors=all_errors,
+                                       duplicates_budget=duplicates_budget, term_indexes=term_indexes,
+                                       target_index=target_index, max_terms=max_terms, dags=dags,
+                                       verdicts=verdicts, incremental=incremental)
+        except (OSError, UnicodeDecodeError) as e:
+            return submission_result(filepath, False, "Could not read {filepath}: {error}".format(
+                filepath=filepath, error=e))
+
+
+def validate_batch(filepaths, columnar=False, jobs=None, all_errors=None, duplicates_budget=None,
+                   term_indexes=None, target_index=None, max_terms=None, dags=None, verdicts=None,
+                   incremental=False):
+    """
+    Validates every submission of filepaths across jobs processes (default: one per CPU).
+    Yields a submission_result per file, in the order they finish.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(filepaths))
+
+    if jobs <= 1:
+        for filepath in filepaths:
+            yield _validate_quietly(filepath, columnar, all_errors, duplicates_budget, term_indexes, target_index,
+                                    max_terms, dags, verdicts, incremental)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_validate_quietly, filepath, columnar, all_errors, duplicates_budget,
+                               term_indexes, target_index, max_terms, dags, verdicts, incremental)
+                   for filepath in filepaths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_batch(filepaths, output, columnar=False, jobs=None, all_errors=None, duplicates_budget=None,
+              term_indexes=None, target_index=None, max_terms=None, dags=None, verdicts=None, incremental=False):
+    """
+    Writes the result of every submission to output as a line of JSON, flushed as soon as
+    it is known, and returns the number of invalid submissions.
+    """
+    n_invalid = 0
+    for result in validate_batch(filepaths, columnar, jobs, all_errors, duplicates_budget, term_indexes,
+                                 target_index, max_terms, dags, verdicts, incremental):
+        n_invalid += not result.is_valid
+        output.write(json.dumps(result._asdict()) + "\n")
+        output.flush()
+    return n_invalid
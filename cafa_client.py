@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import argparse
+import json
+import os
+import socket
+import sys
+
+'''
+Client of the validation daemon (see cafa_daemon): sends paths to the daemon and prints its
+verdicts like cafa4_format_checker.py. It only imports the standard modules it needs, so it
+starts in a few milliseconds.
+'''
+
+
+def request_verdicts(socket_path, filepaths):
+    """ Yields the submission_result of each file, as a dict, from the daemon at socket_path """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        request = {"paths": [os.path.abspath(filepath) for filepath in filepaths]}
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as replies:
+            for _ in filepaths:
+                reply = replies.readline()
+                if not reply:
+                    raise ConnectionError("the validation daemon closed the connection")
+                result = json.loads(reply)
+                if "error" in result:
+                    raise ValueError(result["error"])
+                yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checks CAFA 4 prediction files with a running validation daemon "
+                                                 "(cafa4_format_checker.py --serve SOCKET)")
+    parser.add_argument("socket", help="socket of the daemon")
+    parser.add_argument("paths", nargs="+", metavar="filepath", help="path to input file or zipped archive")
+    args = parser.parse_args(argv)
+
+    all_valid = True
+    for result in request_verdicts(args.socket, args.paths):
+        if not result["is_valid"]:
+            all_valid = False
+            print("\nVALIDATION FAILED")
+        print(result["message"])
+    return 0 if all_valid else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
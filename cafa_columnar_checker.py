@@ -0,0 +1,339 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from collections import namedtuple
+from cafa_record_engine import RecordStateMachine, check_records
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, without it columnar_cafa_checker falls back to check_records
+    np = None
+
+'''
+Columnar bulk validation of the prediction block of GO, HPO and DO files.
+
+The file is read in large chunks of whole lines. Within a chunk, every prediction line is
+checked at once with numpy against the same rules as the prediction fast path in
+cafa_record_engine (target, term, confidence of at most 1.00). Only the lines that fail,
+which includes the AUTHOR/MODEL/KEYWORDS/ACCURACY/END records, go through the per-line
+checks one by one, in file order, so the verdict and the line number of the first error
+are those of cafa_checker.
+
+Lines are split on b"\\n" only, as they are for zip members.
+'''
+
+# Chunks are kept small enough for their per-byte arrays to stay in cache
+DEFAULT_CHUNK_SIZE = 512 * 1024
+
+columnar_syntax = namedtuple(
+    "columnar_syntax",
+    ("target_prefixes", "term_prefix")
+)
+
+# Same formats as the prediction_patterns of each ontology module
+COLUMNAR_SYNTAX = {
+    "GO": columnar_syntax(target_prefixes=(b"M", b"T", b"EFI"), term_prefix=b"GO:"),
+    "HPO": columnar_syntax(target_prefixes=(b"T",), term_prefix=b"HP:"),
+    "DO": columnar_syntax(target_prefixes=(b"M", b"T", b"EFI"), term_prefix=b"DO:"),
+}
+
+TARGET_DIGITS = (5, 20)
+TERM_DIGITS = (5, 7)
+
+prediction_chunk = namedtuple(
+    "prediction_chunk",
+    (
+        # Number of lines in the chunk
+        "n_lines",
+        # bool per line, True for a valid prediction record in the canonical layout (see
+        # parse_prediction_chunk). Valid records in any other layout are False here.
+        "valid",
+        # Byte offset of the start of each line, and of its terminating newline
+        "line_starts",
+        "line_ends",
+        # One entry per True in valid: digits of the target ID as uint64 (IDs of 20 digits
+        # wrap around), digits of the term ID as uint32, confidence in hundredths as uint8.
+        # None unless requested with columns=True
+        "target_ids",
+        "term_ids",
+        "confidences",
+        # Byte offset of the separator after the target ID, one entry per True in valid. None
+        # unless requested with columns=True
+        "target_ends",
+    )
+)
+
+
+def _digits_value(buf, starts, lengths, max_digits, dtype):
+    """ Integer value of the digit runs buf[starts:starts + lengths] """
+    if starts.size and lengths.min() == lengths.max() > 0:
+        # Runs of one length (the usual case for term IDs): no per-run masking
+        n_digits = int(lengths[0])
+        value = buf[starts].astype(dtype)
+        for j in range(1, n_digits):
+            value *= dtype(10)
+            value += buf[starts + j]
+        # The '0's are taken off at once, wrapping around like the digits did
+        return value - dtype(48 * int("1" * n_digits) % (1 << 8 * value.itemsize))
+    value = np.zeros(starts.size, dtype=dtype)
+    last = buf.size - 1
+    for j in range(max_digits):
+        has_digit = j < lengths
+        digit = buf[np.minimum(starts + j, last)].astype(dtype) - dtype(48)
+        value = np.where(has_digit, value * dtype(10) + digit, value)
+    return value
+
+
+def _is_separator(chars):
+    return (chars == 0x20) | (chars == 0x09)
+
+
+def _in_range(values, bounds):
+    return (values >= bounds[0]) & (values <= bounds[1])
+
+
+def parse_prediction_chunk(chunk, syntax, columns=False, term_column=False, target_column=False):
+    """
+    Validates a chunk of whole lines (ending with a newline) column-wise.
+
+    Only the positions of the non-digit bytes are extracted. In a prediction record laid out
+    as TARGET<sep>TERM<sep>CONFIDENCE, with one space or tab as <sep> and an optional \\r
+    before the newline, they form a fixed skeleton per target prefix, e.g. for GO:
+    "T", sep, "G", "O", ":", sep, ".", newline. Lines with that skeleton are checked by
+    comparing the positions of consecutive non-digits, which gives the length of each
+    digit run. Every other line, valid or not, is left to the per-line checks.
+
+    The target, term and confidence columns are only filled in with columns=True, the term
+    column alone with term_column=True, the target columns alone with target_column=True.
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    # Bytes below "0" wrap around, so one comparison finds every non-digit
+    non_digits = np.flatnonzero((buf - np.uint8(48)) > np.uint8(9))
+    chars = buf[non_digits]
+    newlines = np.flatnonzero(chars == 10)
+    n_lines = newlines.size
+    line_ends = non_digits[newlines]
+    line_starts = np.empty(n_lines, dtype=line_ends.dtype)
+    line_starts[:1] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+
+    # Index in non_digits of the first non-digit of each line, and non-digits per line
+    firsts = np.empty(n_lines, dtype=newlines.dtype)
+    firsts[:1] = 0
+    firsts[1:] = newlines[:-1] + 1
+    counts = newlines - firsts + 1
+    before_newline = np.maximum(newlines - 1, 0)
+    has_cr = (counts > 1) & (chars[before_newline] == 13) & (non_digits[before_newline] == line_ends - 1)
+
+    term_prefix = syntax.term_prefix
+    n_term_prefix = len(term_prefix)
+    valid = np.zeros(n_lines, dtype=bool)
+    column_parts = []
+
+    # Target prefixes of the same length share a skeleton, e.g. "M" and "T"
+    prefixes_by_length = {}
+    for prefix in syntax.target_prefixes:
+        prefixes_by_length.setdefault(len(prefix), []).append(prefix)
+
+    for k, prefixes in sorted(prefixes_by_length.items()):
+        skeleton = k + 1 + n_term_prefix + 1 + 1 + 1
+        in_skeleton = counts == skeleton + has_cr
+        width = non_digits.size // n_lines if n_lines else 0
+        if width in (skeleton, skeleton + 1) and n_lines * width == non_digits.size and in_skeleton.all():
+            # Usual case: every line of the chunk has the same skeleton, so the columns are
+            # strided views on the non-digits and nothing has to be gathered per line
+            lines = np.arange(n_lines)
+            positions = non_digits.reshape(n_lines, width).T
+            line_chars = chars.reshape(n_lines, width).T
+            starts = line_starts
+        else:
+            lines = np.flatnonzero(in_skeleton)
+            first = firsts[lines]
+            positions = [non_digits[first + j] for j in range(skeleton)]
+            line_chars = [chars[first + j] for j in range(skeleton)]
+            starts = line_starts[lines]
+
+        # Target: the prefix starts the line, then 5 to 20 digits up to the separator
+        ok = positions[0] == starts
+        for j in range(1, k):
+            ok &= positions[j] == positions[j - 1] + 1
+        prefix_ok = np.zeros(lines.size, dtype=bool)
+        for prefix in prefixes:
+            matched = line_chars[0] == prefix[0]
+            for j in range(1, k):
+                matched &= line_chars[j] == prefix[j]
+            prefix_ok |= matched
+        ok &= prefix_ok
+        target_sep = positions[k]
+        ok &= _is_separator(line_chars[k]) & _in_range(target_sep - positions[k - 1] - 1, TARGET_DIGITS)
+
+        # Term: the prefix right after the separator, then 5 to 7 digits up to the separator
+        for j in range(n_term_prefix):
+            ok &= (line_chars[k + 1 + j] == term_prefix[j]) & (positions[k + 1 + j] == target_sep + 1 + j)
+        term_sep = positions[k + 1 + n_term_prefix]
+        ok &= _is_separator(line_chars[k + 1 + n_term_prefix])
+        ok &= _in_range(term_sep - positions[k + n_term_prefix] - 1, TERM_DIGITS)
+
+        # Confidence: one digit, ".", two digits, then the end of the line (or \r). At most 1.00
+        dot = positions[skeleton - 2]
+        ok &= (line_chars[skeleton - 2] == ord(".")) & (dot == term_sep + 2)
+        ok &= positions[skeleton - 1] == dot + 3
+        # Gathered before the lines are masked: a malformed last line may end right after its
+        # ".", so the indices are clamped to the chunk (such lines are not ok anyway)
+        last = buf.size - 1
+        units = buf[np.minimum(term_sep + 1, last)]
+        ok &= (units == ord("0")) | ((units == ord("1")) & (buf[np.minimum(dot + 1, last)] == ord("0")) &
+                                     (buf[np.minimum(dot + 2, last)] == ord("0")))
+
+        valid[lines[ok]] = True
+        if columns or term_column or target_column:
+            column_parts.append((lines[ok], positions[k - 1][ok] + 1, target_sep[ok],
+                                 positions[k + n_term_prefix][ok] + 1, term_sep[ok]))
+
+    target_ids = term_ids = confidences = target_ends = None
+    if columns or term_column or target_column:
+        order = np.argsort(np.concatenate([part[0] for part in column_parts]), kind="stable")
+        target_starts, target_ends, term_starts, term_ends = (
+            np.concatenate([part[i] for part in column_parts])[order] for i in range(1, 5))
+    if columns or term_column:
+        term_ids = _digits_value(buf, term_starts, term_ends - term_starts, TERM_DIGITS[1], np.uint32)
+    if columns or target_column:
+        target_ids = _digits_value(buf, target_starts, target_ends - target_starts, TARGET_DIGITS[1], np.uint64)
+    else:
+        target_ends = None
+    if columns:
+        confidences = ((buf[term_ends + 1] - 48) * 100 + (buf[term_ends + 3] - 48) * 10 +
+                       (buf[term_ends + 4] - 48)).astype(np.uint8)
+
+    return prediction_chunk(n_lines, valid, line_starts, line_ends, target_ids, term_ids, confidences, target_ends)
+
+
+def iter_line_chunks(infile, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads infile in blocks of about chunk_size bytes, each cut after its last newline.
+    Yields (chunk, terminated): terminated is False for a final line that had no newline
+    and was given one.
+    """
+    remainder = b""
+    while True:
+        block = infile.read(chunk_size)
+        if not block:
+            break
+        if isinstance(block, str):
+            block = block.encode()
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            remainder += block
+            continue
+        yield remainder + block[:cut], True
+        remainder = block[cut:]
+    if remainder:
+        yield remainder + b"\n", False
+
+
+def _known_targets(chunk, parsed, predictions, machine):
+    """
+    bool per valid prediction of parsed, False for those of a target refused by machine.targets.
+    Predictions come in runs of the same target, and only the first of each run is checked.
+    """
+    starts = parsed.line_starts[predictions]
+    ids = parsed.target_ids
+    lengths = parsed.target_ends - starts
+    first_chars = np.frombuffer(chunk, dtype=np.uint8)[starts]
+    # Same digits, length and first character: same target
+    new_run = np.ones(predictions.size, dtype=bool)
+    new_run[1:] = (ids[1:] != ids[:-1]) | (lengths[1:] != lengths[:-1]) | (first_chars[1:] != first_chars[:-1])
+    run_starts = np.flatnonzero(new_run).tolist()
+    run_ends = run_starts[1:] + [predictions.size]
+
+    known = np.ones(predictions.size, dtype=bool)
+    known_targets = machine.known_targets
+    for run_start, run_end, start, end in zip(run_starts, run_ends, starts[run_starts].tolist(),
+                                               parsed.target_ends[run_starts].tolist()):
+        target = chunk[start:end]
+        if target in known_targets:
+            continue
+        if machine.targets.check(target) is None:
+            known_targets.add(target)
+        else:
+            known[run_start:run_end] = False
+    return known
+
+
+def columnar_cafa_checker(infile, filename, spec, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None, errors=None,
+                          terms=None, targets=None):
+    """
+    Same verdict as cafa_record_engine.check_records(infile, filename, spec, errors, terms=terms,
+    targets=targets), computed chunk by chunk with numpy. infile must have a read() method.
+
+    on_chunk, if given, is called with the prediction_chunk of every chunk read, e.g. to
+    consume the target/term/confidence columns.
+    """
+    if np is None:
+        return check_records(infile, filename, spec, errors, terms=terms, targets=targets)
+
+    syntax = COLUMNAR_SYNTAX[spec.label]
+    fast_match = spec.prediction_patterns[1].fullmatch
+    machine = RecordStateMachine(spec, filename, errors, terms=terms, targets=targets)
+    bitmap = None if terms is None else np.frombuffer(terms.bitmap_view(), dtype=np.uint8)
+    line_offset = 0
+
+    for chunk, terminated in iter_line_chunks(infile, chunk_size):
+        parsed = parse_prediction_chunk(chunk, syntax, columns=on_chunk is not None, term_column=terms is not None,
+                                        target_column=targets is not None)
+        valid = parsed.valid
+        if bitmap is not None or targets is not None:
+            # Predictions of unknown terms or targets go through the per-line checks with the others
+            predictions = np.flatnonzero(valid)
+            valid = valid.copy()
+        if targets is not None:
+            valid[predictions[~_known_targets(chunk, parsed, predictions, machine)]] = False
+        if bitmap is not None:
+            known = ((bitmap[parsed.term_ids >> 3] >> (parsed.term_ids & 7).astype(np.uint8)) & 1).astype(bool)
+            valid[predictions[~known]] = False
+        exceptions = np.flatnonzero(~valid).tolist()
+        # Lines are handed over with their newline, like when iterating over a file
+        line_ends = parsed.line_ends + 1
+        if not terminated:
+            line_ends[-1] -= 1
+
+        for n_seen, line_index in enumerate(exceptions):
+            # Lines before this one that are not exceptions are valid predictions
+            if not machine.prediction_seen and line_index > n_seen:
+                machine.visit_prediction()
+            line = chunk[parsed.line_starts[line_index]:line_ends[line_index]]
+            # Valid predictions outside of the canonical layout, e.g. with extra spaces
+            match = fast_match(line)
+            if match is not None:
+                if targets is not None and match[1] not in machine.known_targets:
+                    errmsg = machine.check_target(match[1], line_offset + line_index + 1, line)
+                    if errmsg is not None:
+                        return False, errmsg
+                if terms is not None and match[2] not in machine.known_terms:
+                    errmsg = machine.check_term(match[2], line_offset + line_index + 1, line)
+                    if errmsg is not None:
+                        return False, errmsg
+                if not machine.prediction_seen:
+                    machine.visit_prediction()
+                continue
+            errmsg = machine.feed_line(line, line_offset + line_index + 1)
+            if errmsg is not None:
+                return False, errmsg
+
+        if not machine.prediction_seen and len(exceptions) < parsed.n_lines:
+            machine.visit_prediction()
+        if on_chunk is not None:
+            on_chunk(parsed)
+        line_offset += parsed.n_lines
+
+    return machine.finish()
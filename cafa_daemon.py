@@ -0,0 +1,83 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import socket
+import socketserver
+from cafa_batch_validator import validate_batch
+
+'''
+Validation daemon, started with cafa4_format_checker.py --serve SOCKET.
+
+The daemon listens on a Unix socket with the checkers imported and the ontology and target
+indexes loaded once, so a request only pays for the validation itself. A request is a line
+of JSON, {"paths": [...]}, of absolute paths; the reply is a line of JSON per path, the
+submission_result of cafa4_format_checker as in batch mode, in the order of the paths.
+See cafa_client for the client. Requests are served one at a time.
+'''
+
+
+class ValidationHandler(socketserver.StreamRequestHandler):
+    """ Answers the requests of a connection, with the checks of the server """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                paths = json.loads(line)["paths"]
+            except (ValueError, KeyError, TypeError):
+                self.wfile.write(json.dumps({"error": "expected a line of JSON with a list of paths"}).encode() + b"\n")
+                return
+            for result in validate_batch(paths, jobs=1, **self.server.checks):
+                self.wfile.write(json.dumps(result._asdict()).encode() + b"\n")
+            self.wfile.flush()
+
+
+class ValidationServer(socketserver.UnixStreamServer):
+    """ Server validating the submissions sent to socket_path with checks, the keyword arguments
+    of validate_batch such as term_indexes or max_terms
+    """
+
+    def __init__(self, socket_path, checks):
+        self.checks = checks
+        remove_stale_socket(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, ValidationHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def remove_stale_socket(socket_path):
+    """ Removes the socket left by a daemon that is no longer running, fails if one is """
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError("a validation daemon is already listening on {}".format(socket_path))
+
+
+def serve(socket_path, **checks):
+    """ Serves validation requests on socket_path until interrupted """
+    with ValidationServer(socket_path, checks) as server:
+        print("Validating submissions sent to {}".format(socket_path), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -16,20 +16,18 @@ import re
 from cafa_go_format_checker import (
     target_field,
     confidence_field,
-    author_check,
     model_check,
     keywords_check,
     accuracy_check,
     end_check,
-    handle_error,
 )
 from cafa_validation_utils import validate_filename, validate_author_line
+from cafa_record_engine import record_spec, check_records, compile_prediction_patterns
 
-CAFA_VERSION = 4
+do_field_pattern = re.compile("^DO:[0-9]{5,7}$")
 
 
 def do_prediction_check(input_record):
-    do_field_pattern = re.compile("^DO:[0-9]{5,7}$")
     is_correct = True
     error_msg = None
     error_msg_prefix = "DO prediction: "
@@ -67,12 +65,49 @@ def do_prediction_check(input_record):
     return is_correct, error_msg
 
 
-def cafa_checker(input_file_handle, filename=None):
-    """
-    Main program that: 1. identifies fields; 2. Calls the proper checker function; 3. calls the
-    error handler "handle_error" which builds the error report.  If correct is False, the function returns correct, errmsg
-    to the file_name_check function in cafa3_format_checker.
-    """
+def build_checks(filename):
+    # What's the author/team from the filename? Parsed on the first AUTHOR record only
+    expected_author = []
+
+    def expected_author_check(input_line):
+        if not expected_author:
+            expected_author.append(validate_filename(filename).team_name)
+        return validate_author_line(input_line, expected_author=expected_author[0])
+
+    return {
+        "author": expected_author_check,
+        "model": model_check,
+        "keywords": keywords_check,
+        "accuracy": accuracy_check,
+        "do_prediction": do_prediction_check,
+        "end": end_check,
+    }
+
+
+def sections_valid(visited_states):
+    # The required states must all be accounted for, KEYWORDS and ACCURACY are optional:
+    return (
+        len(visited_states) >= 4
+        and visited_states[0] == "author"
+        and visited_states[1] == "model"
+        and visited_states[-2] == "do_prediction"
+        and visited_states[-1] == "end"
+    )
+
+
+RECORD_SPEC = record_spec(
+    label="DO",
+    prediction_state="do_prediction",
+    build_checks=build_checks,
+    sections_valid=sections_valid,
+    sections_hint="AUTHOR, MODEL, KEYWORDS (optional), ACCURACY (optional), predictions, END",
+    prediction_patterns=compile_prediction_patterns("(?:M|T|EFI)[0-9]{5,20}", "DO:[0-9]{5,7}"),
+)
+
+
+def cafa_checker(input_file_handle, filename=None, errors=None, duplicates=None, terms=None, targets=None,
+                 term_counts=None, propagation=None):
+    """ Checks a DO prediction file, returns (correct, errmsg): see cafa_record_engine.check_records """
 
     # TODO: For the longterm, the filename param should be dropped.
     #  For the short-term, I'm keeping it so the function
@@ -81,128 +116,8 @@ def cafa_checker(input_file_handle, filename=None):
     if filename is None:
         filename = input_file_handle.name
 
-    visited_states = []
-    accuracy_count = 0
-    model_count = 0
-
-    for line_index, input_line in enumerate(input_file_handle):
-
-        try:
-            input_line = input_line.decode()
-        except AttributeError:
-            pass
-
-        input_line = input_line.strip()
-        line_split = [i.strip() for i in input_line.split()]
-        input_state = line_split[0]
-
-        states = ("AUTHOR", "MODEL", "KEYWORDS", "ACCURACY", "END")
-
-        if input_state in states:
-            state = input_state.lower()
-        else:  # default to prediction state
-            state = "do_prediction"
-
-        # Check for errors according to state
-        if state == "author":
-
-            # What's the author/team from the filename?
-            filename_validator = validate_filename(filename)
-            is_correct, error_msg = validate_author_line(input_line, expected_author=filename_validator.team_name)
-            #author_check(input_line)
-            if not is_correct:
-                is_correct, error_msg = handle_error(
-                    is_correct, error_msg, input_line, line_index, filename
-                )
-                return is_correct, error_msg
-            else:
-                visited_states.append(state)
-        elif state == "model":
-            model_count += 1
-            accuracy_count = 0
-            if model_count > 3:
-                return False, "Too many models. Only up to 3 allowed"
-
-            is_correct, error_msg = model_check(input_line)
-            is_correct, error_msg = handle_error(
-                is_correct, error_msg, input_line, line_index, filename
-            )
-            if not is_correct:
-                return is_correct, error_msg
-            if model_count == 1:
-                visited_states.append(state)
-        elif state == "keywords":
-
-            if state not in visited_states:
-                visited_states.append(state)
-
-            is_correct, error_msg = keywords_check(input_line)
-            is_correct, error_msg = handle_error(
-                is_correct, error_msg, input_line, line_index, filename
-            )
-            if not is_correct:
-                return is_correct, error_msg
-        elif state == "accuracy":
-            if state not in visited_states:
-                visited_states.append(state)
-
-            accuracy_count += 1
-            if accuracy_count > 3:
-                is_correct, error_msg = handle_error(
-                    False, "ACCURACY: too many ACCURACY records", line_index, filename
-                )
-                return is_correct, error_msg
-            else:
-                is_correct, error_msg = accuracy_check(input_line)
-                if not is_correct:
-                    return is_correct, error_msg
-        elif state == "do_prediction":
-            is_correct, error_msg = do_prediction_check(input_line)
-            if not is_correct:
-                return handle_error(
-                    is_correct, error_msg, input_line, line_index, filename
-                )
-
-            if state not in visited_states:
-                visited_states.append(state)
-
-        elif state == "end":
-            is_correct, error_msg = end_check(input_line)
-            is_correct, error_msg = handle_error(
-                is_correct, error_msg, input_line, line_index, filename
-            )
-            if not is_correct:
-                return is_correct, error_msg
-            visited_states.append(state)
-
-    # End file forloop
-
-    # At this point the various states have been individually validated,
-    # finally, check that the required states are all accounted for:
-    if (
-        visited_states[0] != "author"
-        or visited_states[1] != "model"
-        or visited_states[-2] != "do_prediction"
-        or visited_states[-1] != "end"
-    ):
-
-        error_msg = "Error in {} filename \n".format(filename)
-        error_msg += "Sections found in the file: [{}]\n".format(", ".join(visited_states))
-        error_msg += "file not formatted according to CAFA {cafa_version} specs\n".format(
-            cafa_version=CAFA_VERSION
-        )
-        error_msg += "Check if all these record types are in your file in the correct order\n"
-        error_msg += (
-            "AUTHOR, MODEL, KEYWORDS (optional), ACCURACY (optional), predictions, END"
-        )
-        return False, error_msg
-    else:
-        return (
-            True,
-            "{filename}, passed the CAFA {cafa_version} DO prediction format checker".format(
-                filename=filename, cafa_version=CAFA_VERSION
-            ),
-        )
+    return check_records(input_file_handle, filename, RECORD_SPEC, errors, duplicates, terms, targets, term_counts,
+                         propagation)
 
 
 def main():
@@ -0,0 +1,232 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import heapq
+import tempfile
+from array import array
+from collections import namedtuple
+
+'''
+Detection of (target, term) pairs predicted more than once in the same model.
+
+Every prediction is packed into a 64-bit key:
+
+    bits 28-63  index of the target ID, in order of first appearance
+    bits 26-27  model number (0 before the first MODEL record, at most MAX_MODEL)
+    bits 24-25  number of digits of the term ID, minus 4 (1 to 3)
+    bits  0-23  value of the term ID
+
+The keys, and the lowest line each one was seen on, are kept in an open-addressing hash
+table made of two arrays. When the table would outgrow the memory budget, it is written out
+as a run sorted by key and emptied; once every prediction has been added, the runs are
+merged and the keys found in more than one run are duplicates too. Memory use is bounded by
+the budget plus the table of target IDs.
+
+The predictions of models past MAX_MODEL, which are errors of their own, are not looked at:
+their keys would be those of an earlier model.
+'''
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Bytes per stored prediction while a run is written out: two 8 byte slots per entry at
+# the maximal load factor of 1/2, plus the list of packed ints that is sorted
+BYTES_PER_ENTRY = 96
+INITIAL_TABLE_BITS = 16
+MIN_TABLE_BITS = 4
+
+TARGET_SHIFT = 28
+MODEL_SHIFT = 26
+MAX_MODEL = 3
+DIGITS_SHIFT = 24
+TERM_MASK = (1 << DIGITS_SHIFT) - 1
+LINE_BITS = 40
+LINE_MASK = (1 << LINE_BITS) - 1
+# Fibonacci hashing multiplier
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+# Pairs read at once from a run while merging
+RUN_READ_SIZE = 1 << 16
+
+duplicate_prediction = namedtuple("duplicate_prediction", ("line_num", "first_line_num", "key"))
+
+
+class DuplicateDetector(object):
+    """
+    Collects the predictions of one file through add() and reports, from finish(), the lines
+    that repeat a (target, term) pair of the same model. Only the max_reported duplicates
+    with the lowest line numbers are kept; n_duplicates counts them all.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, max_reported=1000, spill_dir=None):
+        # Largest table whose half fits in the budget
+        self.max_bits = max((2 * (memory_budget // BYTES_PER_ENTRY)).bit_length() - 1, MIN_TABLE_BITS)
+        self.max_reported = max_reported
+        self.spill_dir = spill_dir
+        self.target_index = {}
+        self.targets = []
+        self.term_prefix = None
+        self.runs = []
+        self.n_duplicates = 0
+        # Max-heap (on -line_num) of the duplicates with the lowest line numbers
+        self._reported = []
+        self._new_table(min(INITIAL_TABLE_BITS, self.max_bits))
+
+    def _new_table(self, bits):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.shift = 64 - bits
+        self.keys = array("Q", bytes(8 << bits))
+        self.lines = array("Q", bytes(8 << bits))
+        self.size = 0
+
+    def _intern(self, target, term):
+        index = self.target_index[target] = len(self.targets)
+        self.targets.append(target)
+        if self.term_prefix is None:
+            self.term_prefix = term[:3] if isinstance(term, str) else term[:3].decode()
+        return index
+
+    def pack(self, target, term, model):
+        """ 64-bit key of a prediction, target and term as str or bytes, e.g. b"T100" and b"GO:0008270" """
+        if model > MAX_MODEL:
+            raise ValueError("Model %s does not fit in a key, at most %s" % (model, MAX_MODEL))
+        if isinstance(target, str):
+            target = target.encode()
+        index = self.target_index.get(target)
+        if index is None:
+            index = self._intern(target, term)
+        return (index << TARGET_SHIFT) | (model << MODEL_SHIFT) | ((len(term) - 7) << DIGITS_SHIFT) | int(term[3:])
+
+    def unpack(self, key):
+        """ (target, term, model) of a key, as str """
+        n_digits = ((key >> DIGITS_SHIFT) & 3) + 4
+        term = "%s%0*d" % (self.term_prefix, n_digits, key & TERM_MASK)
+        return self.targets[key >> TARGET_SHIFT].decode(), term, (key >> MODEL_SHIFT) & 3
+
+    def add(self, target, term, model, line_num):
+        # pack() and the probe are inlined: this runs once per prediction
+        if model > MAX_MODEL:
+            return
+        if isinstance(target, str):
+            target = target.encode()
+        index = self.target_index.get(target)
+        if index is None:
+            index = self._intern(target, term)
+        key = (index << TARGET_SHIFT) | (model << MODEL_SHIFT) | ((len(term) - 7) << DIGITS_SHIFT) | int(term[3:])
+
+        keys = self.keys
+        mask = self.mask
+        slot = ((key * GOLDEN) & MASK64) >> self.shift
+        found = keys[slot]
+        while found:
+            if found == key:
+                first_line_num = self.lines[slot]
+                if line_num < first_line_num:
+                    self.lines[slot] = line_num
+                    line_num, first_line_num = first_line_num, line_num
+                self._report(line_num, first_line_num, key)
+                return
+            slot = (slot + 1) & mask
+            found = keys[slot]
+        keys[slot] = key
+        self.lines[slot] = line_num
+        self.size += 1
+        if self.size << 1 > mask:
+            if self.bits >= self.max_bits:
+                self._spill()
+            else:
+                self._grow()
+
+    def _insert_all(self, keys, lines):
+        for key, line_num in zip(keys, lines):
+            if key:
+                slot = ((key * GOLDEN) & MASK64) >> self.shift
+                while self.keys[slot]:
+                    slot = (slot + 1) & self.mask
+                self.keys[slot] = key
+                self.lines[slot] = line_num
+                self.size += 1
+
+    def _grow(self):
+        keys, lines = self.keys, self.lines
+        self._new_table(self.bits + 1)
+        self._insert_all(keys, lines)
+
+    def _sorted_entries(self):
+        """ (key << LINE_BITS) | line of every entry of the table, sorted """
+        return sorted((key << LINE_BITS) | line_num for key, line_num in zip(self.keys, self.lines) if key)
+
+    def _spill(self):
+        """ Writes the table out as a run of (key, line) pairs sorted by key, then empties it """
+        run = tempfile.TemporaryFile(dir=self.spill_dir)
+        entries = self._sorted_entries()
+        for start in range(0, len(entries), RUN_READ_SIZE):
+            pairs = array("Q")
+            for entry in entries[start:start + RUN_READ_SIZE]:
+                pairs.append(entry >> LINE_BITS)
+                pairs.append(entry & LINE_MASK)
+            pairs.tofile(run)
+        del entries
+        run.flush()
+        self.runs.append(run)
+        self._new_table(self.bits)
+
+    def _report(self, line_num, first_line_num, key):
+        self.n_duplicates += 1
+        entry = (-line_num, first_line_num, key)
+        if len(self._reported) < self.max_reported:
+            heapq.heappush(self._reported, entry)
+        elif self.max_reported and -line_num > self._reported[0][0]:
+            heapq.heapreplace(self._reported, entry)
+
+    @staticmethod
+    def _read_run(run):
+        run.seek(0)
+        while True:
+            pairs = array("Q")
+            try:
+                pairs.fromfile(run, 2 * RUN_READ_SIZE)
+            except EOFError:
+                # Last, partial block: what was read is in pairs
+                pass
+            if not pairs:
+                return
+            for i in range(0, len(pairs), 2):
+                yield pairs[i], pairs[i + 1]
+
+    def finish(self):
+        """ The reported duplicate_predictions, by line number. Closes the runs """
+        if self.runs:
+            self._spill()
+            # Every occurrence of a key is reported against the one with the lowest line, in
+            # whichever run it is
+            previous_key = first_line_num = None
+            for key, line_num in heapq.merge(*(self._read_run(run) for run in self.runs)):
+                if key != previous_key:
+                    previous_key, first_line_num = key, line_num
+                    continue
+                if line_num < first_line_num:
+                    line_num, first_line_num = first_line_num, line_num
+                self._report(line_num, first_line_num, key)
+            self.close()
+        return sorted(duplicate_prediction(-line_num, first_line_num, key)
+                      for line_num, first_line_num, key in self._reported)
+
+    def describe(self, duplicate):
+        target, term, model = self.unpack(duplicate.key)
+        return "duplicate prediction: %s %s was already predicted in line %s" % (
+            target, term, duplicate.first_line_num)
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
@@ -0,0 +1,135 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import re
+from array import array
+from collections import namedtuple
+
+'''
+Compact storage of every error found in a submission, for the collect-all-errors mode.
+
+Each error is kept as three numbers (line, error code, column) in typed arrays, up to a
+cap; only the first few are formatted into messages. Errors past the cap are still counted
+per error code, so one pass reports how many of each kind there are.
+'''
+
+DEFAULT_MAX_ERRORS = 100000
+DEFAULT_MAX_MESSAGES = 20
+
+# Error codes are indices in this tuple
+ERROR_CODES = (
+    # A record failing its own check, named after its state
+    "author",
+    "model",
+    "keywords",
+    "accuracy",
+    "end",
+    # Prediction records, by failing field
+    "prediction_fields",
+    "prediction_target",
+    "unknown_target",
+    "target_taxonomy",
+    "prediction_term",
+    "unknown_term",
+    "prediction_confidence",
+    "confidence_above_one",
+    # Limits and section order
+    "too_many_models",
+    "too_many_accuracy",
+    "too_many_terms",
+    "sections",
+    # The same (target, term) pair twice in a model
+    "duplicate_prediction",
+    # A term scoring higher than one of its predicted ancestors
+    "score_above_ancestor",
+)
+ERROR_CODE = {name: code for code, name in enumerate(ERROR_CODES)}
+
+error_limits = namedtuple("error_limits", ("max_errors", "max_messages"))
+
+stored_error = namedtuple("stored_error", ("line_num", "code", "column"))
+
+field_pattern = re.compile(r"\S+")
+
+# Prediction check messages (GO, HPO and DO word them alike) -> (error code, field index)
+PREDICTION_ERRORS = (
+    ("wrong number of fields", "prediction_fields", None),
+    ("Cannot be > 1.0", "confidence_above_one", 2),
+    ("first", "prediction_target", 0),
+    ("second", "prediction_term", 1),
+    ("third", "prediction_confidence", 2),
+)
+
+
+def classify_prediction_error(errmsg, inline):
+    """ (error code, 1-based column of the failing field or 0) of a prediction check message """
+    for marker, name, field in PREDICTION_ERRORS:
+        if marker in errmsg:
+            break
+    else:
+        return ERROR_CODE["prediction_fields"], 0
+    if field is None:
+        return ERROR_CODE[name], 0
+    for i, match in enumerate(field_pattern.finditer(inline)):
+        if i == field:
+            return ERROR_CODE[name], match.start() + 1
+    return ERROR_CODE[name], 0
+
+
+class ErrorStore(object):
+    """
+    Errors of one submission: line numbers, codes and columns of the first max_errors
+    errors, the messages of the first max_messages, and a count per error code of all of them.
+    """
+
+    def __init__(self, max_errors=DEFAULT_MAX_ERRORS, max_messages=DEFAULT_MAX_MESSAGES):
+        self.max_errors = max_errors
+        self.max_messages = max_messages
+        self.line_nums = array("Q")
+        self.codes = array("B")
+        self.columns = array("I")
+        self.counts = [0] * len(ERROR_CODES)
+        self.messages = []
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        for entry in zip(self.line_nums, self.codes, self.columns):
+            yield stored_error(*entry)
+
+    @property
+    def total(self):
+        """ Number of errors found, including those past the cap """
+        return sum(self.counts)
+
+    def add(self, code, line_num, column, message):
+        """ Records an error. message is a callable building its text, only called if kept """
+        self.counts[code] += 1
+        if len(self.codes) < self.max_errors:
+            self.line_nums.append(line_num)
+            self.codes.append(code)
+            self.columns.append(column)
+        if len(self.messages) < self.max_messages:
+            self.messages.append(message())
+
+    def report(self, filename):
+        """ Summary of the errors of filename: counts per error code, then the first messages """
+        total = self.total
+        lines = ["Found %s error%s in %s" % (total, "" if total == 1 else "s", filename)]
+        for name, count in zip(ERROR_CODES, self.counts):
+            if count:
+                lines.append("  %s: %s" % (name, count))
+        if total > len(self.messages):
+            lines.append("First %s errors:" % len(self.messages))
+        lines.extend(self.messages)
+        return "\n".join(lines)
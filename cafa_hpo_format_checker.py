@@ -14,7 +14,8 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import re
 import sys
-from cafa_validation_utils import  get_valid_keywords
+from cafa_validation_utils import VALID_KEYWORDS
+from cafa_record_engine import record_spec, check_records, compile_prediction_patterns
 
 pr_field = re.compile("^PR=[0,1]\.[0-9][0-9];$")
 rc_field = re.compile("^RC=[0,1]\.[0-9][0-9]$")
@@ -24,7 +25,7 @@ confidence_field = re.compile("^[0,1]\.[0-9][0-9]$")
 legal_states1 = ["author","model","keywords","accuracy","hpo_prediction","end"]
 legal_states2 = ["author","model","keywords","hpo_prediction","end"]
 legal_states3 = ["author","model","hpo_prediction","end"]
-legal_keywords = get_valid_keywords()
+legal_keywords = frozenset(VALID_KEYWORDS)
 
 def author_check(inrec):
     correct = True
@@ -111,7 +112,7 @@ def hpo_prediction_check(inrec):
         errmsg = "GO prediction: error in third (confidence) field"
     elif float(fields[2]) > 1.0:
         correct = False
-        errmsg = "GO prediction: error in third (confidence) field"
+        errmsg = "GO prediction: error in third (confidence) field. Cannot be > 1.0"
     return correct, errmsg
 
 def end_check(inrec):
@@ -127,120 +128,30 @@ def end_check(inrec):
     return correct, errmsg
 
 
-"""
-Function builds the error message to incorporate the filename and what line the error was raised on.
-Returns the status of whether the line is correct and the error message if one exists.
-"""
-def handle_error(correct, errmsg, inrec, line_num, fileName):
-    if not correct:
-        line = "Error in %s, line %s, " % (fileName, line_num)
-        return False,  line + errmsg
-    else:
-        return True, "Nothing wrong here"
-
-def cafa_checker(infile, fileName):
-    """
-    Main program that: 1. identifies fields; 2. Calls the proper checker function; 3. calls the
-    error handler "handle_error" which builds the error report.  If correct is False, the function returns correct, errmsg
-    to the file_name_check function in cafa3_format_checker.
-    """
-    visited_states = []
-    s_token = 0
-    n_accuracy = 0
-    first_prediction = True
-    first_accuracy = True
-    first_keywords = True
-    n_models = 0
-    line_num = 0
-    for inline in infile:
-        try:
-            inline = inline.decode()
-        except AttributeError:
-            pass
+def build_checks(fileName):
+    return {
+        "author": author_check,
+        "model": model_check,
+        "keywords": keywords_check,
+        "accuracy": accuracy_check,
+        "hpo_prediction": hpo_prediction_check,
+        "end": end_check,
+    }
 
-        line_num += 1
-        inrec = [i.strip() for i in inline.split()]
-        field1 = inrec[0]
-        # Check which field type (state) we are in
-        if field1 == "AUTHOR":
-            state = "author"
-        elif field1 == "MODEL":
-            state = "model"
-        elif field1 == "KEYWORDS":
-            state = "keywords"
-        elif field1 == "ACCURACY":
-            state = "accuracy"
-        elif field1 == "END":
-            state = "end"
-        else: #default to prediction state
-            state = "hpo_prediction"
-#        print "****"
-#        print "FIELD1", field1
-#        print inline, state
-        # Check for errors according to state
-        if state == "author":
-            correct,errmsg = author_check(inline)
-            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
-            if not correct:
-                return correct, errmsg
-            visited_states.append(state)
-        elif state == "model":
-            n_models += 1
-            n_accuracy = 0
-            if n_models > 3:
-                return False, "Too many models. Only up to 3 allowed"
-            correct,errmsg = model_check(inline)
-            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
-            if not correct:
-                return correct, errmsg
-            if n_models == 1:
-                visited_states.append(state)
-        elif state == "keywords":
-            if first_keywords:
-                visited_states.append(state)
-                first_keywords = False
-            correct, errmsg = keywords_check(inline)
-            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
-            if not correct:
-                return correct, errmsg
-        elif state == "accuracy":
-            if first_accuracy:
-                visited_states.append(state)
-                first_accuracy = False
-            n_accuracy += 1
-            if n_accuracy > 3:
-                correct, errmsg = handle_error(False, "ACCURACY: too many ACCURACY records", inline, line_num, fileName)
-                if not correct:
-                    return correct, errmsg
-            else:
-                correct, errmsg = accuracy_check(inline)
-                if not correct:
-                    return correct, errmsg
-        elif state == "hpo_prediction":
-            correct, errmsg = hpo_prediction_check(inline)
-            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
-            if not correct:
-                return correct, errmsg
-            if first_prediction:
-                visited_states.append(state)
-                first_prediction = False
-        elif state == "end":
-            correct, errmsg = end_check(inline)
-            correct, errmsg = handle_error(correct, errmsg, inline, line_num, fileName)
-            if not correct:
-                return correct, errmsg
-            visited_states.append(state)
-    # End file forloop
-    if (visited_states != legal_states1 and
-        visited_states != legal_states2 and
-        visited_states != legal_states3):
-        errmsg = "Error in " + fileName + "\n"
-        errmsg += "Sections found in the file: [" + ", ".join(visited_states) + "]\n"
-        errmsg += "file not formatted according to CAFA 4 specs\n"
-        errmsg += "Check whether all these record types are in your file in the correct order\n"
-        errmsg += "AUTHOR, MODEL, KEYWORDS, ACCURACY (optional), predictions, END"
-        return False, errmsg
-    else:
-        return True, "%s, passed the CAFA 4 HPO prediction format checker" % fileName
+def sections_valid(visited_states):
+    return visited_states in (legal_states1, legal_states2, legal_states3)
 
+RECORD_SPEC = record_spec(
+    label="HPO",
+    prediction_state="hpo_prediction",
+    build_checks=build_checks,
+    sections_valid=sections_valid,
+    sections_hint="AUTHOR, MODEL, KEYWORDS, ACCURACY (optional), predictions, END",
+    prediction_patterns=compile_prediction_patterns("T[0-9]{5,20}", "HP:[0-9]{5,7}"),
+)
 
+def cafa_checker(infile, fileName, errors=None, duplicates=None, terms=None, targets=None,
+                 term_counts=None, propagation=None):
+    """ Checks a HPO prediction file, returns (correct, errmsg): see cafa_record_engine.check_records """
+    return check_records(infile, fileName, RECORD_SPEC, errors, duplicates, terms, targets, term_counts,
+                         propagation)
@@ -0,0 +1,237 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import unquote
+from cafa4_format_checker import ontology_validator
+from cafa_pipelined_reader import COMPRESSION_MAGIC, COMPRESSION_SUFFIXES, import_compression, uncompressed_path
+from cafa_validation_utils import validate_filename
+
+'''
+HTTP service validating prediction files while they are uploaded, started with
+cafa4_format_checker.py --http PORT.
+
+    POST /validate/<file name>    body: the prediction file, possibly gzip, bzip2 or xz
+                                  compressed (by its name), with a Content-Length or chunked
+    -> 200, {"filename": ..., "is_valid": ..., "message": ...}
+
+The upload is never written to disk. It is checked in a pool of `workers` processes, forked
+from the server so that the checkers and indexes are already loaded, by one that reads the
+body from a socket as it arrives: the verdict is known as soon as the last byte is. The
+server only reads the next chunk of a body once the previous one is in the socket, so a slow
+checker slows the upload down instead of filling the memory, and at most `workers` uploads
+are received at once. Zip and tar archives cannot be checked as a stream and are refused.
+'''
+
+CHUNK_SIZE = 1 << 16
+MAX_HEADER_SIZE = 1 << 16
+DEFAULT_HOST = "127.0.0.1"
+
+# Name of the module decompressing the files of each suffix
+_DECOMPRESSORS = dict(zip(COMPRESSION_SUFFIXES, (name for magic, name in COMPRESSION_MAGIC)))
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class BadRequest(Exception):
+    """ A request the service cannot answer, with the HTTP status to reply with """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+# Keyword arguments of ontology_validator in an upload checker process, see _init_upload_checker
+_worker_checks = None
+
+
+def _init_upload_checker(checks):
+    global _worker_checks
+    _worker_checks = checks
+
+
+def _check_upload(upload_socket, filename):
+    """ Task of an upload checker process: validates the file read from upload_socket, returns
+    the verdict as a dict """
+    with upload_socket, upload_socket.makefile("rb") as upload:
+        inner_name = uncompressed_path(filename)
+        parsed = validate_filename(inner_name)
+        if not parsed.is_valid:
+            is_valid, message = False, parsed.message
+        else:
+            decompressor = next((import_compression(name) for suffix, name in _DECOMPRESSORS.items()
+                                 if filename.endswith(suffix)), None)
+            handle = upload if decompressor is None else decompressor.open(upload, "rb")
+            try:
+                is_valid, message = ontology_validator(parsed.ontology, handle, inner_name,
+                                                       taxonomy=parsed.taxonomy_id, **_worker_checks)
+            except (OSError, EOFError, UnicodeDecodeError) as e:
+                is_valid, message = False, "Could not read {filename}: {error}".format(filename=filename, error=e)
+    return {"filename": filename, "is_valid": is_valid, "message": message}
+
+
+async def _send_to_checker(loop, sock, data, checking):
+    """ Sends data to the checker reading sock, waiting for room as needed, unless checking (the
+    future of its verdict) is done first, the checker having found an error before the end """
+    sending = asyncio.ensure_future(loop.sock_sendall(sock, data))
+    await asyncio.wait((sending, checking), return_when=asyncio.FIRST_COMPLETED)
+    if sending.done():
+        sending.result()
+    else:
+        sending.cancel()
+
+
+async def _read_body(reader, headers):
+    """ Yields the chunks of a request body, as they arrive """
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b";")[0], 16)
+            except ValueError:
+                raise BadRequest(400, "bad chunk size")
+            if size == 0:
+                # Trailers, up to the empty line
+                while (await reader.readline()).strip():
+                    pass
+                return
+            while size > 0:
+                chunk = await reader.read(min(size, CHUNK_SIZE))
+                if not chunk:
+                    raise BadRequest(400, "the upload ended early")
+                size -= len(chunk)
+                yield chunk
+            await reader.readline()
+    else:
+        try:
+            remaining = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise BadRequest(400, "bad Content-Length")
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise BadRequest(400, "the upload ended early")
+            remaining -= len(chunk)
+            yield chunk
+
+
+class ValidationService(object):
+    """ Validates the uploads sent to it, with checks (the keyword arguments of ontology_validator
+    such as term_indexes or max_terms), in a pool of `workers` processes. close() stops them. """
+
+    def __init__(self, checks, workers=None):
+        self.checks = checks
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = asyncio.Semaphore(self.workers)
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        # Forked, so that the checkers do not have to be imported or the indexes loaded again,
+        # and the checks are inherited rather than sent with every upload
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=_init_upload_checker, initargs=(self.checks,))
+
+    def close(self):
+        self.pool.shutdown()
+
+    async def validate_upload(self, filename, body):
+        """ Verdict (a dict) on the file named filename whose content is the async iterator body """
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            server_end, checker_end = socket.socketpair()
+            checking = loop.run_in_executor(self.pool, _check_upload, checker_end, filename)
+            try:
+                server_end.setblocking(False)
+                async for chunk in body:
+                    # Once the checker is done, the rest of the body is only received
+                    if not checking.done():
+                        await _send_to_checker(loop, server_end, chunk, checking)
+                # The end of the upload, even for the workers forked while it was sent, which
+                # hold a copy of server_end
+                with contextlib.suppress(OSError):
+                    server_end.shutdown(socket.SHUT_WR)
+                return await checking
+            except BrokenProcessPool:
+                # A checker died: the pool cannot run any other task
+                self.pool = self._new_pool()
+                return {"filename": filename, "is_valid": False,
+                        "message": "The checker of {} failed".format(filename)}
+            finally:
+                server_end.close()
+                if not checking.done():
+                    await asyncio.wait((checking,))
+                checker_end.close()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            headers = {}
+            for header in header_lines:
+                name, _, value = header.partition(":")
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            try:
+                try:
+                    method, target, _ = request_line.split(" ", 2)
+                except ValueError:
+                    raise BadRequest(400, "bad request line")
+                if not target.startswith("/validate/"):
+                    raise BadRequest(404, "POST prediction files to /validate/<file name>")
+                if method != "POST":
+                    raise BadRequest(405, "POST prediction files to /validate/<file name>")
+                filename = unquote(target[len("/validate/"):]).split("/")[-1]
+                if not uncompressed_path(filename).endswith(".txt"):
+                    raise BadRequest(400, "Only txt files, possibly compressed, can be validated as they are "
+                                          "uploaded, not {}".format(filename))
+                status, reply = 200, await self.validate_upload(filename, _read_body(reader, headers))
+            except BadRequest as e:
+                status, reply = e.status, {"error": str(e)}
+            body = json.dumps(reply).encode()
+            writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                         b"Connection: close\r\n\r\n" % (status, _REASONS[status].encode(), len(body)) + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=0):
+        """ The asyncio server of the service, listening on host and port (0: any free port) """
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_SIZE)
+
+
+def serve_http(port, host=DEFAULT_HOST, workers=None, **checks):
+    """ Serves validation requests on host and port until interrupted """
+    async def run():
+        service = ValidationService(checks, workers)
+        try:
+            server = await service.start(host, port)
+            print("Validating submissions POSTed to http://{}:{}/validate/<file name>".format(host, port),
+                  flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
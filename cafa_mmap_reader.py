@@ -0,0 +1,104 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import mmap
+
+'''
+Memory-mapped reading of plain-text submissions.
+
+MappedTextFile iterates over the lines of a file as bytes, straight from the page cache,
+so no str object is made per line: the checkers only decode the lines they have to report
+on. Any byte range can also be read or iterated over, for the modes that split a file.
+'''
+
+
+class MappedTextFile(object):
+    """
+    Read-only, memory-mapped view of a text file that can be used in place of the handle
+    returned by open(filepath, "rb"): it iterates over lines, has read() and a name.
+    """
+
+    def __init__(self, filepath):
+        self.name = filepath
+        self._handle = open(filepath, "rb")
+        try:
+            self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = None
+        self.size = len(self._map) if self._map is not None else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._handle.close()
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def read(self, size=-1):
+        """ Sequential read from the current position, like a binary file handle """
+        if self._map is None:
+            return b""
+        return self._map.read(size)
+
+    def update_digest(self, digest):
+        """ Feeds the whole file to a hashlib object, without copying it """
+        if self._map is not None:
+            digest.update(self._map)
+
+    def read_range(self, start, end):
+        """ Bytes from start (included) to end (excluded) """
+        if self._map is None:
+            return b""
+        return self._map[start:end]
+
+    def next_line_start(self, offset):
+        """ Offset of the first line starting at or after offset """
+        if offset <= 0 or self._map is None:
+            return 0
+        newline = self._map.find(b"\n", offset - 1)
+        return self.size if newline == -1 else newline + 1
+
+    def iter_lines(self, start=0, end=None):
+        """
+        Lines (as bytes, with their newline) starting in [start, end). start should be a line
+        start, see next_line_start.
+        """
+        if self._map is None:
+            return
+        if end is None:
+            end = self.size
+        readline = self._map.readline
+        self._map.seek(start)
+        position = start
+        if end >= self.size:
+            # No bound to check but the end of the file
+            for line in iter(readline, b""):
+                yield line
+            return
+        while position < end:
+            line = readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
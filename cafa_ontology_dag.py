@@ -0,0 +1,369 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from cafa_term_index import hash_obo, obo_term_number, write_cache, DEFAULT_CACHE_DIR
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, without it the ancestors of each prediction are looked up one by one
+    np = None
+
+'''
+Check that, for every target, no predicted term scores higher than a predicted ancestor.
+
+The is_a and part_of edges of an OBO file are closed transitively once, and the ancestors of
+every term are stored in CSR form: the ancestors of node i are ancestors[offsets[i]:offsets[i + 1]].
+Term IDs and alt_ids map to nodes through the sorted ids array and node_of, and terms holds the
+ID of every node. The arrays are
+cached on disk under the BLAKE2 hash of the OBO file, like the term index.
+
+Predictions are collected per model as (target, term, score, line) arrays. At the end of the
+model, every (prediction, ancestor) pair is looked up at once among the sorted (target, term)
+keys of the model, so the graph is never walked per prediction.
+'''
+
+CACHE_MAGIC = b"CAFADAG3"
+HEADER = struct.Struct("<8sQQQ")
+# Relations along which scores must not increase, as for CAFA propagation
+PARENT_RELATIONS = ("part_of",)
+# (prediction, ancestor) pairs looked up at once
+PAIRS_PER_BATCH = 1 << 20
+
+# Score in hundredths of every confidence a valid prediction record can have, as str and bytes
+SCORES = {}
+for score in range(101):
+    SCORES["%d.%02d" % divmod(score, 100)] = SCORES[b"%d.%02d" % divmod(score, 100)] = score
+del score
+
+obo_parent_pattern = re.compile(r"^(?:is_a:|relationship:\s*(\S+))\s*(\S+)")
+obo_id_pattern = re.compile(r"^(id|alt_id):\s*(\S+)")
+
+propagation_violation = namedtuple(
+    "propagation_violation",
+    ("line_num", "target", "term", "score", "ancestor", "ancestor_score", "ancestor_line_num")
+)
+
+# DAGs already loaded by this process, by (obo path, size, mtime, prefix)
+_loaded_dags = {}
+
+
+def parse_obo_parents(obo_path, prefix):
+    """
+    ({term: [parent terms]}, {alt_id: term}) of the non-obsolete [Term] stanzas, terms as
+    numbers. Parents are those of is_a and of the PARENT_RELATIONS relationships.
+    """
+    parents = {}
+    alt_ids = {}
+
+    def add_stanza(stanza):
+        if stanza is not None and stanza["id"] is not None and not stanza["obsolete"]:
+            parents[stanza["id"]] = stanza["parents"]
+            for alt_id in stanza["alt_ids"]:
+                alt_ids[alt_id] = stanza["id"]
+
+    stanza = None
+    with open(obo_path, encoding="utf-8") as obo_handle:
+        for line in obo_handle:
+            if line.startswith("["):
+                add_stanza(stanza)
+                stanza = {"id": None, "alt_ids": [], "parents": [], "obsolete": False} \
+                    if line.strip() == "[Term]" else None
+                continue
+            if stanza is None:
+                continue
+            if line.startswith("is_obsolete:"):
+                stanza["obsolete"] = line.split(":", 1)[1].strip() == "true"
+                continue
+            match = obo_id_pattern.match(line)
+            if match is not None:
+                number = obo_term_number(match.group(2), prefix)
+                if match.group(1) == "id":
+                    stanza["id"] = number
+                elif number is not None:
+                    stanza["alt_ids"].append(number)
+                continue
+            match = obo_parent_pattern.match(line)
+            if match is not None and (match.group(1) is None or match.group(1) in PARENT_RELATIONS):
+                number = obo_term_number(match.group(2), prefix)
+                if number is not None:
+                    stanza["parents"].append(number)
+    add_stanza(stanza)
+    return parents, alt_ids
+
+
+def build_ancestor_arrays(parents, alt_ids):
+    """ (ids, node_of, offsets, ancestors, terms) arrays of the transitive closure of parents """
+    nodes = sorted(parents)
+    node_index = {term: i for i, term in enumerate(nodes)}
+    parent_nodes = [[node_index[parent] for parent in parents[term] if parent in node_index] for term in nodes]
+    closure = [None] * len(nodes)
+    opened = [False] * len(nodes)
+
+    for root in range(len(nodes)):
+        # Post-order depth-first walk, without recursion: ontologies are deeper than the
+        # recursion limit allows. A node is closed once all of its parents are, except along a
+        # cycle, which OBO files should not have
+        stack = [(root, False)]
+        while stack:
+            node, parents_closed = stack.pop()
+            if parents_closed:
+                ancestors = set(parent_nodes[node])
+                for parent in parent_nodes[node]:
+                    if closure[parent] is not None:
+                        ancestors |= closure[parent]
+                ancestors.discard(node)
+                closure[node] = ancestors
+            elif not opened[node]:
+                opened[node] = True
+                stack.append((node, True))
+                stack.extend((parent, False) for parent in parent_nodes[node] if not opened[parent])
+
+    offsets = array("I", [0])
+    ancestors = array("I")
+    for node_ancestors in closure:
+        ancestors.extend(sorted(node_ancestors))
+        offsets.append(len(ancestors))
+
+    ids_to_nodes = [(term, i) for i, term in enumerate(nodes)]
+    ids_to_nodes.extend((alt_id, node_index[term]) for alt_id, term in alt_ids.items()
+                        if term in node_index and alt_id not in node_index)
+    ids_to_nodes.sort()
+    return (array("I", [term for term, node in ids_to_nodes]), array("I", [node for term, node in ids_to_nodes]),
+            offsets, ancestors, array("I", nodes))
+
+
+class OntologyDAG(object):
+    """ Ancestor closure of an ontology, as arrays (or memoryviews) of unsigned ints """
+
+    def __init__(self, ids, node_of, offsets, ancestors, terms, prefix, source=None, digest=None):
+        self.ids = ids
+        self.node_of = node_of
+        self.offsets = offsets
+        self.ancestors = ancestors
+        self.terms = terms
+        self.prefix = prefix
+        # (obo_path, prefix, cache_dir) of a DAG made by load_ontology_dag
+        self.source = source
+        # BLAKE2 hash of that OBO file, which versions the DAG
+        self.digest = digest
+
+    def __reduce__(self):
+        # Worker processes map the cache again rather than receive a copy of the arrays
+        if self.source is not None:
+            return load_ontology_dag, self.source
+        return OntologyDAG, (array("I", self.ids), array("I", self.node_of), array("I", self.offsets),
+                             array("I", self.ancestors), array("I", self.terms), self.prefix)
+
+    @property
+    def n_nodes(self):
+        return len(self.offsets) - 1
+
+    def node(self, term_number):
+        """ Node of a term or alt_id number, or None """
+        i = bisect_left(self.ids, term_number)
+        if i < len(self.ids) and self.ids[i] == term_number:
+            return self.node_of[i]
+        return None
+
+    def ancestors_of(self, node):
+        return self.ancestors[self.offsets[node]:self.offsets[node + 1]]
+
+
+class PropagationChecker(object):
+    """
+    Collects the predictions of one file through add(); new_model() checks those of the model
+    so far and starts the next one. finish() returns, by line number, a propagation_violation
+    for each prediction scoring higher than a predicted ancestor of the same target (the first
+    such ancestor in node order). Only the max_reported with the lowest line numbers are kept;
+    n_violations counts them all. Terms missing from the DAG are not checked.
+    """
+
+    def __init__(self, dag, max_reported=1000):
+        self.dag = dag
+        self.max_reported = max_reported
+        self.target_index = {}
+        self.targets = []
+        # Number of every term seen, as str or bytes
+        self.term_number = {}
+        self.n_violations = 0
+        self._violations = []
+        self._new_model()
+
+    def _new_model(self):
+        self.prediction_targets = array("I")
+        self.term_numbers = array("I")
+        self.scores = array("B")
+        self.line_nums = array("Q")
+
+    def add(self, target, term, confidence, line_num):
+        """ Collects a prediction, fields as str or bytes, e.g. b"T100", b"GO:0008270" and b"0.80" """
+        if isinstance(target, str):
+            target = target.encode()
+        index = self.target_index.get(target)
+        if index is None:
+            index = self.target_index[target] = len(self.targets)
+            self.targets.append(target)
+        number = self.term_number.get(term)
+        if number is None:
+            number = self.term_number[term] = int(term[len(self.dag.prefix):])
+        self.prediction_targets.append(index)
+        self.term_numbers.append(number)
+        self.scores.append(SCORES[confidence])
+        self.line_nums.append(line_num)
+
+    def _violating_pairs(self):
+        """ (prediction, ancestor prediction) index pairs of the model, without numpy """
+        dag = self.dag
+        nodes = [dag.node(number) for number in self.term_numbers]
+        first_seen = {}
+        for i, (target, node) in enumerate(zip(self.prediction_targets, nodes)):
+            if node is not None:
+                first_seen.setdefault((target, node), i)
+        pairs = []
+        for i, (target, node) in enumerate(zip(self.prediction_targets, nodes)):
+            if node is None:
+                continue
+            for ancestor in dag.ancestors_of(node):
+                j = first_seen.get((target, ancestor))
+                if j is not None and self.scores[j] < self.scores[i]:
+                    pairs.append((i, j))
+                    break
+        return pairs
+
+    def _violating_pairs_np(self):
+        """ Same as _violating_pairs, every (prediction, ancestor) pair being looked up at once """
+        dag = self.dag
+        ids = np.frombuffer(dag.ids, dtype=np.uint32)
+        if not ids.size:
+            return []
+        numbers = np.frombuffer(self.term_numbers, dtype=np.uint32)
+        positions = np.minimum(np.searchsorted(ids, numbers), ids.size - 1)
+        rows = np.flatnonzero(ids[positions] == numbers)
+        nodes = np.frombuffer(dag.node_of, dtype=np.uint32)[positions[rows]].astype(np.int64)
+        targets = np.frombuffer(self.prediction_targets, dtype=np.uint32)[rows].astype(np.int64)
+        scores = np.frombuffer(self.scores, dtype=np.uint8)[rows]
+
+        # Sorted (target, node) keys; of a pair predicted twice, the first prediction is found
+        keys = targets * dag.n_nodes + nodes
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        offsets = np.frombuffer(dag.offsets, dtype=np.uint32).astype(np.int64)
+        ancestors = np.frombuffer(dag.ancestors, dtype=np.uint32)
+        starts = offsets[nodes]
+        lengths = offsets[nodes + 1] - starts
+        ends = np.cumsum(lengths)
+
+        pairs = []
+        first = 0
+        while first < rows.size:
+            # Predictions whose ancestors add up to about PAIRS_PER_BATCH
+            done = ends[first] - lengths[first]
+            last = max(int(np.searchsorted(ends, done + PAIRS_PER_BATCH, side="right")), first + 1)
+            batch_lengths = lengths[first:last]
+            n_pairs = int(batch_lengths.sum())
+            if n_pairs:
+                children = np.repeat(np.arange(first, last), batch_lengths)
+                within = np.arange(n_pairs) - np.repeat(np.cumsum(batch_lengths) - batch_lengths, batch_lengths)
+                ancestor_keys = targets[children] * dag.n_nodes + ancestors[starts[children] + within]
+                found = np.minimum(np.searchsorted(sorted_keys, ancestor_keys), sorted_keys.size - 1)
+                ancestor_rows = order[found]
+                bad = np.flatnonzero((sorted_keys[found] == ancestor_keys) & (scores[ancestor_rows] < scores[children]))
+                # The first ancestor of each child: pairs come in node order within a child
+                bad_children, first_bad = np.unique(children[bad], return_index=True)
+                pairs.extend(zip(rows[bad_children].tolist(), rows[ancestor_rows[bad[first_bad]]].tolist()))
+            first = last
+        return pairs
+
+    def check_model(self):
+        """ Checks the predictions collected since the last call """
+        pairs = self._violating_pairs() if np is None else self._violating_pairs_np()
+        self.n_violations += len(pairs)
+        pairs.sort(key=lambda pair: self.line_nums[pair[0]])
+        prefix = self.dag.prefix
+        for i, j in pairs[:self.max_reported]:
+            self._violations.append(propagation_violation(
+                self.line_nums[i], self.targets[self.prediction_targets[i]].decode(),
+                "%s%07d" % (prefix, self.term_numbers[i]), self.scores[i],
+                "%s%07d" % (prefix, self.term_numbers[j]), self.scores[j], self.line_nums[j]))
+        self._violations = sorted(self._violations)[:self.max_reported]
+        self._new_model()
+
+    def new_model(self, model):
+        self.check_model()
+
+    def finish(self):
+        """ The reported propagation_violations, by line number """
+        self.check_model()
+        return self._violations
+
+    def describe(self, violation):
+        return "%s of %s scores %.2f, more than its ancestor %s at %.2f in line %s" % (
+            violation.term, violation.target, violation.score / 100.0, violation.ancestor,
+            violation.ancestor_score / 100.0, violation.ancestor_line_num)
+
+
+def _cache_blocks(ids, node_of, offsets, ancestors, terms):
+    return [HEADER.pack(CACHE_MAGIC, len(ids), len(offsets), len(ancestors)),
+            ids.tobytes(), node_of.tobytes(), offsets.tobytes(), ancestors.tobytes(), terms.tobytes()]
+
+
+def open_cache(cache_path):
+    """ Memory-maps a cache file into (ids, node_of, offsets, ancestors, terms), None if missing or not a cache """
+    try:
+        with open(cache_path, "rb") as cache_handle:
+            mapped = mmap.mmap(cache_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER.size:
+        mapped.close()
+        return None
+    magic, n_ids, n_offsets, n_ancestors = HEADER.unpack(mapped[:HEADER.size])
+    if magic != CACHE_MAGIC or len(mapped) != HEADER.size + 4 * (2 * n_ids + 2 * n_offsets - 1 + n_ancestors):
+        mapped.close()
+        return None
+    view = memoryview(mapped)[HEADER.size:].cast("I")
+    sizes = (n_ids, n_ids, n_offsets, n_ancestors, n_offsets - 1)
+    starts = [sum(sizes[:i]) for i in range(len(sizes))]
+    return tuple(view[start:start + size] for start, size in zip(starts, sizes))
+
+
+def load_ontology_dag(obo_path, prefix, cache_dir=None):
+    """
+    OntologyDAG of the prefix terms of obo_path. The OBO is only parsed when its cache is
+    missing from cache_dir (default: ~/.cache/cafa_format_checker); within a process, an
+    unchanged OBO is not even hashed again.
+    """
+    stat = os.stat(obo_path)
+    memo_key = (os.path.abspath(obo_path), stat.st_size, stat.st_mtime_ns, prefix)
+    dag = _loaded_dags.get(memo_key)
+    if dag is not None:
+        return dag
+
+    digest = hash_obo(obo_path)
+    cache_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "%s-%s.dag" % (prefix.rstrip(":").lower(), digest))
+    arrays = open_cache(cache_path)
+    if arrays is None:
+        write_cache(cache_path, *_cache_blocks(*build_ancestor_arrays(*parse_obo_parents(obo_path, prefix))))
+        arrays = open_cache(cache_path)
+
+    dag = _loaded_dags[memo_key] = OntologyDAG(*arrays, prefix=prefix, source=(obo_path, prefix, cache_dir),
+                                               digest=digest)
+    return dag
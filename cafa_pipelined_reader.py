@@ -0,0 +1,194 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import importlib
+import io
+
+'''
+Pipelined reading of compressed submissions, such as zip members.
+
+A reader thread reads (and so decompresses) the file in large blocks into a bounded queue,
+while the checker splits each block into lines and parses them. zlib, bz2 and lzma release
+the GIL while they inflate, so the two stages overlap, and at most DEFAULT_DEPTH blocks are
+waiting in memory.
+
+Text submissions compressed with gzip, bzip2 or xz are recognised by their first bytes and
+decompressed the same way, as a stream: they never go to disk, nor whole into memory.
+
+The compression modules, and threading, are only imported once a file needs them, so that
+checking a plain text file does not load them.
+'''
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_DEPTH = 4
+
+# Put in the queue after the last block
+_END = None
+
+# Magic bytes of the compressed text files, and the name of the module that opens them
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "lzma"),
+)
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".xz")
+
+
+def import_compression(name):
+    """ The compression module called name, or None when Python was built without it """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def compression_module(filepath):
+    """ gzip, bz2 or lzma if filepath starts with their magic bytes (None if Python was built
+    without it), else None """
+    try:
+        with open(filepath, "rb") as handle:
+            head = handle.read(6)
+    except OSError:
+        return None
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return import_compression(name)
+    return None
+
+
+def uncompressed_path(filepath):
+    """ filepath without its compression suffix, e.g. ateam_1_9606_go.txt for ateam_1_9606_go.txt.gz """
+    for suffix in COMPRESSION_SUFFIXES:
+        if filepath.endswith(suffix):
+            return filepath[:-len(suffix)]
+    return filepath
+
+
+class PipelinedReader(object):
+    """
+    Binary handle read ahead by a thread, to be used in place of handle: it iterates over
+    lines (bytes, split on b"\\n" only), has read(), a name and seek(0) if handle can seek.
+    It must be closed, or used as a context manager, to stop the thread.
+    """
+
+    def __init__(self, handle, block_size=DEFAULT_BLOCK_SIZE, depth=DEFAULT_DEPTH):
+        self.handle = handle
+        self.name = getattr(handle, "name", None)
+        self.block_size = block_size
+        self.depth = depth
+        self._thread = None
+        self._queue = None
+        self._stop = None
+        self._done = False
+        # Bytes of the last block not returned yet
+        self._buffer = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self):
+        import queue
+        import threading
+        self._queue = queue.Queue(self.depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_blocks, args=(self._queue, self._stop), daemon=True)
+        self._thread.start()
+
+    def _read_blocks(self, blocks, stop):
+        try:
+            while not stop.is_set():
+                block = self.handle.read(self.block_size)
+                self._put(blocks, stop, block or _END)
+                if not block:
+                    return
+        except Exception as e:
+            self._put(blocks, stop, e)
+
+    @staticmethod
+    def _put(blocks, stop, item):
+        import queue
+        # Gives up once the reader is closed, rather than wait for room forever
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _next_block(self):
+        """ The next block read by the thread, or None at the end of the file """
+        if self._done:
+            return None
+        if self._thread is None:
+            self._start()
+        block = self._queue.get()
+        if isinstance(block, Exception):
+            self._done = True
+            raise block
+        if block is _END:
+            self._done = True
+        return block
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """ Goes back to the start of the file, the only position the reader can seek to """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("a PipelinedReader can only seek to the start")
+        self.close()
+        self.handle.seek(0)
+        self._done = False
+        self._buffer = b""
+        return 0
+
+    def read(self, size=-1):
+        """ Sequential read, like a binary file handle """
+        chunks = [self._buffer]
+        n_bytes = len(self._buffer)
+        while size < 0 or n_bytes < size:
+            block = self._next_block()
+            if block is None:
+                break
+            chunks.append(block)
+            n_bytes += len(block)
+        data = b"".join(chunks)
+        if 0 <= size < len(data):
+            self._buffer = data[size:]
+            return data[:size]
+        self._buffer = b""
+        return data
+
+    def __iter__(self):
+        # Blocks of a line that goes on over several of them, joined once it ends, so that a
+        # long line is not copied again with every block
+        pending = [self._buffer] if self._buffer else []
+        self._buffer = b""
+        while True:
+            block = self._next_block()
+            if block is None:
+                if pending:
+                    yield b"".join(pending)
+                return
+            pending.append(block)
+            if b"\n" not in block:
+                continue
+            # The lines of a whole block are split at once; the last one goes on in the next block
+            lines = io.BytesIO(b"".join(pending)).readlines()
+            pending = [] if lines[-1].endswith(b"\n") else [lines.pop()]
+            yield from lines
@@ -0,0 +1,249 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cafa_record_engine import STATE_BY_KEYWORD
+from cafa_ontology_dag import SCORES, np
+from cafa_pipelined_reader import compression_module, uncompressed_path
+from cafa_validation_utils import validate_filename, TAR_SUFFIXES
+
+'''
+Propagation of a valid prediction file: every ancestor of a predicted term (see
+cafa_ontology_dag) is given the highest score of its predicted descendants.
+
+The file is read as a stream of target blocks, the prediction records of one target in one
+model, which must follow each other. Blocks are sent in batches of about BATCH_LINES lines
+to worker processes and written back in file order, so memory is bounded by a few batches
+(or the largest target). The other records are copied as they are; terms missing from the
+ontology are copied without being propagated.
+'''
+
+# Prediction records per batch of target blocks
+BATCH_LINES = 50000
+
+# OntologyDAG of a propagation worker process, see propagate_lines
+_worker_dag = None
+
+
+def _set_worker_dag(dag):
+    global _worker_dag
+    _worker_dag = dag
+
+
+def _format_prediction(target, term, score):
+    return b"%s\t%s\t%d.%02d\n" % (target, term, score // 100, score % 100)
+
+
+def propagate_target(dag, target, terms, confidences):
+    """ Propagated prediction records (bytes) of target, given its terms and confidences as bytes """
+    prefix = dag.prefix.encode()
+    numbers = [int(term[len(prefix):]) for term in terms]
+    scores = [SCORES[confidence] for confidence in confidences]
+    lines = []
+
+    if np is None:
+        best = {}
+        for term, number, score in zip(terms, numbers, scores):
+            node = dag.node(number)
+            if node is None:
+                lines.append(_format_prediction(target, term, score))
+                continue
+            for ancestor in [node] + list(dag.ancestors_of(node)):
+                if best.get(ancestor, -1) < score:
+                    best[ancestor] = score
+        out_nodes = sorted(best)
+        out_scores = [best[node] for node in out_nodes]
+    else:
+        ids = np.frombuffer(dag.ids, dtype=np.uint32)
+        numbers = np.array(numbers, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(ids, numbers), max(ids.size - 1, 0))
+        known = ids[positions] == numbers if ids.size else np.zeros(numbers.size, dtype=bool)
+        for i in np.flatnonzero(~known).tolist():
+            lines.append(_format_prediction(target, terms[i], scores[i]))
+
+        nodes = np.frombuffer(dag.node_of, dtype=np.uint32)[positions[known]].astype(np.int64)
+        node_scores = np.array(scores, dtype=np.int64)[known]
+        offsets = np.frombuffer(dag.offsets, dtype=np.uint32).astype(np.int64)
+        starts = offsets[nodes]
+        lengths = offsets[nodes + 1] - starts
+        within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        ancestors = np.frombuffer(dag.ancestors, dtype=np.uint32)[np.repeat(starts, lengths) + within]
+
+        # Sorted (node, score) keys: the last key of each node has its highest score
+        keys = np.concatenate((nodes, ancestors)) * 128 + np.concatenate((node_scores, np.repeat(node_scores, lengths)))
+        keys.sort()
+        key_nodes = keys >> 7
+        last = np.ones(keys.size, dtype=bool)
+        last[:-1] = key_nodes[1:] != key_nodes[:-1]
+        out_nodes = key_nodes[last].tolist()
+        out_scores = (keys[last] & 127).tolist()
+
+    for node, score in zip(out_nodes, out_scores):
+        lines.append(_format_prediction(target, b"%s%07d" % (prefix, dag.terms[node]), score))
+    return lines
+
+
+def propagate_batch(dag, items):
+    """ Output of a batch: items are lines to copy, or (target, terms, confidences) blocks """
+    out = []
+    for item in items:
+        if isinstance(item, bytes):
+            out.append(item)
+        else:
+            out.extend(propagate_target(dag, *item))
+    return b"".join(out)
+
+
+def _propagate_worker_batch(items):
+    return propagate_batch(_worker_dag, items)
+
+
+def iter_batches(lines, batch_lines=BATCH_LINES):
+    """
+    Groups the lines (bytes) of a prediction file into batches for propagate_batch. Raises a
+    ValueError if the predictions of a target are split by those of another in a model.
+    """
+    batch = []
+    n_batch_lines = 0
+    block = None
+    # Targets whose block is over, in the current model
+    done_targets = set()
+
+    for line in lines:
+        fields = line.split()
+        if fields and fields[0].decode() not in STATE_BY_KEYWORD:
+            target = fields[0]
+            if block is None or block[0] != target:
+                if target in done_targets:
+                    raise ValueError("the predictions of %s are not all together, they cannot be "
+                                     "propagated one target at a time" % target.decode())
+                if block is not None:
+                    done_targets.add(block[0])
+                    if n_batch_lines >= batch_lines:
+                        yield batch
+                        batch, n_batch_lines = [], 0
+                block = (target, [], [])
+                batch.append(block)
+            block[1].append(fields[1])
+            block[2].append(fields[2])
+            n_batch_lines += 1
+            continue
+
+        if block is not None:
+            done_targets.add(block[0])
+            block = None
+        if fields and fields[0] == b"MODEL":
+            done_targets = set()
+        batch.append(line.rstrip(b"\r\n") + b"\n")
+    if batch:
+        yield batch
+
+
+def propagate_lines(lines, dag, workers=1, batch_lines=BATCH_LINES):
+    """
+    Propagated output (bytes, in order) of the lines of a valid prediction file, computed by
+    up to workers processes
+    """
+    batches = iter_batches(lines, batch_lines)
+    if workers <= 1:
+        for batch in batches:
+            yield propagate_batch(dag, batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_dag, initargs=(dag,)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_propagate_worker_batch, batch))
+            # Only a few batches are in flight, so memory does not grow with the file
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def propagate_file(infile, outfile, dag, workers=1):
+    """ Writes the propagation of the binary file infile to outfile """
+    for output in propagate_lines(infile, dag, workers):
+        outfile.write(output)
+
+
+def _member_output_path(output_dir, member_name):
+    """ Path in output_dir of the propagation of an archive member, under the member's relative path
+    so that members of the same name in different directories do not overwrite each other
+    """
+    relative_path = os.path.normpath(member_name)
+    if os.path.isabs(relative_path) or relative_path.split(os.sep)[0] == os.pardir:
+        raise ValueError("Cannot write the propagation of %s outside of %s" % (member_name, output_dir))
+    output_path = os.path.join(output_dir, relative_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return output_path
+
+
+def _propagate_prediction_file(parsed, infile, output_path, dags, workers):
+    """ Writes the propagation of infile, the prediction file parsed, to output_path, returns it """
+    dag = dags.get(parsed.ontology)
+    if dag is None:
+        raise ValueError("No ontology to propagate the %s predictions of %s" % (
+            parsed.ontology.upper(), parsed.filename))
+    with open(output_path, "wb") as outfile:
+        propagate_file(infile, outfile, dag, workers)
+    return output_path
+
+
+def propagate_submission(filepath, output_dir, dags, workers=None):
+    """
+    Writes a propagated copy of every prediction file of a valid submission (txt file, possibly
+    compressed, or zip or tar archive) to output_dir, under the same file name (without the
+    compression suffix), or relative path for archive members. dags maps ontologies to their
+    OntologyDAG. Returns the paths written.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    compression = compression_module(filepath)
+    written = []
+    if filepath.endswith(TAR_SUFFIXES):
+        # Imported here, cafa4_format_checker imports this module
+        from cafa4_format_checker import open_tar_archive
+        with open_tar_archive(filepath) as (tar_reader, seekable):
+            for member in tar_reader:
+                if (not member.isfile() or not member.name.endswith(".txt") or 'DS_Store' in member.name or
+                        '__MACOSX' in member.name):
+                    continue
+                with tar_reader.extractfile(member) as infile:
+                    written.append(_propagate_prediction_file(validate_filename(member.name), infile,
+                                                              _member_output_path(output_dir, member.name),
+                                                              dags, workers))
+    elif compression is not None:
+        parsed = validate_filename(uncompressed_path(filepath))
+        with compression.open(filepath, "rb") as infile:
+            written.append(_propagate_prediction_file(parsed, infile, os.path.join(output_dir, parsed.filename),
+                                                      dags, workers))
+    elif filepath.endswith(".txt"):
+        parsed = validate_filename(filepath)
+        with open(filepath, "rb") as infile:
+            written.append(_propagate_prediction_file(parsed, infile, os.path.join(output_dir, parsed.filename),
+                                                      dags, workers))
+    else:
+        # The submission was validated, so its members are only listed, not checked again
+        with zipfile.ZipFile(filepath) as archive:
+            for name in archive.namelist():
+                if not name.endswith(".txt") or 'DS_Store' in name or '__MACOSX' in name:
+                    continue
+                with archive.open(name) as infile:
+                    written.append(_propagate_prediction_file(validate_filename(name), infile,
+                                                              _member_output_path(output_dir, name), dags, workers))
+    return written
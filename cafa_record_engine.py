@@ -0,0 +1,363 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import re
+from itertools import chain
+from collections import namedtuple
+from cafa_error_store import ERROR_CODE, classify_prediction_error
+
+'''
+The record state machine shared by the GO, HPO and DO checkers.
+
+Each ontology module describes itself with a record_spec (its record checks, the
+name of its prediction state and the section orders it accepts) and hands it to
+check_records, which owns the per-line loop.
+'''
+
+CAFA_VERSION = 4
+
+MAX_MODELS = 3
+MAX_ACCURACY_RECORDS = 3
+
+record_spec = namedtuple(
+    "record_spec",
+    (
+        # Short ontology label used in messages, e.g. "GO"
+        "label",
+        # Name of the prediction state as reported in the section list, e.g. "go_prediction"
+        "prediction_state",
+        # Callable taking the filename and returning a dict of state -> check(inline)
+        "build_checks",
+        # Callable taking the list of visited states, returns True if their order is legal
+        "sections_valid",
+        # Human readable description of the expected section order
+        "sections_hint",
+        # (str, bytes) compiled full-line patterns of a valid prediction record,
+        # see compile_prediction_patterns
+        "prediction_patterns",
+    )
+)
+
+# Transition table: the first field of a record decides its state. Anything that
+# is not a keyword is a prediction record.
+STATE_BY_KEYWORD = {
+    "AUTHOR": "author",
+    "MODEL": "model",
+    "KEYWORDS": "keywords",
+    "ACCURACY": "accuracy",
+    "END": "end",
+}
+
+# AUTHOR and END are recorded every time they are seen so that repeated sections
+# show up in the section list; every other state is recorded on first sight only.
+REPEATABLE_STATES = ("author", "end")
+
+
+def compile_prediction_patterns(target_regex, term_regex):
+    """
+    Compiles the fast path for prediction records: one pattern matching a whole valid line
+    (target, term and a confidence of at most 1.00), for both str and bytes input.
+
+    Only lines the detailed prediction check would accept can match, so a line that does not
+    match simply falls back to that check, which builds the error message.
+    """
+    pattern = r"\s*(%s)\s+(%s)\s+(0\.[0-9][0-9]|1\.00)\s*" % (target_regex, term_regex)
+    return re.compile(pattern), re.compile(pattern.encode())
+
+
+def format_line_error(filename, line_num, errmsg):
+    return "Error in %s, line %s, %s" % (filename, line_num, errmsg)
+
+
+def format_sections_error(filename, visited_states, sections_hint):
+    errmsg = "Error in " + filename + "\n"
+    errmsg += "Sections found in the file: [" + ", ".join(visited_states) + "]\n"
+    errmsg += "file not formatted according to CAFA %s specs\n" % CAFA_VERSION
+    errmsg += "Check whether all these record types are in your file in the correct order\n"
+    errmsg += sections_hint
+    return errmsg
+
+
+class RecordStateMachine(object):
+    """
+    Tracks the non-prediction records of a submission: the sections visited, the number of
+    models and the number of ACCURACY records in the current model.
+
+    Prediction records are stateless apart from being recorded as a section once, so the hot
+    loop in check_records validates them itself and only calls visit_prediction() for the
+    first one.
+
+    Given an ErrorStore as errors, bad records are recorded there instead of being returned,
+    and are then handled as if they were correct so that the rest of the file is checked.
+    Given a DuplicateDetector as duplicates, every valid prediction record is added to it and
+    repeated (target, term) pairs are reported by finish(). Given a TermIndex as terms, the
+    term of every prediction record must be in it; known_terms holds those already found.
+    Likewise with a TargetSet as targets and known_targets, and finish() then reports the
+    share of the targets of the taxonomy that were predicted. Given a TargetTermCounter as
+    term_counts, the valid prediction records are counted per target and model, and finish()
+    reports the targets with too many terms. Given a PropagationChecker as propagation, finish()
+    reports the predictions scoring higher than a predicted ancestor.
+    """
+
+    def __init__(self, spec, filename, errors=None, duplicates=None, terms=None, targets=None, term_counts=None,
+                 propagation=None):
+        self.spec = spec
+        self.filename = filename
+        self.errors = errors
+        self.duplicates = duplicates
+        self.terms = terms
+        self.known_terms = set()
+        self.targets = targets
+        self.known_targets = set()
+        self.term_counts = term_counts
+        self.propagation = propagation
+        self.checks = spec.build_checks(filename)
+        self.visited_states = []
+        self.n_models = 0
+        self.n_accuracy = 0
+        self.prediction_seen = False
+
+    def visit(self, state):
+        if state in REPEATABLE_STATES or state not in self.visited_states:
+            self.visited_states.append(state)
+
+    def visit_prediction(self):
+        self.prediction_seen = True
+        self.visit(self.spec.prediction_state)
+
+    def error(self, code, line_num, errmsg, column=0):
+        """ The error message to return for a bad record, or None once it is in self.errors """
+        if self.errors is None:
+            return format_line_error(self.filename, line_num, errmsg)
+        self.errors.add(code, line_num, column, lambda: format_line_error(self.filename, line_num, errmsg))
+        return None
+
+    def check_target(self, target, line_num, inline):
+        """ Checks a target missing from known_targets. Returns an error message, or None """
+        problem = self.targets.check(target)
+        if problem is None:
+            self.known_targets.add(target)
+            return None
+        code, errmsg = problem
+        if not isinstance(inline, str):
+            inline = inline.decode()
+        return self.error(ERROR_CODE[code], line_num, "%s prediction: %s" % (self.spec.label, errmsg),
+                          len(inline) - len(inline.lstrip()) + 1)
+
+    def check_term(self, term, line_num, inline):
+        """ Looks up a term missing from known_terms. Returns an error message, or None """
+        if self.terms.has_term(term):
+            self.known_terms.add(term)
+            return None
+        if not isinstance(term, str):
+            term, inline = term.decode(), inline.decode()
+        return self.error(ERROR_CODE["unknown_term"], line_num,
+                          "%s prediction: %s is not a term of the ontology" % (self.spec.label, term),
+                          inline.find(term) + 1)
+
+    def feed_record(self, state, inline, line_num):
+        """ Validates one non-prediction record. Returns an error message, or None """
+        errmsg = None
+        if state == "model":
+            self.n_models += 1
+            self.n_accuracy = 0
+            if self.term_counts is not None:
+                self.term_counts.new_model(self.n_models)
+            if self.propagation is not None:
+                self.propagation.new_model(self.n_models)
+            if self.n_models > MAX_MODELS:
+                errmsg = self.error(ERROR_CODE["too_many_models"], line_num, "Too many models. Only up to 3 allowed")
+        elif state == "accuracy":
+            self.n_accuracy += 1
+            if self.n_accuracy > MAX_ACCURACY_RECORDS:
+                errmsg = self.error(ERROR_CODE["too_many_accuracy"], line_num, "ACCURACY: too many ACCURACY records")
+        if errmsg is not None:
+            return errmsg
+
+        correct, errmsg = self.checks[state](inline)
+        if not correct:
+            errmsg = self.error(ERROR_CODE[state], line_num, errmsg)
+            if errmsg is not None:
+                return errmsg
+        self.visit(state)
+        return None
+
+    def feed_line(self, inline, line_num):
+        """
+        Slow path for one line of any kind: decodes and splits it, then validates it according
+        to its state. Returns an error message, or None
+        """
+        if not isinstance(inline, str):
+            inline = inline.decode()
+        fields = inline.split()
+        state = STATE_BY_KEYWORD.get(fields[0]) if fields else None
+
+        if state is not None:
+            return self.feed_record(state, inline, line_num)
+
+        correct, errmsg = self.checks[self.spec.prediction_state](inline)
+        if not correct:
+            if self.errors is None:
+                return format_line_error(self.filename, line_num, errmsg)
+            code, column = classify_prediction_error(errmsg, inline)
+            self.error(code, line_num, errmsg, column)
+        else:
+            if self.targets is not None and fields[0] not in self.known_targets:
+                errmsg = self.check_target(fields[0], line_num, inline)
+                if errmsg is not None:
+                    return errmsg
+            if self.terms is not None and fields[1] not in self.known_terms:
+                errmsg = self.check_term(fields[1], line_num, inline)
+                if errmsg is not None:
+                    return errmsg
+            if self.duplicates is not None:
+                self.duplicates.add(fields[0], fields[1], self.n_models, line_num)
+            if self.term_counts is not None:
+                self.term_counts.add(fields[0], line_num)
+            if self.propagation is not None:
+                self.propagation.add(fields[0], fields[1], fields[2], line_num)
+        if not self.prediction_seen:
+            self.visit_prediction()
+        return None
+
+    def finish_duplicates(self):
+        """ Reports the repeated predictions. Returns an error message, or None """
+        duplicates = self.duplicates.finish()
+        code = ERROR_CODE["duplicate_prediction"]
+        for duplicate in duplicates:
+            errmsg = self.error(code, duplicate.line_num, self.duplicates.describe(duplicate))
+            if errmsg is not None:
+                return errmsg
+        if self.errors is not None:
+            # Those past max_reported are only counted
+            self.errors.counts[code] += self.duplicates.n_duplicates - len(duplicates)
+        return None
+
+    def finish_term_counts(self):
+        """ Reports the targets with too many terms. Returns an error message, or None """
+        code = ERROR_CODE["too_many_terms"]
+        for violation in self.term_counts.finish():
+            errmsg = self.error(code, violation.line_num,
+                                "%s prediction: %s" % (self.spec.label, self.term_counts.describe(violation)))
+            if errmsg is not None:
+                return errmsg
+        return None
+
+    def finish_propagation(self):
+        """ Reports the predictions scoring higher than an ancestor. Returns an error message, or None """
+        violations = self.propagation.finish()
+        code = ERROR_CODE["score_above_ancestor"]
+        for violation in violations:
+            errmsg = self.error(code, violation.line_num,
+                                "%s prediction: %s" % (self.spec.label, self.propagation.describe(violation)))
+            if errmsg is not None:
+                return errmsg
+        if self.errors is not None:
+            # Those past max_reported are only counted
+            self.errors.counts[code] += self.propagation.n_violations - len(violations)
+        return None
+
+    def finish(self):
+        if self.duplicates is not None:
+            errmsg = self.finish_duplicates()
+            if errmsg is not None:
+                return False, errmsg
+        if self.term_counts is not None:
+            errmsg = self.finish_term_counts()
+            if errmsg is not None:
+                return False, errmsg
+        if self.propagation is not None:
+            errmsg = self.finish_propagation()
+            if errmsg is not None:
+                return False, errmsg
+        if not self.spec.sections_valid(self.visited_states):
+            errmsg = format_sections_error(self.filename, self.visited_states, self.spec.sections_hint)
+            if self.errors is None:
+                return False, errmsg
+            self.errors.add(ERROR_CODE["sections"], 0, 0, lambda: errmsg)
+        if self.errors is not None and self.errors.total:
+            return False, self.errors.report(self.filename)
+        message = "%s, passed the CAFA %s %s prediction format checker" % (
+            self.filename, CAFA_VERSION, self.spec.label)
+        if self.targets is not None:
+            message += "\n" + self.targets.coverage(self.known_targets)
+        return True, message
+
+
+def check_records(infile, filename, spec, errors=None, duplicates=None, terms=None, targets=None,
+                  term_counts=None, propagation=None):
+    """
+    Main loop shared by the ontology checkers: 1. identifies the state of each record through
+    the transition table; 2. calls the check registered for that state; 3. builds the error
+    report. Returns (correct, message) for the first bad record, or the verdict on the section
+    order once the whole file has been read.
+
+    infile iterates over the lines, str or bytes, of the file named filename in the messages,
+    and spec is the record_spec of its ontology. The cafa_checker of each ontology module is
+    this function with its RECORD_SPEC.
+
+    With an ErrorStore as errors, the whole file is read and the message is the report of
+    every error found (see ErrorStore.report). With a DuplicateDetector as duplicates, repeated
+    predictions are errors too, and so are terms missing from terms, a TermIndex, and targets
+    refused by targets, a TargetSet, and targets with too many terms if given a
+    TargetTermCounter as term_counts. With a PropagationChecker as propagation, so are
+    predictions scoring higher than a predicted ancestor of their term.
+    """
+    machine = RecordStateMachine(spec, filename, errors, duplicates, terms, targets, term_counts, propagation)
+    add_duplicate = None if duplicates is None else duplicates.add
+    count_term = None if term_counts is None else term_counts.add
+    add_propagation = None if propagation is None else propagation.add
+    # Terms are looked up in the index once each, then found in this set
+    known_terms = None if terms is None else machine.known_terms
+    known_targets = None if targets is None else machine.known_targets
+
+    lines = iter(infile)
+    first_line = next(lines, None)
+    if first_line is None:
+        return machine.finish()
+    str_pattern, bytes_pattern = spec.prediction_patterns
+    fast_match = (str_pattern if isinstance(first_line, str) else bytes_pattern).fullmatch
+
+    prediction_seen = False
+    line_num = 0
+    for inline in chain((first_line,), lines):
+        line_num += 1
+
+        # Fast path: a valid prediction record is matched as a whole, without decoding or
+        # splitting the line
+        match = fast_match(inline)
+        if match is not None:
+            if known_targets is not None and match[1] not in known_targets:
+                errmsg = machine.check_target(match[1], line_num, inline)
+                if errmsg is not None:
+                    return False, errmsg
+            if known_terms is not None and match[2] not in known_terms:
+                errmsg = machine.check_term(match[2], line_num, inline)
+                if errmsg is not None:
+                    return False, errmsg
+            if add_duplicate is not None:
+                add_duplicate(match[1], match[2], machine.n_models, line_num)
+            if count_term is not None:
+                count_term(match[1], line_num)
+            if add_propagation is not None:
+                add_propagation(match[1], match[2], match[3], line_num)
+            if not prediction_seen:
+                machine.visit_prediction()
+                prediction_seen = True
+            continue
+
+        errmsg = machine.feed_line(inline, line_num)
+        if errmsg is not None:
+            return False, errmsg
+        prediction_seen = machine.prediction_seen
+
+    return machine.finish()
@@ -0,0 +1,190 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+from collections import namedtuple
+from cafa_record_engine import RecordStateMachine, STATE_BY_KEYWORD, check_records
+from cafa_error_store import ERROR_CODE, ERROR_CODES, classify_prediction_error
+from cafa_mmap_reader import MappedTextFile
+
+'''
+Parallel validation of one large plain-text submission.
+
+The file is cut into shards at newline-aligned byte offsets and every shard is scanned by
+its own process. A shard only validates its prediction records, which need no state; the
+records that do (AUTHOR, MODEL, KEYWORDS, ACCURACY, END) are sent back as they are, in a
+shard_summary. The summaries are then replayed in file order through one
+RecordStateMachine, so the section order, the model and ACCURACY counts and the line number
+of the first error are those of a sequential run.
+
+When collecting every error, a shard sends back its first max_errors bad prediction records
+and only counts the others: they come after max_errors errors already, so they are past the
+cap of the ErrorStore they are merged into.
+'''
+
+# Below this size per shard, starting processes costs more than it saves
+MIN_SHARD_SIZE = 32 * 1024 * 1024
+
+shard_summary = namedtuple(
+    "shard_summary",
+    (
+        # Number of lines in the shard
+        "n_lines",
+        # (line number in the shard, line) in shard order. line is None for the first
+        # prediction record of the shard, otherwise the bytes of a line for the state
+        # machine: a non-prediction record, or a bad prediction record
+        "events",
+        # Per error code count of the bad prediction records left out of events, or None
+        "error_counts",
+        # Set of the targets found valid in the shard when checking targets, or None
+        "known_targets",
+    )
+)
+
+
+def shard_boundaries(handle, n_shards):
+    """ Byte offsets (start, end) of n_shards newline-aligned ranges covering handle """
+    offsets = [handle.next_line_start(handle.size * i // n_shards) for i in range(n_shards)]
+    offsets.append(handle.size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+
+def scan_shard(handle, start, end, filename, spec, max_errors=None, terms=None, targets=None):
+    """
+    Validates the prediction records of the lines starting in [start, end) of handle, their
+    terms if given a TermIndex as terms, and their targets if given a TargetSet as targets.
+    Stops at the first bad prediction record, or with max_errors set, keeps going and
+    counts those after the first max_errors.
+    """
+    fast_match = spec.prediction_patterns[1].fullmatch
+    prediction_check = spec.build_checks(filename)[spec.prediction_state]
+    known_terms = None if terms is None else set()
+    known_targets = None if targets is None else set()
+    events = []
+    error_counts = None if max_errors is None else [0] * len(ERROR_CODES)
+    n_errors = 0
+    prediction_seen = False
+    line_num = 0
+
+    for inline in handle.iter_lines(start, end):
+        line_num += 1
+        errmsg = None
+        # Error code of a bad record with no errmsg
+        code = None
+        match = fast_match(inline)
+        if match is not None:
+            bad, target, term = False, match[1], match[2]
+        else:
+            # Split as RecordStateMachine.feed_line does, so that lines get the same state
+            text = inline.decode()
+            fields = text.split()
+            if fields and fields[0] in STATE_BY_KEYWORD:
+                events.append((line_num, inline))
+                continue
+            correct, errmsg = prediction_check(text)
+            bad = not correct
+            if correct:
+                target, term = fields[0].encode(), fields[1]
+
+        if not bad and known_targets is not None and target not in known_targets:
+            problem = targets.check(target)
+            if problem is None:
+                known_targets.add(target)
+            else:
+                bad, code = True, ERROR_CODE[problem[0]]
+        if not bad and known_terms is not None and term not in known_terms:
+            if terms.has_term(term):
+                known_terms.add(term)
+            else:
+                bad, code = True, ERROR_CODE["unknown_term"]
+
+        if bad:
+            if max_errors is None:
+                # The state machine will report it, nothing after it matters
+                events.append((line_num, inline))
+                break
+            n_errors += 1
+            if n_errors <= max_errors:
+                # Replayed like any other, the state machine also sees a prediction in it
+                events.append((line_num, inline))
+                prediction_seen = True
+                continue
+            if errmsg is None:
+                error_counts[code] += 1
+            else:
+                error_counts[classify_prediction_error(errmsg, text)[0]] += 1
+        if not prediction_seen:
+            events.append((line_num, None))
+            prediction_seen = True
+
+    return shard_summary(line_num, events, error_counts, known_targets)
+
+
+def _scan_shard_file(filepath, start, end, filename, spec, max_errors, terms, targets):
+    with MappedTextFile(filepath) as handle:
+        return scan_shard(handle, start, end, filename, spec, max_errors, terms, targets)
+
+
+def merge_shard_summaries(summaries, filename, spec, errors=None, terms=None, targets=None):
+    """
+    Replays the shard summaries, in file order, through one RecordStateMachine, which
+    records its errors in errors if given
+    """
+    machine = RecordStateMachine(spec, filename, errors, terms=terms, targets=targets)
+    line_offset = 0
+    for summary in summaries:
+        if summary.known_targets is not None:
+            machine.known_targets.update(summary.known_targets)
+        if summary.error_counts is not None:
+            for code, count in enumerate(summary.error_counts):
+                errors.counts[code] += count
+        for line_num, inline in summary.events:
+            if inline is None:
+                if not machine.prediction_seen:
+                    machine.visit_prediction()
+                continue
+            errmsg = machine.feed_line(inline, line_offset + line_num)
+            if errmsg is not None:
+                return False, errmsg
+        line_offset += summary.n_lines
+    return machine.finish()
+
+
+def sharded_cafa_checker(handle, filename, spec, workers=None, min_shard_size=MIN_SHARD_SIZE, errors=None,
+                         terms=None, targets=None):
+    """
+    Same verdict as cafa_record_engine.check_records(handle, filename, spec, errors, terms=terms,
+    targets=targets), with the file split across up to workers processes (default: one per CPU).
+    handle is a MappedTextFile; files too small for two shards of min_shard_size are checked in
+    this process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    n_shards = min(workers, handle.size // max(min_shard_size, 1))
+    if n_shards <= 1:
+        return check_records(handle, filename, spec, errors, terms=terms, targets=targets)
+
+    max_errors = None if errors is None else errors.max_errors
+    boundaries = shard_boundaries(handle, n_shards)
+    # Imported here, small files never need it
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=len(boundaries)) as pool:
+        futures = [pool.submit(_scan_shard_file, handle.name, start, end, filename, spec, max_errors, terms,
+                               targets)
+                   for start, end in boundaries]
+        # Shards are merged as they come in, in file order, and the rest are dropped as soon
+        # as the verdict is known
+        summaries = (future.result() for future in futures)
+        verdict = merge_shard_summaries(summaries, filename, spec, errors, terms, targets)
+        for future in futures:
+            future.cancel()
+    return verdict
@@ -0,0 +1,80 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from array import array
+from collections import namedtuple
+
+'''
+Count of the terms predicted per target and model, checked against the CAFA cap.
+
+Targets are interned as they are first seen: each gets an index in order of appearance, and
+the counts of the current model are an array of integers at those indices. Predictions do
+not have to be grouped by target. Only the targets over the cap are remembered past the end
+of their model.
+'''
+
+# CAFA accepts at most this many terms per target in a model
+DEFAULT_MAX_TERMS = 1500
+
+term_count_violation = namedtuple("term_count_violation", ("line_num", "target", "model", "n_terms"))
+
+
+class TargetTermCounter(object):
+    """
+    Counts the predictions of one file through add(), per target and model; new_model() starts
+    the counts of the next model. finish() returns a term_count_violation per target having more
+    than max_terms in a model, with the line of its first prediction over the cap.
+    """
+
+    def __init__(self, max_terms=DEFAULT_MAX_TERMS):
+        self.max_terms = max_terms
+        self.target_index = {}
+        self.targets = []
+        self.counts = array("I")
+        self.model = 0
+        # (line_num, target index, model) of the first prediction over the cap of a target
+        self._over = []
+        self._violations = []
+
+    def add(self, target, line_num):
+        """ Counts a prediction of target, as str or bytes """
+        if isinstance(target, str):
+            target = target.encode()
+        index = self.target_index.get(target)
+        if index is None:
+            index = self.target_index[target] = len(self.targets)
+            self.targets.append(target)
+            self.counts.append(0)
+        count = self.counts[index] + 1
+        self.counts[index] = count
+        if count == self.max_terms + 1:
+            self._over.append((line_num, index, self.model))
+
+    def _close_model(self):
+        for line_num, index, model in self._over:
+            self._violations.append(term_count_violation(line_num, self.targets[index].decode(), model,
+                                                         self.counts[index]))
+        self._over = []
+
+    def new_model(self, model):
+        self._close_model()
+        self.model = model
+        self.counts = array("I", bytes(4 * len(self.targets)))
+
+    def finish(self):
+        """ The term_count_violations, by line number """
+        self._close_model()
+        return sorted(self._violations)
+
+    def describe(self, violation):
+        return "%s has %s terms predicted in model %s, at most %s are allowed" % (
+            violation.target, violation.n_terms, violation.model, self.max_terms)
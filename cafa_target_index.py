@@ -0,0 +1,222 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from cafa_term_index import write_cache, DEFAULT_CACHE_DIR
+
+'''
+Index of the released CAFA targets, to check that predicted targets exist and belong to the
+taxonomy of the file.
+
+CAFA target IDs are T<taxonomy><7 digit serial>, e.g. T96060000001 for human. The IDs in the
+headers of the target FASTA files are split into a group ("T9606") and a serial number, and
+every group is kept as a sorted array of serials. The arrays are cached on disk under the
+BLAKE2 hash of the FASTA files, so later runs only hash the FASTA files and memory-map the
+cache.
+'''
+
+SERIAL_DIGITS = 7
+CACHE_MAGIC = b"CAFATGT1"
+
+target_id_pattern = re.compile(r"(M|T|EFI)([0-9]{5,20})$")
+
+# Indexes already loaded by this process, by ((fasta path, size, mtime), ...)
+_loaded_indexes = {}
+
+
+def split_target(target):
+    """
+    (group, serial) of a target ID as str or bytes, or None if it is not one. T96060000001 is
+    ("T9606", 1); IDs of at most 7 digits are grouped by prefix and length, e.g. ("M/5", 12345)
+    """
+    if not isinstance(target, str):
+        target = target.decode()
+    match = target_id_pattern.match(target)
+    if match is None:
+        return None
+    prefix, digits = match.groups()
+    if len(digits) > SERIAL_DIGITS:
+        return prefix + digits[:-SERIAL_DIGITS], int(digits[-SERIAL_DIGITS:])
+    return "%s/%s" % (prefix, len(digits)), int(digits)
+
+
+def target_taxonomy(target):
+    """ Taxonomy ID of a T target ID, or None """
+    group = split_target(target)
+    if group is None or not group[0].startswith("T") or "/" in group[0]:
+        return None
+    return int(group[0][1:])
+
+
+def hash_fasta_files(fasta_paths):
+    digest = hashlib.blake2b(digest_size=20)
+    for fasta_path in sorted(fasta_paths):
+        with open(fasta_path, "rb") as fasta_handle:
+            for block in iter(lambda: fasta_handle.read(1 << 20), b""):
+                digest.update(block)
+        # Moving a target from one file to the next is a different release
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def parse_fasta_targets(fasta_paths):
+    """ Sorted array of serials per group of the target IDs in the FASTA headers """
+    groups = {}
+    for fasta_path in fasta_paths:
+        with open(fasta_path, encoding="utf-8") as fasta_handle:
+            for line in fasta_handle:
+                if not line.startswith(">"):
+                    continue
+                fields = line[1:].split()
+                group = split_target(fields[0]) if fields else None
+                if group is not None:
+                    groups.setdefault(group[0], set()).add(group[1])
+    return {group: array("Q", sorted(serials)) for group, serials in groups.items()}
+
+
+def _cache_blocks(groups):
+    """ The cache file: magic, header size, JSON header of group -> (offset, count), serials """
+    header = {}
+    offset = 0
+    for group in sorted(groups):
+        header[group] = (offset, len(groups[group]))
+        offset += 8 * len(groups[group])
+    header = json.dumps(header).encode()
+    header += b" " * (-len(header) % 8)
+    blocks = [CACHE_MAGIC, struct.pack("<Q", len(header)), header]
+    blocks.extend(groups[group].tobytes() for group in sorted(groups))
+    return blocks
+
+
+def open_cache(cache_path):
+    """ Memory-maps a cache file into group -> serials, returns None if it is missing or not a cache """
+    try:
+        with open(cache_path, "rb") as cache_handle:
+            mapped = mmap.mmap(cache_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    start = len(CACHE_MAGIC) + 8
+    if len(mapped) < start or mapped[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        mapped.close()
+        return None
+    header_size, = struct.unpack("<Q", mapped[len(CACHE_MAGIC):start])
+    try:
+        header = json.loads(mapped[start:start + header_size].decode())
+    except ValueError:
+        mapped.close()
+        return None
+    data = memoryview(mapped)[start + header_size:]
+    groups = {}
+    for group, (offset, count) in header.items():
+        if offset + 8 * count > len(data):
+            return None
+        groups[group] = data[offset:offset + 8 * count].cast("Q")
+    return groups
+
+
+class TargetIndex(object):
+    """ Set of the released CAFA target IDs, as sorted arrays of serials per group """
+
+    def __init__(self, groups, source=None, digest=None):
+        self.groups = groups
+        # (fasta_paths, cache_dir) of an index made by load_target_index
+        self.source = source
+        # BLAKE2 hash of those FASTA files, which versions the index
+        self.digest = digest
+
+    def __reduce__(self):
+        # Worker processes map the cache again rather than receive a copy of the arrays
+        if self.source is not None:
+            return load_target_index, self.source
+        return TargetIndex, ({group: array("Q", serials) for group, serials in self.groups.items()},)
+
+    def __contains__(self, target):
+        group = split_target(target)
+        if group is None:
+            return False
+        serials = self.groups.get(group[0], ())
+        i = bisect_left(serials, group[1])
+        return i < len(serials) and serials[i] == group[1]
+
+    def n_targets(self, taxonomy):
+        return len(self.groups.get("T%s" % taxonomy, ()))
+
+    def for_taxonomy(self, taxonomy):
+        return TargetSet(self, int(taxonomy))
+
+
+class TargetSet(object):
+    """
+    The targets a file of the given taxonomy may predict: those of the index, with T targets
+    of that taxonomy only. When the index has no target of the taxonomy, only the taxonomy
+    of T targets is checked.
+    """
+
+    def __init__(self, index, taxonomy):
+        self.index = index
+        self.taxonomy = taxonomy
+        self.n_targets = index.n_targets(taxonomy)
+
+    def check(self, target):
+        """ None if the target may be predicted, otherwise (error code name, message) """
+        taxonomy = target_taxonomy(target)
+        if not isinstance(target, str):
+            target = target.decode()
+        if taxonomy is not None and taxonomy != self.taxonomy:
+            return "target_taxonomy", "%s is a target of taxonomy %s, not %s" % (target, taxonomy, self.taxonomy)
+        if self.n_targets and target not in self.index:
+            return "unknown_target", "%s is not a CAFA target" % target
+        return None
+
+    def coverage(self, known_targets):
+        """ Message on the share of the targets of the taxonomy found in known_targets """
+        if not self.n_targets:
+            return "No targets of taxonomy %s to compute the coverage" % self.taxonomy
+        # The line by line checker holds str or bytes, depending on the input
+        known_targets = {target if isinstance(target, str) else target.decode() for target in known_targets}
+        n_predicted = sum(1 for target in known_targets if target_taxonomy(target) == self.taxonomy)
+        return "Predicted %s of the %s targets of taxonomy %s (%.1f%%)" % (
+            n_predicted, self.n_targets, self.taxonomy, 100.0 * n_predicted / self.n_targets)
+
+
+def load_target_index(fasta_paths, cache_dir=None):
+    """
+    TargetIndex of the targets of fasta_paths. The FASTA files are only parsed when their cache
+    is missing from cache_dir (default: ~/.cache/cafa_format_checker); within a process,
+    unchanged files are not even hashed again.
+    """
+    fasta_paths = tuple(fasta_paths)
+    memo_key = []
+    for fasta_path in fasta_paths:
+        stat = os.stat(fasta_path)
+        memo_key.append((os.path.abspath(fasta_path), stat.st_size, stat.st_mtime_ns))
+    memo_key = tuple(memo_key)
+    target_index = _loaded_indexes.get(memo_key)
+    if target_index is not None:
+        return target_index
+
+    digest = hash_fasta_files(fasta_paths)
+    cache_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "targets-%s.idx" % digest)
+    groups = open_cache(cache_path)
+    if groups is None:
+        write_cache(cache_path, *_cache_blocks(parse_fasta_targets(fasta_paths)))
+        groups = open_cache(cache_path)
+
+    target_index = _loaded_indexes[memo_key] = TargetIndex(groups, (fasta_paths, cache_dir), digest)
+    return target_index
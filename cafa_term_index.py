@@ -0,0 +1,189 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+from array import array
+
+'''
+Index of the terms of an ontology, to check that predicted terms exist.
+
+The IDs (and alt_ids) of the [Term] stanzas of an OBO file are parsed into a sorted array of
+integers, then saved
+as a bitmap with one bit per possible term number (10^7 of them, for 7 digit IDs). The
+bitmap is cached on disk under the BLAKE2 hash of the OBO file, so later runs only hash the
+OBO and memory-map the cache. Terms are compared by number: GO:00082 is GO:0000082.
+
+Obsolete stanzas (is_obsolete: true) are left out, as they are from the ontology DAG (see
+cafa_ontology_dag), so that a predicted term is either in both or in neither.
+'''
+
+TERM_PREFIXES = {
+    "go": "GO:",
+    "hpo": "HP:",
+    "do": "DO:",
+}
+
+# Prefixes of the IDs of an OBO file for the terms of a prediction prefix, when they differ:
+# doid.obo declares DOID:0001816, predicted as DO:0001816
+OBO_ID_PREFIXES = {
+    "DO:": ("DOID:", "DO:"),
+}
+
+MAX_TERM_ID = 10 ** 7
+BITMAP_SIZE = (MAX_TERM_ID + 7) // 8
+CACHE_MAGIC = b"CAFATRM3"
+HEADER_SIZE = len(CACHE_MAGIC)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cafa_format_checker")
+
+obo_id_pattern = re.compile(r"^(?:id|alt_id):\s*(\S+)", re.MULTILINE)
+
+# Indexes already loaded by this process, by (obo path, size, mtime, prefix)
+_loaded_indexes = {}
+
+
+def hash_obo(obo_path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(obo_path, "rb") as obo_handle:
+        for block in iter(lambda: obo_handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def obo_term_number(term, prefix):
+    """ Number of the OBO ID term if it is one of the prefix terms (see OBO_ID_PREFIXES), else None """
+    for obo_prefix in OBO_ID_PREFIXES.get(prefix, (prefix,)):
+        digits = term[len(obo_prefix):]
+        if term.startswith(obo_prefix) and digits.isdigit():
+            return int(digits)
+    return None
+
+
+def parse_obo_term_ids(obo_path, prefix):
+    """ Sorted array of the numbers of the prefix IDs and alt_ids of the non-obsolete [Term] stanzas """
+    term_ids = set()
+    # IDs of the current [Term] stanza, None outside of one, added once it is known not to be obsolete
+    stanza_ids = None
+    obsolete = False
+    with open(obo_path, encoding="utf-8") as obo_handle:
+        for line in obo_handle:
+            if line.startswith("["):
+                if stanza_ids is not None and not obsolete:
+                    term_ids.update(stanza_ids)
+                stanza_ids = [] if line.strip() == "[Term]" else None
+                obsolete = False
+                continue
+            if stanza_ids is None:
+                continue
+            if line.startswith("is_obsolete:"):
+                obsolete = line.split(":", 1)[1].strip() == "true"
+                continue
+            match = obo_id_pattern.match(line)
+            if match is not None:
+                number = obo_term_number(match.group(1), prefix)
+                if number is not None and number < MAX_TERM_ID:
+                    stanza_ids.append(number)
+    if stanza_ids is not None and not obsolete:
+        term_ids.update(stanza_ids)
+    return array("I", sorted(term_ids))
+
+
+def build_bitmap(term_ids):
+    bitmap = bytearray(BITMAP_SIZE)
+    for term_id in term_ids:
+        bitmap[term_id >> 3] |= 1 << (term_id & 7)
+    return bitmap
+
+
+class TermIndex(object):
+    """ Set of the term numbers of an ontology, backed by a (memory-mapped) bitmap """
+
+    def __init__(self, bitmap, prefix, offset=0, source=None, digest=None):
+        self.bitmap = bitmap
+        self.prefix = prefix
+        self.offset = offset
+        # (obo_path, prefix, cache_dir) of an index made by load_term_index
+        self.source = source
+        # BLAKE2 hash of that OBO file, which versions the index
+        self.digest = digest
+
+    def __reduce__(self):
+        # Worker processes map the cache again rather than receive a copy of the bitmap
+        if self.source is not None:
+            return load_term_index, self.source
+        return TermIndex, (bytes(self.bitmap_view()), self.prefix)
+
+    def __contains__(self, term_id):
+        return 0 <= term_id < MAX_TERM_ID and (self.bitmap[self.offset + (term_id >> 3)] >> (term_id & 7)) & 1 == 1
+
+    def has_term(self, term):
+        """ True if term, e.g. "GO:0008270" or b"GO:0008270", is in the ontology """
+        return int(term[len(self.prefix):]) in self
+
+    def bitmap_view(self):
+        """ The bitmap as a read-only buffer of BITMAP_SIZE bytes, e.g. for numpy """
+        return memoryview(self.bitmap)[self.offset:self.offset + BITMAP_SIZE]
+
+
+def write_cache(cache_path, *blocks):
+    """ Writes the blocks to a cache file atomically, so that concurrent runs never read half of it """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as out_handle:
+            for block in blocks:
+                out_handle.write(block)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def open_cache(cache_path):
+    """ Memory-maps a cache file, returns None if it is missing or not a cache """
+    try:
+        with open(cache_path, "rb") as cache_handle:
+            mapped = mmap.mmap(cache_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) != HEADER_SIZE + BITMAP_SIZE or mapped[:HEADER_SIZE] != CACHE_MAGIC:
+        mapped.close()
+        return None
+    return mapped
+
+
+def load_term_index(obo_path, prefix, cache_dir=None):
+    """
+    TermIndex of the prefix terms of obo_path. The OBO is only parsed when its cache is
+    missing from cache_dir (default: ~/.cache/cafa_format_checker); within a process, an
+    unchanged OBO is not even hashed again.
+    """
+    stat = os.stat(obo_path)
+    memo_key = (os.path.abspath(obo_path), stat.st_size, stat.st_mtime_ns, prefix)
+    term_index = _loaded_indexes.get(memo_key)
+    if term_index is not None:
+        return term_index
+
+    digest = hash_obo(obo_path)
+    cache_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "%s-%s.terms" % (prefix.rstrip(":").lower(), digest))
+    mapped = open_cache(cache_path)
+    if mapped is None:
+        write_cache(cache_path, CACHE_MAGIC, build_bitmap(parse_obo_term_ids(obo_path, prefix)))
+        mapped = open_cache(cache_path)
+
+    term_index = _loaded_indexes[memo_key] = TermIndex(mapped, prefix, HEADER_SIZE, (obo_path, prefix, cache_dir),
+                                                           digest)
+    return term_index
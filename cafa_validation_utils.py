@@ -1,4 +1,3 @@
-from zipfile import ZipFile
 import re
 from collections import namedtuple
 '''
@@ -16,8 +15,47 @@ parsed_zip_file = namedtuple(
     ("is_valid", "message", "team_name", "files")
 )
 
+# Tar archives of prediction files, read as a stream (.tar.zst needs the zstandard package)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar.zst")
+
+VALID_ONTOLOGIES = frozenset(['do', 'go', 'hpo'])
+
+# CAFA 4 (2020) valid keywords:
+VALID_KEYWORDS = ('autoencoders', 'bag-of-words', 'clinical data', 'comparative model', 'convolutional neural network',
+    'decision tree', 'deep learning', 'de novo prediction', 'gene expression', 'genetic data', 'genetic interactions',
+    'genome environment', 'genomic context', 'gradient boosted tree', 'hidden Markov model', 'homolog', 'k-mers',
+    'latent dirichlet allocation', 'linear regression', 'literature', 'logistic regression', 'machine learning',
+    'mass spectrometry', 'natural language processing', 'neural network', 'operon', 'ortholog',
+    'other functional information', 'paralog', 'phylogeny', 'physicochemical properties', 'predicted properties',
+    'predicted protein structure', 'profile-profile alignment', 'protein interactions', 'protein structure',
+    'random forest', 'recurrent neural network', 'sequence alignment', 'sequence-profile alignment',
+    'sequence properties', 'structure alignment', 'supervised learning', 'support vector machine', 'synteny', 'tf-idf',
+    'unsupervised learning', 'word embeddings')
+
+VALID_TAXONOMIES = frozenset((
+    9606,   # "Homo sapiens"
+    10090,  # "Mus musculus[All Names]"
+    10116,  # "Rattus norvegicus"
+    3702,   # "Arabidopsis thaliana[All Names]"
+    83333,   # "Escherichia coli K-12[all names]" P
+    7227,   # "Drosophila melanogaster[All Names]"
+    287,    # "Pseudomonas aeruginosa[All Names]" P
+    559292, # "Saccharomyces cerevisiae ATCC 204508"
+    284812, # "Schizosaccharomyces pombe ATCC 24843"
+    7955,   # "Danio rerio[All Names]"
+    44689,  # "Dictyostelium discoideum[All Names]"
+    243273, # "Mycoplasma genitalium ATCC 33530" P
+    6239,   # "Caenorhabditis elegans[All Names]"
+    226900, # "Bacillus cereus ATCC 14579" P
+    4577,   # "Zea Mays [All names]"
+    9823,   # "Sus scrofa"
+    99287,  # Salmonella typhymurium ATCC 700720
+))
+
+TEAM_NAME = re.compile(r'^\w+$')
+
+
 def validate_ontology_id(id_str):
-    VALID_ONTOLOGIES = ['do', 'go', 'hpo']
     return id_str in VALID_ONTOLOGIES
 
 
@@ -61,43 +99,10 @@ def validate_author_line(author_line_str, expected_author=None):
 
 
 def get_valid_keywords():
-    # CAFA 4 (2020) valid keywords:
-    valid_keywords = ['autoencoders', 'bag-of-words', 'clinical data', 'comparative model', 'convolutional neural network',
-     'decision tree', 'deep learning', 'de novo prediction', 'gene expression', 'genetic data', 'genetic interactions',
-     'genome environment', 'genomic context', 'gradient boosted tree', 'hidden Markov model', 'homolog', 'k-mers',
-     'latent dirichlet allocation', 'linear regression', 'literature', 'logistic regression', 'machine learning',
-     'mass spectrometry', 'natural language processing', 'neural network', 'operon', 'ortholog',
-     'other functional information', 'paralog', 'phylogeny', 'physicochemical properties', 'predicted properties',
-     'predicted protein structure', 'profile-profile alignment', 'protein interactions', 'protein structure',
-     'random forest', 'recurrent neural network', 'sequence alignment', 'sequence-profile alignment',
-     'sequence properties', 'structure alignment', 'supervised learning', 'support vector machine', 'synteny', 'tf-idf',
-     'unsupervised learning', 'word embeddings']
-
-    return valid_keywords
+    return list(VALID_KEYWORDS)
 
 
 def validate_taxonomy(taxonomy_id_str):
-
-    VALID_TAXONOMIES = (
-        9606,   # "Homo sapiens"
-        10090,  # "Mus musculus[All Names]"
-        10116,  # "Rattus norvegicus"
-        3702,   # "Arabidopsis thaliana[All Names]"
-        83333,   # "Escherichia coli K-12[all names]" P
-        7227,   # "Drosophila melanogaster[All Names]"
-        287,    # "Pseudomonas aeruginosa[All Names]" P
-        559292, # "Saccharomyces cerevisiae ATCC 204508"
-        284812, # "Schizosaccharomyces pombe ATCC 24843"
-        7955,   # "Danio rerio[All Names]"
-        44689,  # "Dictyostelium discoideum[All Names]"
-        243273, # "Mycoplasma genitalium ATCC 33530" P
-        6239,   # "Caenorhabditis elegans[All Names]"
-        226900, # "Bacillus cereus ATCC 14579" P
-        4577,   # "Zea Mays [All names]"
-        9823,   # "Sus scrofa"
-        99287,  # Salmonella typhymurium ATCC 700720
-    )
-
     try:
         taxonomy_id = int(taxonomy_id_str)
         return taxonomy_id in VALID_TAXONOMIES
@@ -155,7 +160,7 @@ def validate_filename(filename):
     # We can now move forward with validating each piece of metadata:
     if is_valid is True:
         # What to do about team name:
-        if not re.match(r'^\w+$', team_name):
+        if not TEAM_NAME.match(team_name):
             is_valid = False
             message = "With file {filename}, {team_name} is not a valid team name".format(filename=filename, team_name=team_name)
 
@@ -186,19 +191,55 @@ def validate_one_team_per_archive(archive_handle):
     # The following doesn't account for the TC_ (term-centric) filename prefix, so it's been replaced with
     # somethign more verbose:
     #team_names_list = [fname.split("_")[0] for fname in txt_contents]
-    team_names_list = []
-    for fname in txt_contents:
-        fname_split = fname.split("_")
-
-        if fname_split[0].upper() != 'TC':
-            team_names_list.append(fname_split[0])
-        else:
-            team_names_list.append(fname_split[1])
+    team_names_list = [team_name_of(fname) for fname in txt_contents]
 
     team_names_set = set(team_names_list)
     return len(team_names_set) == 1, len(team_names_set), list(team_names_set)
 
 
+def team_name_of(fname):
+    """ Team name in the name of a prediction file, after the TC_ prefix of term-centric files """
+    fname_split = fname.split("_")
+
+    if fname_split[0].upper() != 'TC':
+        return fname_split[0]
+    return fname_split[1]
+
+
+def validate_archive_team_name(archive_name, kind="Zip"):
+    """ Checks the name of an archive without its extension, e.g. teamname_1 for teamname_1.zip:
+    returns (error message or None, team name). kind names the archive format in the messages.
+    """
+    split_filename = archive_name.split("/")[-1].strip().split("_")
+    team_name = split_filename[0]
+
+    if len(split_filename) > 2:
+        return '{} file names cannot include more than one underscore character'.format(kind), team_name
+
+    if len(split_filename) == 2:
+        try:
+            ordinal = int(split_filename[-1])
+        except ValueError:
+            # the portion of the filename following the underscore which should represent an int, is invalid
+            return ('The portion of the {} file name following the underscore should be an '
+                    'integer'.format(kind.lower()), team_name)
+
+    if not TEAM_NAME.match(team_name):
+        return 'Team names in files can only include alphanumeric characters', team_name
+
+    return None, team_name
+
+
+def validate_tar_archive_name(filepath):
+    """ Checks that a tar archive's name (.tar, possibly compressed) includes only the teamname.
+    The names of its members can only be checked as they are read, see validate_tar_members
+    in cafa4_format_checker.
+    """
+    suffix = next(suffix for suffix in TAR_SUFFIXES if filepath.endswith(suffix))
+    message, team_name = validate_archive_team_name(filepath[:-len(suffix)], "Tar")
+    return parsed_zip_file(is_valid=message is None, message=message or 'ok', team_name=team_name, files=[])
+
+
 def validate_archive_name(filepath):
     """ Checks that a zipfile's name includes only the teamname
     Also, compares the teamname found in the zipfile name to the teamname(s)
@@ -215,44 +256,22 @@ def validate_archive_name(filepath):
             files=[]
         )
 
-    split_filename = filepath[:-4].split("/")[-1].strip().split("_")
-    #split_filename = filepath.rstrip(".zip").split("/")[-1].strip().split("_")
-    zip_team_name = split_filename[0]
     print("********************")
     print("TESTING {}".format(filepath))
 
-    if len(split_filename) > 2:
+    name_message, zip_team_name = validate_archive_team_name(filepath[:-4])
+    if name_message is not None:
         return parsed_zip_file(
             is_valid=False,
-            message='Zip file names cannot include more than one underscore character',
+            message=name_message,
             team_name=zip_team_name,
             files=[]
         )
 
-    if len(split_filename) == 2:
-        try:
-            ordinal = int(split_filename[-1])
-        except ValueError:
-            # the portion of the filename following the underscore which should represent an int, is invalid
-            return parsed_zip_file(
-                is_valid=False,
-                message='The portion of the zip file name following the underscore should be an integer',
-                team_name=zip_team_name,
-                files=[]
-            )
-
-
-
     parsed_files = None
 
-    if not re.match(r'^\w+$', zip_team_name):
-        return parsed_zip_file(
-            is_valid=False,
-            message='Team names in files can only include alphanumeric characters',
-            team_name=zip_team_name,
-            files=[]
-        )
-
+    # Imported here, checking a txt file does not need it
+    from zipfile import ZipFile
     with ZipFile(filepath, "r") as zip_handle:
         is_valid, team_count, team_names = validate_one_team_per_archive(zip_handle)
 
@@ -0,0 +1,208 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import time
+from cafa_mmap_reader import MappedTextFile
+
+'''
+Cache of the verdicts on prediction files, for teams that submit the same files again.
+
+A verdict, (is_valid, message), is stored in a SQLite database under the BLAKE2 hash of the
+content of the file (or zip member) together with everything else it depends on: the
+version of the checkers, the team in the file name and the options and index files it was
+checked with. A file seen before, under any path, is then only hashed, not parsed: the file
+name is stored as FILENAME_PLACEHOLDER in the messages and put back on a hit. The least
+recently used verdicts are evicted once the stored messages outgrow the size budget.
+
+Compressed files and zip members are hashed as stored, compressed, rather than by their
+content, so that they are not decompressed once to be hashed and again to be checked.
+
+For zip archives, the members of the last archive of each team that passed validation are
+kept too, as their name, CRC32 and size from the central directory and a digest of the
+settings they were checked with. The members of a new archive of the team that match them
+are known to be valid without reading their data, see validate_changed_zip_members in
+cafa4_format_checker.
+'''
+
+# Bump when a change to the checkers can change the verdict on a file
+VERDICT_VERSION = 3
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_NAME = "verdicts.sqlite"
+# Bytes counted per verdict on top of its message, for the key and the row
+ROW_OVERHEAD = 100
+# Share of the size budget a full cache is evicted down to, so that eviction runs rarely and
+# deletes many verdicts at once
+LOW_WATER_MARK = 0.9
+# Stands for the name of the file in the stored messages
+FILENAME_PLACEHOLDER = "{filename}"
+
+
+def hash_content(read_handle):
+    """ BLAKE2 hash of the content of a MappedTextFile or a seekable binary handle, rewound after """
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(read_handle, MappedTextFile):
+        read_handle.update_digest(digest)
+        return digest.hexdigest()
+    for block in iter(lambda: read_handle.read(1 << 20), b""):
+        digest.update(block)
+    read_handle.seek(0)
+    return digest.hexdigest()
+
+
+def hash_stored_file(filepath):
+    """ BLAKE2 hash of the bytes of the file at filepath, such as a compressed file, as stored """
+    digest = hashlib.blake2b(digest_size=20)
+    with MappedTextFile(filepath) as mapped:
+        mapped.update_digest(digest)
+    return digest.hexdigest()
+
+
+def hash_zip_member(zip_reader, name):
+    """ BLAKE2 hash of the compressed data of the member name of zip_reader, a ZipFile opened
+    from a path, and of its compression method """
+    info = zip_reader.getinfo(name)
+    digest = hashlib.blake2b(str(info.compress_type).encode(), digest_size=20)
+    with open(zip_reader.filename, "rb") as archive:
+        # The data follows the local header, whose name and extra field lengths can differ
+        # from those of the central directory
+        archive.seek(info.header_offset)
+        header = archive.read(30)
+        if header[:4] != b"PK\x03\x04":
+            raise ValueError("Bad local header for {} in {}".format(name, zip_reader.filename))
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        archive.seek(name_length + extra_length, os.SEEK_CUR)
+        remaining = info.compress_size
+        while remaining > 0:
+            block = archive.read(min(remaining, 1 << 20))
+            if not block:
+                raise ValueError("Truncated data for {} in {}".format(name, zip_reader.filename))
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+class VerdictCache(object):
+    """
+    Verdicts stored in the SQLite database at path, of at most about max_bytes. The database
+    is opened on first use, so that the cache can be sent to worker processes.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection = None
+
+    def __reduce__(self):
+        return VerdictCache, (self.path, self.max_bytes)
+
+    def _connect(self):
+        if self._connection is None:
+            cache_dir = os.path.dirname(self.path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            # Autocommit: every statement is its own transaction, and concurrent runs wait
+            # for each other rather than fail
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, is_valid INTEGER, message TEXT, "
+                "size INTEGER, last_used REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+            # Running total of the sizes of the verdicts, kept by triggers so that it holds
+            # whichever process writes
+            self._connection.execute("CREATE TABLE IF NOT EXISTS stored_size (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                                     "bytes INTEGER)")
+            self._connection.execute("INSERT OR IGNORE INTO stored_size SELECT 0, COALESCE(SUM(size), 0) FROM verdicts")
+            for event, change in (("INSERT", "NEW.size"), ("DELETE", "-OLD.size"),
+                                  ("UPDATE OF size", "NEW.size - OLD.size")):
+                self._connection.execute(
+                    "CREATE TRIGGER IF NOT EXISTS verdicts_{name} AFTER {event} ON verdicts BEGIN "
+                    "UPDATE stored_size SET bytes = bytes + {change}; END".format(
+                        name=event.split()[0].lower(), event=event, change=change))
+            self._connection.execute("CREATE TABLE IF NOT EXISTS accepted_archives (team TEXT PRIMARY KEY, "
+                                     "members TEXT)")
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def settings_digest(settings):
+        """ Digest of settings, a tuple of reprs, and of the version of the checkers """
+        return hashlib.blake2b(repr((VERDICT_VERSION, settings)).encode(), digest_size=20).hexdigest()
+
+    @classmethod
+    def key(cls, read_handle, settings, stored_hash=None):
+        """ Key of the verdict on the content of read_handle checked with settings. stored_hash,
+        a function returning the hash of the bytes read_handle decompresses, stands in for the
+        hash of its content """
+        if stored_hash is not None:
+            return cls.settings_digest((("stored", stored_hash()), settings))
+        return cls.settings_digest((hash_content(read_handle), settings))
+
+    def accepted_members(self, team):
+        """ {member name: [CRC32, size, settings digest]} of the last valid archive of team """
+        row = self._connect().execute("SELECT members FROM accepted_archives WHERE team = ?", (team,)).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    def accept_archive(self, team, members):
+        """ Records members, as returned by accepted_members, as the last valid archive of team """
+        self._connect().execute("INSERT OR REPLACE INTO accepted_archives VALUES (?, ?)",
+                                (team, json.dumps(members)))
+
+    def get(self, key, filename=None):
+        """ The (is_valid, message) stored under key, or None, with the message about filename """
+        connection = self._connect()
+        row = connection.execute("SELECT is_valid, message FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (time.time(), key))
+        message = row[1]
+        if message is not None and filename is not None:
+            message = message.replace(FILENAME_PLACEHOLDER, filename)
+        return bool(row[0]), message
+
+    def put(self, key, is_valid, message, filename=None):
+        """ Stores the verdict (is_valid, message) on a file under key, message naming it filename """
+        if message is not None and filename:
+            message = message.replace(filename, FILENAME_PLACEHOLDER)
+        connection = self._connect()
+        size = ROW_OVERHEAD + (0 if message is None else len(message.encode()))
+        # An upsert rather than INSERT OR REPLACE, whose deletes do not fire the triggers
+        connection.execute("INSERT INTO verdicts VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                           "is_valid = excluded.is_valid, message = excluded.message, size = excluded.size, "
+                           "last_used = excluded.last_used", (key, int(is_valid), message, size, time.time()))
+        if self.stored_bytes() > self.max_bytes:
+            self.evict()
+
+    def stored_bytes(self):
+        """ Size counted for the verdicts stored, see ROW_OVERHEAD """
+        return self._connect().execute("SELECT bytes FROM stored_size").fetchone()[0]
+
+    def evict(self):
+        """ Deletes the least recently used verdicts until the others fit in LOW_WATER_MARK of max_bytes """
+        excess = self.stored_bytes() - int(self.max_bytes * LOW_WATER_MARK)
+        if excess > 0:
+            # The oldest verdicts whose sizes, added up from the oldest, reach the excess
+            self._connect().execute(
+                "DELETE FROM verdicts WHERE key IN (SELECT key FROM (SELECT key, size, SUM(size) OVER "
+                "(ORDER BY last_used, key) AS freed FROM verdicts) WHERE freed - size < ?)", (excess,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
@@ -0,0 +1,2 @@
+def pytest_configure(config):
+    config.addinivalue_line("markers", "perf: performance regression tests, deselect with -m 'not perf'")
@@ -1,7 +1,8 @@
 import os
 from zipfile import ZipFile
 import pytest
-from cafa_do_format_checker import author_check, model_check, keywords_check
+from cafa_go_format_checker import author_check
+from cafa_do_format_checker import model_check, keywords_check
 from cafa_validation_utils import validate_one_team_per_archive, validate_archive_name
 from cafa_validation_utils import validate_author_line, validate_filename
 
@@ -0,0 +1,138 @@
+import asyncio
+import zipfile
+import pytest
+import cafa_async_api
+import cafa_target_index
+from cafa_async_api import AsyncValidator, validation_event
+from cafa4_format_checker import validate_submission
+from cafa_target_index import load_target_index
+
+'''
+Tests for the asynchronous validation API
+'''
+
+VALID = b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+BROKEN = VALID.replace(b"0.80", b"1.80")
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(str(path), "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return str(path)
+
+
+def large_prediction(n_targets):
+    lines = b"".join(b"T96060%06d\tGO:0008270\t0.80\n" % target for target in range(n_targets))
+    return b"AUTHOR ateam\nMODEL 1\n" + lines + b"END\n"
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+def test_events_of_a_zip_archive(tmp_path):
+    archive = write_zip(tmp_path / "ateam.zip", [("ateam_1_9606_go.txt", VALID), ("ateam_2_9606_go.txt", BROKEN),
+                                                 ("ateam_3_9606_go.txt", BROKEN)])
+
+    async def events():
+        async with AsyncValidator(workers=2) as validator:
+            return [event async for event in validator.events(archive)]
+
+    started, first, second, finished = run(events)
+    assert started == validation_event("started", archive, None, None, None)
+    assert (first.kind, first.member, first.is_valid) == ("member", "ateam_1_9606_go.txt", True)
+    assert (second.member, second.is_valid) == ("ateam_2_9606_go.txt", False)
+    # The verdict is the one of validate_submission, the first error in archive order
+    assert (finished.kind, finished.is_valid) == ("finished", False)
+    assert finished.message == validate_submission(archive).message
+
+
+def test_counterparts_match_the_synchronous_functions(tmp_path, capsys, monkeypatch):
+    valid = tmp_path / "ateam_1_9606_go.txt"
+    valid.write_bytes(VALID)
+    broken = tmp_path / "ateam_2_9606_go.txt"
+    broken.write_bytes(BROKEN)
+    archive = write_zip(tmp_path / "ateam.zip", [("ateam_1_9606_go.txt", VALID)])
+    fasta_path = tmp_path / "sp_species.9606.tfa"
+    fasta_path.write_text(">T96060020120\nMKV\n>T96060020121\nMKV\n")
+    monkeypatch.setattr(cafa_target_index, "_loaded_indexes", {})
+    target_index = load_target_index([str(fasta_path)], str(tmp_path / "cache"))
+
+    async def validate():
+        async with AsyncValidator(workers=2, target_index=target_index) as validator:
+            results = await asyncio.gather(*(validator.validate_submission(str(path))
+                                             for path in (valid, broken, archive)))
+            checked = await validator.cafa_checker("go", str(broken))
+            covered = await validator.cafa_checker("go", str(valid))
+            other_taxonomy = await validator.cafa_checker("go", str(valid), taxonomy="10090")
+            printed = await validator.cafa4_file_validator(str(broken))
+        return results, checked, covered, other_taxonomy, printed
+
+    results, checked, covered, other_taxonomy, printed = run(validate)
+    assert results == [validate_submission(str(path), target_index=target_index)
+                       for path in (valid, broken, archive)]
+    assert checked == (False, results[1].message)
+    # The targets are checked against the taxonomy of the file name, or the one given
+    assert covered == (True, results[0].message) and "Predicted 1 of the 2 targets" in covered[1]
+    assert other_taxonomy[0] is False
+    assert printed is False
+    assert "VALIDATION FAILED" in capsys.readouterr().out
+
+
+def test_a_large_archive_does_not_starve_small_files(tmp_path):
+    large = write_zip(tmp_path / "ateam.zip", [("ateam_%d_9606_go.txt" % model, large_prediction(200000))
+                                               for model in range(1, 4)])
+    small = tmp_path / "ateam_1_9606_go.txt"
+    small.write_bytes(VALID)
+    finished = []
+
+    async def validate(validator, path):
+        result = await validator.validate_submission(path)
+        finished.append(path)
+        return result
+
+    async def validate_both():
+        async with AsyncValidator(workers=2, per_request=1) as validator:
+            large_task = asyncio.ensure_future(validate(validator, large))
+            await asyncio.sleep(0.05)
+            return await asyncio.gather(large_task, validate(validator, str(small)))
+
+    assert all(result.is_valid for result in run(validate_both))
+    assert finished == [str(small), large]
+
+
+def test_cancelling_a_request_leaves_the_validator_usable(tmp_path):
+    large = write_zip(tmp_path / "ateam.zip", [("ateam_%d_9606_go.txt" % model, large_prediction(200000))
+                                               for model in range(1, 4)])
+    small = tmp_path / "ateam_1_9606_go.txt"
+    small.write_bytes(VALID)
+
+    async def cancel():
+        async with AsyncValidator(workers=2) as validator:
+            task = asyncio.ensure_future(validator.validate_submission(large))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await validator.validate_submission(str(small))
+
+    assert run(cancel).is_valid is True
+
+
+def test_workers_open_each_archive_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(cafa_async_api, "_worker_archives", cafa_async_api.OrderedDict())
+    monkeypatch.setattr(cafa_async_api, "WORKER_ARCHIVES", 1)
+    first = write_zip(tmp_path / "ateam.zip", [("ateam_1_9606_go.txt", VALID)])
+    other = write_zip(tmp_path / "bteam.zip", [("bteam_1_9606_go.txt", VALID)])
+    opened = cafa_async_api._worker_zip_archive(first)
+    assert cafa_async_api._worker_zip_archive(first) is opened
+
+    # An archive written again under the same path is opened again, the least recently used
+    # one is closed
+    write_zip(tmp_path / "ateam.zip", [("ateam_1_9606_go.txt", VALID), ("ateam_2_9606_go.txt", VALID)])
+    reopened = cafa_async_api._worker_zip_archive(first)
+    assert reopened is not opened and opened.fp is None
+    assert len(reopened.namelist()) == 2
+    cafa_async_api._worker_zip_archive(other)
+    assert reopened.fp is None and list(cafa_async_api._worker_archives) == [other]
@@ -138,3 +138,47 @@ def test_valid_tc_hpo_txt_file_with_implied_taxonomy(test_data_path):
     assert is_valid is True
 
 
+
+def write_team_zip(path, members):
+    from zipfile import ZipFile
+    with ZipFile(path, "w") as zip_handle:
+        for name, text in members:
+            zip_handle.writestr(name, text)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_zip_members_first_error_in_member_order(tmp_path, capfd, workers):
+    good = "AUTHOR zteam\nMODEL 1\nKEYWORDS homolog.\nT96060020120\tGO:0008270\t0.80\nEND\n"
+    bad = good.replace("0.80", "1.80")
+    filepath = str(tmp_path / "zteam.zip")
+    write_team_zip(filepath, [
+        ("zteam_1_9606_go.txt", good),
+        ("zteam_2_9606_go.txt", bad),
+        ("zteam_3_9606_go.txt", bad.replace("GO:0008270", "GO:8270")),
+        ("zteam_1_10090_go.txt", good),
+    ])
+    is_valid = cafa_checker(filepath, workers=workers)
+    output, error = capfd.readouterr()
+    assert is_valid is False
+    assert "Error in zteam_2_9606_go.txt, line 4, GO prediction: error in third (confidence) field" in output
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_mode_writes_one_result_per_submission(test_data_path, tmp_path, capfd, jobs):
+    import json
+    from cafa4_format_checker import main
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# deadline uploads\n{}invalid/team1234567890.zip\n".format(test_data_path))
+    output_path = tmp_path / "results.jsonl"
+    exit_code = main(["--batch", "{}valid".format(test_data_path), "--manifest", str(manifest),
+                      "-j", str(jobs), "-o", str(output_path)])
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    by_path = {os.path.relpath(result["filepath"], test_data_path): result for result in results}
+    output, error = capfd.readouterr()
+    assert exit_code == 1
+    assert len(results) == len(os.listdir("{}valid".format(test_data_path))) + 1
+    assert by_path["valid/ateam_1_9606_go.txt"]["is_valid"] is True
+    assert by_path["invalid/team1234567890.zip"]["is_valid"] is False
+    assert "Only one team is allowed per zip file" in by_path["invalid/team1234567890.zip"]["message"]
+    # Progress printed while validating archives stays out of the results
+    assert "TESTING" not in output
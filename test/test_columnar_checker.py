@@ -0,0 +1,102 @@
+import io
+import random
+import pytest
+from cafa_record_engine import check_records
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_hpo_format_checker import RECORD_SPEC as HPO_SPEC
+from cafa_do_format_checker import RECORD_SPEC as DO_SPEC
+
+np = pytest.importorskip("numpy")
+from cafa_columnar_checker import columnar_cafa_checker
+
+'''
+The columnar checker must reach the same verdict as check_records, with the same message
+(and so the same line number) for the first error
+'''
+
+SPECS = (
+    (GO_SPEC, "GO", "ateam_1_9606_go.txt"),
+    (HPO_SPEC, "HP", "ateam_1_hpo.txt"),
+    (DO_SPEC, "DO", "ateam_1_9606_do.txt"),
+)
+
+BAD_LINES = (
+    "",
+    "   ",
+    "T96060020120 {prefix}:0008270",
+    "T96060020120 {prefix}:0008270 0.80 0.80",
+    "T96060020120 {prefix}:0008270 1.01",
+    "T96060020120 {prefix}:0008270 0.8",
+    "T96060020120 {prefix}:000827 0.8a",
+    "T9606 {prefix}:0008270 0.80",
+    "EFI96060020120 {prefix}:0008270 0.50",
+    "M96060020120 {prefix}:00082 0.50",
+    "T96060020120 {prefix}:00082709 0.50",
+    "T96060020120 XX:0008270 0.50",
+    "MODEL 1",
+    "MODEL 2",
+    "END",
+    "KEYWORDS homolog",
+    "ACCURACY 1 PR=0.50; RC=0.50",
+)
+
+
+def make_submission(prefix, n_lines, rng, bad=0):
+    lines = ["AUTHOR ateam", "MODEL 1", "KEYWORDS sequence alignment."]
+    for i in range(n_lines):
+        lines.append("T9606%07d\t%s:%07d\t%s" % (rng.randrange(10 ** 7), prefix, rng.randrange(10 ** 7),
+                                                  rng.choice(("0.00", "0.42", "1.00"))))
+    for i in range(bad):
+        lines.insert(rng.randrange(3, len(lines) + 1), rng.choice(BAD_LINES).format(prefix=prefix))
+    lines.append("END")
+    return ("\n".join(lines) + rng.choice(("\n", ""))).encode()
+
+
+@pytest.mark.parametrize("spec, prefix, filename", SPECS)
+def test_same_verdict_as_check_records(spec, prefix, filename):
+    rng = random.Random(spec.label)
+    for trial in range(60):
+        data = make_submission(prefix, rng.randrange(0, 200), rng, bad=trial % 3)
+        expected = check_records(io.BytesIO(data), filename, spec)
+        actual = columnar_cafa_checker(io.BytesIO(data), filename, spec, chunk_size=rng.randrange(16, 4096))
+        assert actual == expected
+
+
+def test_prediction_columns():
+    data = b"AUTHOR ateam\nMODEL 1\nT96060020120 GO:0008270 0.80\nEFI12345 GO:00031 1.00\nEND\n"
+    chunks = []
+    is_valid, message = columnar_cafa_checker(io.BytesIO(data), "ateam_1_9606_go.txt", GO_SPEC,
+                                              on_chunk=chunks.append)
+    assert is_valid is True
+    parsed, = chunks
+    assert parsed.valid.tolist() == [False, False, True, True, False]
+    assert parsed.target_ids.tolist() == [96060020120, 12345]
+    assert parsed.term_ids.tolist() == [8270, 31]
+    assert parsed.confidences.tolist() == [80, 100]
+
+
+@pytest.mark.parametrize("spec, prefix, filename", SPECS)
+def test_same_errors_as_check_records(spec, prefix, filename):
+    from cafa_error_store import ErrorStore
+    rng = random.Random(spec.label + "errors")
+    for trial in range(30):
+        data = make_submission(prefix, rng.randrange(0, 200), rng, bad=trial % 5)
+        expected_errors, actual_errors = ErrorStore(max_messages=3), ErrorStore(max_messages=3)
+        expected = check_records(io.BytesIO(data), filename, spec, expected_errors)
+        actual = columnar_cafa_checker(io.BytesIO(data), filename, spec, chunk_size=rng.randrange(16, 4096),
+                                       errors=actual_errors)
+        assert actual == expected
+        assert list(actual_errors) == list(expected_errors)
+
+
+@pytest.mark.parametrize("spec, prefix, filename", SPECS)
+@pytest.mark.parametrize("last_line", ["T12345 {prefix}:12345 .", "T12345 {prefix}:12345 0.",
+                                       "T12345 {prefix}:12345 1.", "t175322 {prefix}:5952\t0.5x", "\x00\x01."])
+def test_malformed_last_line(spec, prefix, filename, last_line):
+    # Bytes of the last line are gathered before it is found malformed, past the end of a
+    # line ending right after its "."
+    data = ("AUTHOR ateam\nMODEL 1\nT96060020120 %s:0008270 0.80\n" % prefix + last_line.format(prefix=prefix))
+    for chunk_size in (16, 4096):
+        expected = check_records(io.BytesIO(data.encode()), filename, spec)
+        assert columnar_cafa_checker(io.BytesIO(data.encode()), filename, spec, chunk_size=chunk_size) == expected
+        assert expected[0] is False
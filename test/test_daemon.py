@@ -0,0 +1,58 @@
+import socket
+import threading
+import pytest
+from cafa_daemon import ValidationServer, remove_stale_socket
+from cafa_client import request_verdicts, main as client_main
+
+'''
+Tests for the validation daemon and its client
+'''
+
+VALID = "AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "cafa.sock")
+    server = ValidationServer(socket_path, {"max_terms": 1})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_client_gets_the_verdicts_in_order(tmp_path, daemon, capsys):
+    valid = tmp_path / "ateam_1_9606_go.txt"
+    valid.write_text(VALID)
+    invalid = tmp_path / "ateam_2_9606_go.txt"
+    invalid.write_text(VALID.replace("END", "T96060020120\tGO:0005488\t0.50\nEND"))
+
+    results = list(request_verdicts(daemon, [str(valid), str(invalid)]))
+    assert [result["is_valid"] for result in results] == [True, False]
+    assert "at most 1 are allowed" in results[1]["message"]
+
+    assert client_main([daemon, str(valid)]) == 0
+    assert client_main([daemon, str(valid), str(invalid)]) == 1
+    assert capsys.readouterr().out.count("VALIDATION FAILED") == 1
+
+
+def test_bad_request(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(daemon)
+        connection.sendall(b"not json\n")
+        assert b"expected a line of JSON" in connection.makefile("rb").readline()
+
+
+def test_stale_socket_is_replaced(tmp_path, daemon):
+    with pytest.raises(OSError, match="already listening"):
+        remove_stale_socket(daemon)
+
+    stale_path = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(stale_path)
+    stale.close()
+    remove_stale_socket(stale_path)
+    server = ValidationServer(stale_path, {})
+    server.server_close()
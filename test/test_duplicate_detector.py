@@ -0,0 +1,97 @@
+import io
+import random
+import pytest
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE
+from cafa_duplicate_detector import DuplicateDetector
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+
+'''
+Tests for the detection of (target, term) pairs predicted twice in a model
+'''
+
+FILENAME = "ateam_1_9606_go.txt"
+
+
+def reference_duplicates(predictions):
+    seen = set()
+    duplicates = []
+    for line_num, (target, term, model) in enumerate(predictions, 1):
+        if (target, term, model) in seen:
+            duplicates.append(line_num)
+        seen.add((target, term, model))
+    return duplicates
+
+
+def random_predictions(rng, n):
+    return [(b"T9606%07d" % rng.randrange(300), b"GO:%0*d" % (rng.choice((5, 7)), rng.randrange(40)),
+             rng.randrange(1, 4)) for i in range(n)]
+
+
+def test_duplicates_in_memory_and_across_spilled_runs(tmp_path):
+    rng = random.Random(9)
+    predictions = random_predictions(rng, 20000)
+    for memory_budget in (64 * 1024 * 1024, 0):
+        detector = DuplicateDetector(memory_budget, max_reported=100000, spill_dir=str(tmp_path))
+        for line_num, (target, term, model) in enumerate(predictions, 1):
+            detector.add(target, term, model, line_num)
+        spilled = bool(detector.runs)
+        duplicates = detector.finish()
+        assert spilled == (memory_budget == 0)
+        assert [duplicate.line_num for duplicate in duplicates] == reference_duplicates(predictions)
+        assert detector.n_duplicates == len(duplicates)
+
+
+def test_lowest_line_numbers_are_reported(tmp_path):
+    rng = random.Random(10)
+    predictions = random_predictions(rng, 5000)
+    detector = DuplicateDetector(0, max_reported=5, spill_dir=str(tmp_path))
+    for line_num, (target, term, model) in enumerate(predictions, 1):
+        detector.add(target, term, model, line_num)
+    duplicates = detector.finish()
+    expected = reference_duplicates(predictions)
+    assert [duplicate.line_num for duplicate in duplicates] == expected[:5]
+    assert detector.n_duplicates == len(expected)
+
+
+@pytest.mark.parametrize("memory_budget", [64 * 1024 * 1024, 0])
+def test_duplicates_are_reported_against_the_lowest_line(tmp_path, memory_budget):
+    detector = DuplicateDetector(memory_budget, spill_dir=str(tmp_path))
+    detector.add(b"T1", b"GO:0008270", 1, 100)
+    # With no memory budget, these fill the table so that the next line is in a later run
+    for i in range(20):
+        detector.add(b"T2", b"GO:%07d" % i, 1, 200 + i)
+    detector.add(b"T1", b"GO:0008270", 1, 3)
+    detector.add(b"T1", b"GO:0008270", 1, 50)
+    assert bool(detector.runs) == (memory_budget == 0)
+    assert [(duplicate.line_num, duplicate.first_line_num) for duplicate in detector.finish()] == [(50, 3), (100, 3)]
+
+
+def test_key_round_trip():
+    for target, term, model in (("EFI96060020120", "GO:00082", 3), ("T1", "HP:0000118", 1), ("M99999", "DO:000001", 0)):
+        detector = DuplicateDetector()
+        assert detector.unpack(detector.pack(target, term, model)) == (target, term, model)
+
+
+def test_models_past_the_key_range_are_not_aliased():
+    detector = DuplicateDetector()
+    for line_num, model in enumerate((0, 1, 4, 5), 1):
+        detector.add(b"T96060020120", b"GO:0008270", model, line_num)
+    assert detector.finish() == []
+    with pytest.raises(ValueError):
+        detector.pack("T96060020120", "GO:0008270", 4)
+
+
+def test_duplicate_prediction_is_an_error():
+    text = ("AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nT96060020120\tGO:0003700\t0.50\n"
+            "T96060020120  GO:0008270  0.40\nMODEL 2\nT96060020120\tGO:0008270\t0.80\nEND\n")
+    is_valid, message = check_records(io.StringIO(text), FILENAME, GO_SPEC)
+    assert is_valid is True
+    is_valid, message = check_records(io.StringIO(text), FILENAME, GO_SPEC, duplicates=DuplicateDetector())
+    assert is_valid is False
+    assert message == ("Error in ateam_1_9606_go.txt, line 5, duplicate prediction: "
+                       "T96060020120 GO:0008270 was already predicted in line 3")
+
+    errors = ErrorStore()
+    is_valid, message = check_records(io.BytesIO(text.encode()), FILENAME, GO_SPEC, errors, DuplicateDetector())
+    assert [(error.line_num, error.code) for error in errors] == [(5, ERROR_CODE["duplicate_prediction"])]
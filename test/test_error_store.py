@@ -0,0 +1,70 @@
+import io
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE, stored_error
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_hpo_format_checker import RECORD_SPEC as HPO_SPEC
+
+'''
+Tests for the collect-all-errors mode of the record state machine
+'''
+
+FILENAME = "ateam_1_9606_go.txt"
+GOOD = "T96060020120\tGO:0008270\t0.80\n"
+TEXT = ("AUTHOR ateam\nMODEL 1\nKEYWORDS sequence alignment.\n" + GOOD +
+        "T96060020120\tGO:0008270\t1.80\n" + GOOD +
+        "T96060020120\tGO:8270\t0.80\n" +
+        "T96060020120 GO:0008270\n" +
+        "MODEL 2\nMODEL 3\nMODEL 4\n" + GOOD + "END\n")
+
+
+def test_every_error_is_recorded():
+    errors = ErrorStore()
+    is_valid, message = check_records(io.StringIO(TEXT), FILENAME, GO_SPEC, errors)
+    assert is_valid is False
+    assert list(errors) == [
+        stored_error(5, ERROR_CODE["confidence_above_one"], 25),
+        stored_error(7, ERROR_CODE["prediction_term"], 14),
+        stored_error(8, ERROR_CODE["prediction_fields"], 0),
+        stored_error(11, ERROR_CODE["too_many_models"], 0),
+    ]
+    assert message.startswith("Found 4 errors in ateam_1_9606_go.txt\n")
+    assert "  too_many_models: 1" in message
+
+
+def test_hpo_confidence_above_one_is_classified():
+    text = "AUTHOR ateam\nMODEL 1\nT96060020120\tHP:0008270\t1.80\nT96060020120\tHP:0008270\t0.8\nEND\n"
+    errors = ErrorStore()
+    check_records(io.StringIO(text), "ateam_1_9606_hpo.txt", HPO_SPEC, errors)
+    assert list(errors) == [
+        stored_error(3, ERROR_CODE["confidence_above_one"], 25),
+        stored_error(4, ERROR_CODE["prediction_confidence"], 25),
+    ]
+
+
+def test_first_message_is_the_fail_fast_error():
+    errors = ErrorStore()
+    check_records(io.StringIO(TEXT), FILENAME, GO_SPEC, errors)
+    is_valid, first_error = check_records(io.StringIO(TEXT), FILENAME, GO_SPEC)
+    assert errors.messages[0] == first_error
+
+
+def test_errors_past_the_cap_are_only_counted():
+    errors = ErrorStore(max_errors=2, max_messages=1)
+    is_valid, message = check_records(io.StringIO(TEXT), FILENAME, GO_SPEC, errors)
+    assert len(errors) == 2
+    assert errors.total == 4
+    assert len(errors.messages) == 1
+    assert "First 1 errors:" in message
+
+
+def test_section_order_error_is_collected():
+    errors = ErrorStore()
+    is_valid, message = check_records(io.StringIO("AUTHOR ateam\nMODEL 1\n" + GOOD), FILENAME, GO_SPEC, errors)
+    assert is_valid is False
+    assert list(errors) == [stored_error(0, ERROR_CODE["sections"], 0)]
+
+
+def test_valid_file_passes():
+    text = "AUTHOR ateam\nMODEL 1\n" + GOOD + "END\n"
+    is_valid, message = check_records(io.StringIO(text), FILENAME, GO_SPEC, ErrorStore())
+    assert is_valid is True
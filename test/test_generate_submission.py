@@ -0,0 +1,30 @@
+import zipfile
+from benchmarks.generate_submission import generate_submission, generate_team_zip, targets_for
+from cafa4_format_checker import validate_submission
+
+'''
+Tests for the generator of the benchmark submissions
+'''
+
+
+def test_generated_submissions_are_valid(tmp_path):
+    for ontology in ("go", "hpo", "do"):
+        path = generate_submission(str(tmp_path), ontology, targets_for(1000, 7), terms_per_target=7, seed=3)
+        # Without duplicate predictions either
+        result = validate_submission(path, duplicates_budget=1 << 20)
+        assert result.is_valid, result.message
+        with open(path) as read_handle:
+            assert sum(1 for line in read_handle if line.startswith("T")) == 1001
+
+    archive = generate_team_zip(str(tmp_path), 10, terms_per_target=5, models=3, team="ateam")
+    assert validate_submission(archive).is_valid
+    assert len(zipfile.ZipFile(archive).namelist()) == 9
+
+
+def test_generation_is_reproducible(tmp_path):
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    first = generate_submission(str(tmp_path / "first"), "go", 20, seed=5)
+    second = generate_submission(str(tmp_path / "second"), "go", 20, seed=5)
+    with open(first, "rb") as first_handle, open(second, "rb") as second_handle:
+        assert first_handle.read() == second_handle.read()
@@ -0,0 +1,84 @@
+import asyncio
+import gzip
+import http.client
+import json
+import socket
+import threading
+import pytest
+from cafa_http_service import ValidationService
+
+'''
+Tests for the HTTP service validating uploads as they arrive
+'''
+
+VALID = b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+
+
+@pytest.fixture(scope="module")
+def running_service():
+    loop = asyncio.new_event_loop()
+    service = ValidationService({"max_terms": 1}, workers=2)
+    server = loop.run_until_complete(service.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield service, server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    service.close()
+
+
+@pytest.fixture
+def port(running_service):
+    return running_service[1]
+
+
+def post(port, path, body, chunked=False):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    if chunked:
+        blocks = (body[i:i + 4093] for i in range(0, len(body), 4093))
+        connection.request("POST", path, blocks, encode_chunked=True)
+    else:
+        connection.request("POST", path, body)
+    response = connection.getresponse()
+    reply = response.status, json.loads(response.read())
+    connection.close()
+    return reply
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_uploads_are_validated(port, chunked):
+    status, verdict = post(port, "/validate/ateam_1_9606_go.txt", VALID, chunked)
+    assert status == 200 and verdict["is_valid"] is True
+
+    # An error found before the end of a large upload
+    invalid = VALID.replace(b"END\n", b"T96060020120\tGO:0005488\t0.50\n" * 100000 + b"END\n")
+    status, verdict = post(port, "/validate/ateam_1_9606_go.txt", invalid, chunked)
+    assert verdict["is_valid"] is False and "line 4" in verdict["message"]
+
+
+def test_compressed_upload_and_bad_names(port):
+    status, verdict = post(port, "/validate/ateam_1_9606_go.txt.gz", gzip.compress(VALID))
+    assert verdict == {"filename": "ateam_1_9606_go.txt.gz", "is_valid": True, "message": verdict["message"]}
+
+    assert "not a valid ontology" in post(port, "/validate/ateam_1_9606_xx.txt", VALID)[1]["message"]
+    assert post(port, "/validate/ateam.zip", b"")[0] == 400
+    assert post(port, "/other", b"")[0] == 404
+
+
+def test_uploads_are_checked_by_the_same_workers(running_service):
+    service, port = running_service
+    post(port, "/validate/ateam_1_9606_go.txt", VALID)
+    workers = set(service.pool._processes)
+    for _ in range(5):
+        assert post(port, "/validate/ateam_1_9606_go.txt", VALID)[1]["is_valid"] is True
+    assert set(service.pool._processes) == workers and len(workers) <= 2
+
+
+def test_bad_request_line(port):
+    with socket.create_connection(("127.0.0.1", port), timeout=30) as connection:
+        connection.sendall(b"GARBAGE\r\n\r\n")
+        reply = connection.makefile("rb").read()
+    assert reply.startswith(b"HTTP/1.1 400 ") and reply.endswith(b'{"error": "bad request line"}')
@@ -0,0 +1,43 @@
+import pytest
+from cafa_mmap_reader import MappedTextFile
+from cafa_go_format_checker import cafa_checker
+
+
+@pytest.fixture
+def text_file(tmp_path):
+    path = tmp_path / "ateam_1_9606_go.txt"
+    path.write_bytes(b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND")
+    return str(path)
+
+
+def test_iterates_over_bytes_lines(text_file):
+    with MappedTextFile(text_file) as mapped:
+        lines = list(mapped)
+    assert lines == [b"AUTHOR ateam\n", b"MODEL 1\n", b"T96060020120\tGO:0008270\t0.80\n", b"END"]
+
+
+def test_byte_ranges(text_file):
+    with MappedTextFile(text_file) as mapped:
+        assert mapped.read_range(0, 6) == b"AUTHOR"
+        # Offsets inside a line move to the start of the next one
+        assert mapped.next_line_start(0) == 0
+        assert mapped.next_line_start(13) == 13
+        assert mapped.next_line_start(14) == 21
+        assert mapped.next_line_start(len(mapped)) == len(mapped)
+        assert list(mapped.iter_lines(13, 22)) == [b"MODEL 1\n", b"T96060020120\tGO:0008270\t0.80\n"]
+        assert list(mapped.iter_lines(21, len(mapped))) == [b"T96060020120\tGO:0008270\t0.80\n", b"END"]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    with MappedTextFile(str(path)) as mapped:
+        assert len(mapped) == 0
+        assert list(mapped) == []
+        assert mapped.read() == b""
+
+
+def test_checker_reads_mapped_file(text_file):
+    with MappedTextFile(text_file) as mapped:
+        is_valid, message = cafa_checker(mapped, text_file)
+    assert is_valid is True
@@ -0,0 +1,120 @@
+import io
+import pickle
+import random
+import pytest
+import cafa_ontology_dag
+from cafa_ontology_dag import load_ontology_dag, build_ancestor_arrays, PropagationChecker
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+
+'''
+Tests for the ancestor closure of an ontology and the check that no term scores higher than
+its predicted ancestors
+'''
+
+# 1 is the root; 2 and 3 are children of 1; 4 is_a 2 and part_of 3; 5 is_a 4 and
+# regulates 1, which is not followed; 6 is obsolete; 7 is an alt_id of 5
+OBO = """format-version: 1.2
+
+[Term]
+id: GO:0000001
+name: root
+
+[Term]
+id: GO:0000002
+is_a: GO:0000001 ! root
+
+[Term]
+id: GO:0000003
+is_a: GO:0000001 ! root
+
+[Term]
+id: GO:0000004
+is_a: GO:0000002
+relationship: part_of GO:0000003 ! three
+
+[Term]
+id: GO:0000005
+alt_id: GO:0000007
+is_a: GO:0000004
+relationship: regulates GO:0000001
+
+[Term]
+id: GO:0000006
+is_obsolete: true
+is_a: GO:0000005
+
+[Typedef]
+id: part_of
+"""
+
+ANCESTORS = {1: set(), 2: {1}, 3: {1}, 4: {1, 2, 3}, 5: {1, 2, 3, 4}}
+FILENAME = "ateam_1_9606_go.txt"
+
+
+@pytest.fixture
+def dag(tmp_path, monkeypatch):
+    obo_path = tmp_path / "go.obo"
+    obo_path.write_text(OBO)
+    monkeypatch.setattr(cafa_ontology_dag, "_loaded_dags", {})
+    return load_ontology_dag(str(obo_path), "GO:", str(tmp_path / "cache"))
+
+
+def test_ancestor_closure(dag):
+    terms = {dag.node(term): term for term in ANCESTORS}
+    assert dag.node(6) is None and dag.node(7) == dag.node(5)
+    for term, ancestors in ANCESTORS.items():
+        assert {terms[node] for node in dag.ancestors_of(dag.node(term))} == ancestors
+
+
+def test_cache_is_reused_without_parsing(dag, monkeypatch):
+    obo_path, prefix, cache_dir = dag.source
+
+    def fail(*args):
+        raise AssertionError("the OBO file was parsed again")
+    monkeypatch.setattr(cafa_ontology_dag, "_loaded_dags", {})
+    monkeypatch.setattr(cafa_ontology_dag, "parse_obo_parents", fail)
+    assert list(load_ontology_dag(obo_path, prefix, cache_dir).ancestors) == list(dag.ancestors)
+    assert list(pickle.loads(pickle.dumps(dag)).offsets) == list(dag.offsets)
+
+
+def test_deep_chain_without_recursion():
+    parents = {term: [term - 1] if term > 1 else [] for term in range(1, 5001)}
+    ids, node_of, offsets, ancestors, terms = build_ancestor_arrays(parents, {})
+    assert offsets[-1] - offsets[-2] == 4999
+
+
+def test_numpy_and_plain_checks_agree(dag, monkeypatch):
+    if cafa_ontology_dag.np is None:
+        pytest.skip("numpy is not installed")
+    rng = random.Random(13)
+    predictions = [("T%07d" % rng.randrange(1000000, 1000005), "GO:%07d" % rng.choice([1, 2, 3, 4, 5, 7, 8]),
+                    "0.%02d" % rng.randrange(100), line_num) for line_num in range(1, 400)]
+    monkeypatch.setattr(cafa_ontology_dag, "PAIRS_PER_BATCH", 7)
+    results = []
+    for np in (cafa_ontology_dag.np, None):
+        monkeypatch.setattr(cafa_ontology_dag, "np", np)
+        checker = PropagationChecker(dag, max_reported=50)
+        for target, term, confidence, line_num in predictions:
+            checker.add(target, term, confidence, line_num)
+            if line_num == 200:
+                checker.new_model(2)
+        results.append((checker.finish(), checker.n_violations))
+    assert results[0] == results[1]
+    assert results[0][1] > 50 and len(results[0][0]) == 50
+
+
+def test_score_above_ancestor_is_an_error(dag):
+    text = ("AUTHOR ateam\nMODEL 1\nT96060000001 GO:0000002 0.50\nT96060000001 GO:0000007 0.60\n"
+            "T96060000002 GO:0000004 0.90\nT96060000001 GO:0000004 0.40\nT96060000001 GO:0000001 0.70\n"
+            "MODEL 2\nT96060000001 GO:0000001 0.10\nT96060000001 GO:0000002 0.20\nEND\n")
+    is_valid, message = check_records(io.StringIO(text), FILENAME, GO_SPEC, propagation=PropagationChecker(dag))
+    assert is_valid is False
+    assert message == ("Error in ateam_1_9606_go.txt, line 4, GO prediction: GO:0000007 of T96060000001 "
+                       "scores 0.60, more than its ancestor GO:0000002 at 0.50 in line 3")
+
+    errors = ErrorStore()
+    check_records(io.BytesIO(text.encode()), FILENAME, GO_SPEC, errors, propagation=PropagationChecker(dag))
+    assert [(error.line_num, error.code) for error in errors] == [
+        (4, ERROR_CODE["score_above_ancestor"]), (10, ERROR_CODE["score_above_ancestor"])]
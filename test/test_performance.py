@@ -0,0 +1,138 @@
+import contextlib
+import io
+import os
+import time
+import tracemalloc
+import pytest
+import cafa_do_format_checker
+import cafa_go_format_checker
+import cafa_hpo_format_checker
+from cafa_error_store import ErrorStore
+from benchmarks.generate_submission import generate_submission, generate_team_zip, targets_for
+from cafa4_format_checker import validate_submission
+
+'''
+Performance regression tests, on submissions generated on the fly (deselect them with
+-m "not perf").
+
+Throughputs are compared with the one of a calibration loop doing the kind of work a
+checker does for each line, run on the same machine just before each measure, so the
+floors hold on slow and fast machines alike. On valid lines, the checkers run at about the
+speed of the calibration loop (0.85 to 1.15 times it): the floor catches a checker getting
+1.4 times slower, as it does when a regex is compiled for every line. Lines the fast path
+does not match, such as the errors of a file checked with all_errors, go through the
+detailed checks at about 0.1 times the calibration loop, and have a floor of their own.
+Memory is measured with tracemalloc, which does not depend on the machine: checking a file
+must not hold its lines.
+'''
+
+pytestmark = pytest.mark.perf
+
+LINES = 200000
+REPEATS = 5
+# Lines/s of a checker over the iterations/s of the calibration loop
+THROUGHPUT_FLOOR = 0.6
+# Likewise for the lines checked by the slow path, and lines of the file checked
+SLOW_PATH_FLOOR = 0.06
+SLOW_PATH_LINES = 50000
+# Peak traced bytes while checking a txt file, whatever its size, and lines of the file
+# checked (1.5MB: holding them would break the ceiling)
+MEMORY_CEILING = 1 << 20
+MEMORY_LINES = 50000
+# Zip members are inflated into a bounded queue of blocks, see cafa_pipelined_reader, and
+# lines of the member checked (about 32MB as a list of lines)
+ZIP_MEMORY_CEILING = 24 << 20
+ZIP_MEMBER_LINES = 500000
+
+CHECKERS = {'go': cafa_go_format_checker, 'hpo': cafa_hpo_format_checker, 'do': cafa_do_format_checker}
+
+
+def calibration_rate(iterations=LINES):
+    """ Iterations/s of a loop splitting and parsing a prediction line """
+    line = "T96060000001\tGO:0008270\t0.80\n"
+    count = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fields = line.split()
+        if fields[1].startswith("GO:") and 0 <= float(fields[2]) <= 1:
+            count += 1
+    return iterations / (time.perf_counter() - start)
+
+
+def relative_throughput(function, lines, expected=True):
+    """ Lines/s of function(), which must return the expected verdict, over the calibration
+    rate just before: the median of REPEATS runs """
+    ratios = []
+    for _ in range(REPEATS):
+        calibration = calibration_rate()
+        start = time.perf_counter()
+        is_valid, message = function()
+        ratios.append(lines / (time.perf_counter() - start) / calibration)
+        assert is_valid is expected, message
+    return sorted(ratios)[REPEATS // 2]
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        is_valid, message = function()
+        assert is_valid, message
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def check_file(ontology, path, errors=None):
+    with open(path, "rb") as read_handle:
+        return CHECKERS[ontology].cafa_checker(read_handle, os.path.basename(path), errors)
+
+
+def quietly_validate(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = validate_submission(path, workers=1)
+    return result.is_valid, result.message
+
+
+@pytest.fixture(scope="module")
+def submissions(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("submissions"))
+    return {ontology: generate_submission(directory, ontology, targets_for(LINES)) for ontology in CHECKERS}
+
+
+@pytest.fixture(scope="module")
+def team_zip(tmp_path_factory):
+    # A member per ontology, LINES lines in all
+    return generate_team_zip(str(tmp_path_factory.mktemp("zip")), targets_for(LINES // len(CHECKERS)))
+
+
+@pytest.mark.parametrize("ontology", sorted(CHECKERS))
+def test_checker_throughput(submissions, ontology):
+    assert relative_throughput(lambda: check_file(ontology, submissions[ontology]), LINES) > THROUGHPUT_FLOOR
+
+
+@pytest.mark.parametrize("ontology", sorted(CHECKERS))
+def test_slow_path_throughput(tmp_path, ontology):
+    path = generate_submission(str(tmp_path), ontology, targets_for(SLOW_PATH_LINES))
+    with open(path, "rb") as read_handle:
+        data = read_handle.read()
+    # Confidences above 1: all but the 1.00 ones miss the fast path and are errors
+    with open(path, "wb") as write_handle:
+        write_handle.write(data.replace(b"\t0.", b"\t1."))
+    assert relative_throughput(lambda: check_file(ontology, path, ErrorStore()), SLOW_PATH_LINES,
+                               expected=False) > SLOW_PATH_FLOOR
+
+
+def test_zip_throughput(team_zip):
+    assert relative_throughput(lambda: quietly_validate(team_zip), LINES) > THROUGHPUT_FLOOR
+
+
+@pytest.mark.parametrize("ontology", sorted(CHECKERS))
+def test_checker_memory(tmp_path, ontology):
+    path = generate_submission(str(tmp_path), ontology, targets_for(MEMORY_LINES))
+    assert peak_memory(lambda: check_file(ontology, path)) < MEMORY_CEILING
+    assert peak_memory(lambda: quietly_validate(path)) < MEMORY_CEILING
+
+
+def test_zip_memory(tmp_path):
+    archive = generate_team_zip(str(tmp_path), targets_for(ZIP_MEMBER_LINES), ontologies=("go",))
+    assert peak_memory(lambda: quietly_validate(archive)) < ZIP_MEMORY_CEILING
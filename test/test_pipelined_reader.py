@@ -0,0 +1,93 @@
+import bz2
+import gzip
+import io
+import lzma
+import random
+import threading
+import pytest
+import cafa_pipelined_reader
+from cafa_pipelined_reader import PipelinedReader
+from cafa4_format_checker import validate_submission
+from cafa_batch_validator import collect_submissions
+
+VALID = b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+
+
+def random_text(n_lines, seed=17):
+    rng = random.Random(seed)
+    return b"".join(b"x" * rng.randrange(0, 30) + rng.choice([b"\n", b"\r\n", b"\r"]) for _ in range(n_lines))
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1 << 20])
+def test_lines_match_the_handle(block_size):
+    text = random_text(500) + b"no newline"
+    with PipelinedReader(io.BytesIO(text), block_size=block_size, depth=2) as reader:
+        assert list(reader) == list(io.BytesIO(text))
+
+
+def test_long_lines_are_joined_once(monkeypatch):
+    text = b"x" * 100000 + b"\nshort\n" + b"y" * 100000
+    handle = io.BytesIO(text)
+    split = []
+
+    class SpyBytesIO(io.BytesIO):
+        def __init__(self, data=b""):
+            split.append(len(data))
+            super().__init__(data)
+    monkeypatch.setattr(cafa_pipelined_reader.io, "BytesIO", SpyBytesIO)
+    with PipelinedReader(handle, block_size=100, depth=2) as reader:
+        assert list(reader) == text.splitlines(keepends=True)
+    # Each byte is split into lines once, rather than once per block of its line
+    assert sum(split) <= len(text) + 100
+
+
+def test_read_and_seek():
+    text = random_text(200)
+    with PipelinedReader(io.BytesIO(text), block_size=5, depth=1) as reader:
+        assert reader.read(12) + reader.read(3) == text[:15]
+        assert reader.read() == text[15:]
+        assert reader.read() == b""
+        assert reader.seek(0) == 0
+        assert b"".join(reader) == text
+
+
+def test_close_stops_the_reader_thread():
+    n_threads = threading.active_count()
+    reader = PipelinedReader(io.BytesIO(random_text(1000)), block_size=3, depth=1)
+    assert next(iter(reader))
+    reader.close()
+    assert threading.active_count() == n_threads
+
+
+def test_read_errors_reach_the_parser():
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            raise OSError("bad zip data")
+    with PipelinedReader(Broken()) as reader, pytest.raises(OSError, match="bad zip data"):
+        list(reader)
+
+
+@pytest.mark.parametrize("module, suffix", [(gzip, ".gz"), (bz2, ".bz2"), (lzma, ".xz")])
+def test_compressed_text_submissions(tmp_path, module, suffix):
+    valid = tmp_path / ("ateam_1_9606_go.txt" + suffix)
+    valid.write_bytes(module.compress(VALID))
+    assert validate_submission(str(valid)).is_valid is True
+    assert collect_submissions([str(tmp_path)]) == [str(valid)]
+
+    invalid = tmp_path / ("ateam_2_9606_go.txt" + suffix)
+    invalid.write_bytes(module.compress(VALID.replace(b"0.80", b"1.80")))
+    result = validate_submission(str(invalid), columnar=True)
+    assert result.is_valid is False and "ateam_2_9606_go.txt, line 3" in result.message
+
+    # The name checked is the one inside the compression suffix
+    misnamed = tmp_path / ("ateam_1_9606_xx.txt" + suffix)
+    misnamed.write_bytes(module.compress(VALID))
+    assert "xx is not a valid ontology" in validate_submission(str(misnamed)).message
+
+
+def test_compressed_file_is_found_by_its_magic_bytes(tmp_path):
+    path = tmp_path / "ateam_1_9606_go.txt"
+    path.write_bytes(gzip.compress(VALID.replace(b"0.80", b"1.80")))
+    assert validate_submission(str(path)).is_valid is False
+    path.write_bytes(gzip.compress(VALID))
+    assert validate_submission(str(path)).is_valid is True
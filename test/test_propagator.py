@@ -0,0 +1,150 @@
+import bz2
+import gzip
+import io
+import lzma
+import tarfile
+import zipfile
+import pytest
+import cafa_ontology_dag
+import cafa_propagator
+from cafa_ontology_dag import load_ontology_dag
+from cafa_propagator import propagate_lines, propagate_submission
+from cafa4_format_checker import main
+
+'''
+Tests for the propagated copies of prediction files
+'''
+
+# 1 is the root; 2 and 3 are children of 1; 4 is_a 2 and part_of 3; 5 is_a 4 with alt_id 7
+OBO = """format-version: 1.2
+
+[Term]
+id: GO:0000001
+
+[Term]
+id: GO:0000002
+is_a: GO:0000001
+
+[Term]
+id: GO:0000003
+is_a: GO:0000001
+
+[Term]
+id: GO:0000004
+is_a: GO:0000002
+relationship: part_of GO:0000003
+
+[Term]
+id: GO:0000005
+alt_id: GO:0000007
+is_a: GO:0000004
+"""
+
+SUBMISSION = ("AUTHOR ateam\r\nMODEL 1\nKEYWORDS sequence alignment.\n"
+              "T96060000001\tGO:0000007\t0.60\nT96060000001\tGO:0000003\t0.80\nT96060000001\tGO:0000009\t0.30\n"
+              "T96060000002\tGO:0000002\t0.25\n"
+              "MODEL 2\nT96060000001\tGO:0000004\t0.40\nEND\n")
+
+PROPAGATED = ("AUTHOR ateam\nMODEL 1\nKEYWORDS sequence alignment.\n"
+              "T96060000001\tGO:0000009\t0.30\nT96060000001\tGO:0000001\t0.80\nT96060000001\tGO:0000002\t0.60\n"
+              "T96060000001\tGO:0000003\t0.80\nT96060000001\tGO:0000004\t0.60\nT96060000001\tGO:0000005\t0.60\n"
+              "T96060000002\tGO:0000001\t0.25\nT96060000002\tGO:0000002\t0.25\n"
+              "MODEL 2\nT96060000001\tGO:0000001\t0.40\nT96060000001\tGO:0000002\t0.40\n"
+              "T96060000001\tGO:0000003\t0.40\nT96060000001\tGO:0000004\t0.40\nEND\n")
+
+
+@pytest.fixture
+def obo_path(tmp_path, monkeypatch):
+    path = tmp_path / "go.obo"
+    path.write_text(OBO)
+    monkeypatch.setattr(cafa_ontology_dag, "_loaded_dags", {})
+    return str(path)
+
+
+@pytest.fixture
+def dag(obo_path, tmp_path):
+    return load_ontology_dag(obo_path, "GO:", str(tmp_path / "cache"))
+
+
+def propagate(text, dag, **kwargs):
+    return b"".join(propagate_lines(io.BytesIO(text.encode()), dag, **kwargs)).decode()
+
+
+def test_ancestors_get_the_best_descendant_score(dag, monkeypatch):
+    assert propagate(SUBMISSION, dag) == PROPAGATED
+    monkeypatch.setattr(cafa_propagator, "np", None)
+    assert propagate(SUBMISSION, dag, batch_lines=1) == PROPAGATED
+
+
+def test_worker_processes_keep_the_file_order(dag):
+    assert propagate(SUBMISSION, dag, workers=2, batch_lines=1) == PROPAGATED
+
+
+def test_split_target_cannot_be_propagated(dag):
+    text = SUBMISSION.replace("T96060000002\tGO:0000002\t0.25\n",
+                              "T96060000002\tGO:0000002\t0.25\nT96060000001\tGO:0000001\t0.10\n")
+    with pytest.raises(ValueError, match="T96060000001 are not all together"):
+        propagate(text, dag)
+
+
+def test_propagate_option_writes_the_zip_members(obo_path, tmp_path):
+    # The validation with --go-obo rejects the unknown term
+    unknown = "T96060000001\tGO:0000009\t0.30\n"
+    archive_path = str(tmp_path / "ateam.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("ateam_1_9606_go.txt", SUBMISSION.replace(unknown, ""))
+    output_dir = tmp_path / "propagated"
+
+    assert main([archive_path, "--go-obo", obo_path, "--term-cache", str(tmp_path / "cache"),
+                 "--propagate", str(output_dir), "--workers", "1"]) == 0
+    assert (output_dir / "ateam_1_9606_go.txt").read_text() == PROPAGATED.replace(unknown, "")
+    with pytest.raises(ValueError, match="No ontology"):
+        propagate_submission(archive_path, str(output_dir), {})
+
+
+def test_zip_members_of_the_same_name_are_all_written(obo_path, tmp_path, capsys):
+    unknown = "T96060000001\tGO:0000009\t0.30\n"
+    archive_path = str(tmp_path / "ateam.zip")
+    names = ("first/ateam_1_9606_go.txt", "second/ateam_1_9606_go.txt")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for name, score in zip(names, ("0.25", "0.35")):
+            archive.writestr(name, SUBMISSION.replace(unknown, "").replace("0.25", score))
+    output_dir = tmp_path / "propagated"
+    dags = {"go": load_ontology_dag(obo_path, "GO:", str(tmp_path / "cache"))}
+
+    written = propagate_submission(archive_path, str(output_dir), dags, workers=1)
+    assert written == [str(output_dir / name) for name in names]
+    assert (output_dir / names[0]).read_text() != (output_dir / names[1]).read_text()
+    # Unlike validate_archive_name, propagating does not print
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("suffix, compress", [(".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress)])
+def test_propagate_option_reads_compressed_files(obo_path, tmp_path, suffix, compress):
+    unknown = "T96060000001\tGO:0000009\t0.30\n"
+    path = tmp_path / ("ateam_1_9606_go.txt" + suffix)
+    path.write_bytes(compress(SUBMISSION.replace(unknown, "").encode()))
+    output_dir = tmp_path / "propagated"
+
+    assert main([str(path), "--go-obo", obo_path, "--term-cache", str(tmp_path / "cache"),
+                 "--propagate", str(output_dir), "--workers", "1"]) == 0
+    # Written under the name inside the compression suffix, uncompressed
+    assert (output_dir / "ateam_1_9606_go.txt").read_text() == PROPAGATED.replace(unknown, "")
+
+
+@pytest.mark.parametrize("suffix, mode", [(".tar", "w"), (".tar.gz", "w:gz")])
+def test_propagate_option_writes_the_tar_members(obo_path, tmp_path, suffix, mode):
+    unknown = "T96060000001\tGO:0000009\t0.30\n"
+    data = SUBMISSION.replace(unknown, "").encode()
+    archive_path = str(tmp_path / ("ateam" + suffix))
+    with tarfile.open(archive_path, mode) as archive:
+        for name in ("ateam_1_9606_go.txt", "ateam_2_9606_go.txt"):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    output_dir = tmp_path / "propagated"
+
+    assert main([archive_path, "--go-obo", obo_path, "--term-cache", str(tmp_path / "cache"),
+                 "--propagate", str(output_dir), "--workers", "1"]) == 0
+    for name in ("ateam_1_9606_go.txt", "ateam_2_9606_go.txt"):
+        assert (output_dir / name).read_text() == PROPAGATED.replace(unknown, "")
@@ -0,0 +1,106 @@
+import io
+from cafa_record_engine import check_records, STATE_BY_KEYWORD
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_hpo_format_checker import RECORD_SPEC as HPO_SPEC
+from cafa_do_format_checker import RECORD_SPEC as DO_SPEC
+
+'''
+Tests for the record state machine shared by the GO, HPO and DO checkers
+'''
+
+GO_HEADER = "AUTHOR ateam\nMODEL 1\nKEYWORDS sequence alignment.\n"
+
+
+def run(spec, text, filename="ateam_1_9606_go.txt"):
+    return check_records(io.StringIO(text), filename, spec)
+
+
+def test_valid_go_records():
+    text = GO_HEADER + "T96060020120\tGO:0008270\t0.80\nT96060020120\tGO:0003700\t1.00\nEND\n"
+    is_valid, message = run(GO_SPEC, text)
+    assert is_valid is True
+    assert message == "ateam_1_9606_go.txt, passed the CAFA 4 GO prediction format checker"
+
+
+def test_bytes_lines_are_decoded():
+    text = GO_HEADER + "T96060020120\tGO:0008270\t0.80\nEND\n"
+    is_valid, message = check_records(io.BytesIO(text.encode()), "ateam_1_9606_go.txt", GO_SPEC)
+    assert is_valid is True
+
+
+def test_error_reports_one_based_line_number():
+    text = GO_HEADER + "T96060020120\tGO:0008270\t0.80\nT96060020120\tGO:0008270\t1.80\nEND\n"
+    is_valid, message = run(GO_SPEC, text)
+    assert is_valid is False
+    assert message.startswith("Error in ateam_1_9606_go.txt, line 5, GO prediction")
+
+
+def test_too_many_accuracy_records():
+    accuracy = "ACCURACY 1 PR=0.50; RC=0.50\n"
+    text = GO_HEADER + accuracy * 4 + "T96060020120\tGO:0008270\t0.80\nEND\n"
+    is_valid, message = run(GO_SPEC, text)
+    assert is_valid is False
+    assert "line 7, ACCURACY: too many ACCURACY records" in message
+
+
+def test_too_many_models():
+    model = "MODEL 1\nT96060020120\tHP:0008270\t0.80\n"
+    text = "AUTHOR ateam\n" + model * 4 + "END\n"
+    is_valid, message = run(HPO_SPEC, text, "ateam_1_hpo.txt")
+    assert is_valid is False
+    assert "line 8, Too many models" in message
+
+
+def test_blank_line_is_a_bad_prediction():
+    text = GO_HEADER + "\nT96060020120\tGO:0008270\t0.80\nEND\n"
+    is_valid, message = run(GO_SPEC, text)
+    assert is_valid is False
+    assert "line 4, GO prediction: wrong number of fields" in message
+
+
+def test_section_order():
+    text = "AUTHOR ateam\nKEYWORDS sequence alignment.\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+    is_valid, message = run(GO_SPEC, text)
+    assert is_valid is False
+    assert message.split("\n")[1] == "Sections found in the file: [author, keywords, model, go_prediction, end]"
+
+
+def test_empty_do_file_is_invalid():
+    is_valid, message = run(DO_SPEC, "", "ateam_1_9606_do.txt")
+    assert is_valid is False
+    assert "Sections found in the file: []" in message
+
+
+def test_every_spec_checks_every_state():
+    for spec in (GO_SPEC, HPO_SPEC, DO_SPEC):
+        checks = spec.build_checks("ateam_1_9606_go.txt")
+        assert set(checks) == set(STATE_BY_KEYWORD.values()) | {spec.prediction_state}
+
+
+def test_fast_path_agrees_with_prediction_checks():
+    ''' Every line matched by the fast path must also pass the detailed prediction check '''
+    lines = (
+        "T96060020120\tGO:0008270\t0.80",
+        "  T96060020120   GO:00082   1.00  \n",
+        "EFI96060020120 GO:0008270 0.00\r\n",
+        "T96060020120\tGO:0008270\t1.01",
+        "T96060020120\tGO:0008270\t0.8",
+        "T96060020120\tGO:0008270\t,.80",
+        "X96060020120\tGO:0008270\t0.80",
+        "T96060020120\tGO:0008270\t0.80\t0.80",
+        "T96060020120 GO:00082701 0.80",
+    )
+    str_pattern, bytes_pattern = GO_SPEC.prediction_patterns
+    prediction_check = GO_SPEC.build_checks("ateam_1_9606_go.txt")["go_prediction"]
+    for line in lines:
+        matched = str_pattern.fullmatch(line) is not None
+        assert matched == (bytes_pattern.fullmatch(line.encode()) is not None)
+        if matched:
+            assert prediction_check(line) == (True, None)
+
+
+def test_fast_path_miss_reports_detailed_error():
+    text = GO_HEADER + "T96060020120\tGO:0008270\t0.8\nEND\n"
+    is_valid, message = check_records(io.BytesIO(text.encode()), "ateam_1_9606_go.txt", GO_SPEC)
+    assert is_valid is False
+    assert message == "Error in ateam_1_9606_go.txt, line 4, GO prediction: error in third (confidence) field"
@@ -0,0 +1,106 @@
+import random
+import pytest
+from cafa_record_engine import check_records
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_hpo_format_checker import RECORD_SPEC as HPO_SPEC
+from cafa_do_format_checker import RECORD_SPEC as DO_SPEC
+from cafa_mmap_reader import MappedTextFile
+from cafa_sharded_checker import shard_boundaries, scan_shard, merge_shard_summaries, sharded_cafa_checker
+
+'''
+Shards merged in file order must give the verdict of a sequential run, with the same
+message (and so the same global line number) for the first error
+'''
+
+SPECS = (
+    (GO_SPEC, "GO", "ateam_1_9606_go.txt"),
+    (HPO_SPEC, "HP", "ateam_1_hpo.txt"),
+    (DO_SPEC, "DO", "ateam_1_9606_do.txt"),
+)
+
+BAD_LINES = (
+    "",
+    "T96060020120 {prefix}:0008270 1.01",
+    "T96060020120  {prefix}:0008270  0.8",
+    "  T96060020120   {prefix}:00082   1.00  ",
+    "MODEL 1",
+    "MODEL 2",
+    "AUTHOR ateam",
+    "END",
+    "KEYWORDS homolog.",
+    "ACCURACY 1 PR=0.50; RC=0.50",
+)
+
+
+def make_submission(prefix, n_lines, rng, bad=0):
+    lines = ["AUTHOR ateam", "MODEL 1", "KEYWORDS sequence alignment."]
+    for i in range(n_lines):
+        lines.append("T9606%07d\t%s:%07d\t0.%02d" % (rng.randrange(10 ** 7), prefix, rng.randrange(10 ** 7),
+                                                     rng.randrange(100)))
+    for i in range(bad):
+        lines.insert(rng.randrange(len(lines) + 1), rng.choice(BAD_LINES).format(prefix=prefix))
+    lines.append("END")
+    return ("\n".join(lines) + rng.choice(("\n", ""))).encode()
+
+
+def sharded_in_process(handle, filename, spec, n_shards):
+    summaries = [scan_shard(handle, start, end, filename, spec)
+                 for start, end in shard_boundaries(handle, n_shards)]
+    return merge_shard_summaries(summaries, filename, spec)
+
+
+@pytest.mark.parametrize("spec, prefix, filename", SPECS)
+def test_merged_shards_match_sequential_run(tmp_path, spec, prefix, filename):
+    rng = random.Random(spec.label)
+    path = str(tmp_path / filename)
+    for trial in range(60):
+        with open(path, "wb") as out_handle:
+            out_handle.write(make_submission(prefix, rng.randrange(0, 100), rng, bad=trial % 4))
+        with MappedTextFile(path) as handle:
+            expected = check_records(handle, filename, spec)
+            assert sharded_in_process(handle, filename, spec, rng.randrange(2, 9)) == expected
+
+
+def test_shard_boundaries_are_line_starts(tmp_path):
+    path = str(tmp_path / "ateam_1_9606_go.txt")
+    with open(path, "wb") as out_handle:
+        out_handle.write(make_submission("GO", 50, random.Random(0)))
+    with MappedTextFile(path) as handle:
+        boundaries = shard_boundaries(handle, 7)
+        data = handle.read_range(0, handle.size)
+    assert boundaries[0][0] == 0 and boundaries[-1][1] == len(data)
+    for (start, end), (next_start, next_end) in zip(boundaries, boundaries[1:]):
+        assert end == next_start
+        assert data[next_start - 1:next_start] == b"\n"
+
+
+def test_sharded_checker_in_worker_processes(tmp_path):
+    text = "AUTHOR ateam\nMODEL 1\nKEYWORDS homolog.\n" + "T96060020120\tGO:0008270\t0.80\n" * 2000
+    text += "MODEL 2\n" + "T96060020120\tGO:0008270\t0.80\n" * 2000 + "T96060020120\tGO:0008270\t1.80\nEND\n"
+    path = str(tmp_path / "ateam_1_9606_go.txt")
+    with open(path, "w") as out_handle:
+        out_handle.write(text)
+    with MappedTextFile(path) as handle:
+        is_valid, message = sharded_cafa_checker(handle, "ateam_1_9606_go.txt", GO_SPEC, workers=3,
+                                                 min_shard_size=1024)
+    assert is_valid is False
+    assert message == "Error in ateam_1_9606_go.txt, line 4005, GO prediction: error in third (confidence) field. Cannot be > 1.0"
+
+
+@pytest.mark.parametrize("spec, prefix, filename", SPECS)
+def test_merged_shards_collect_the_same_errors(tmp_path, spec, prefix, filename):
+    from cafa_error_store import ErrorStore
+    rng = random.Random(spec.label + "errors")
+    path = str(tmp_path / filename)
+    for trial in range(40):
+        with open(path, "wb") as out_handle:
+            out_handle.write(make_submission(prefix, rng.randrange(0, 100), rng, bad=trial % 6))
+        expected_errors = ErrorStore(max_errors=3, max_messages=2)
+        actual_errors = ErrorStore(max_errors=3, max_messages=2)
+        with MappedTextFile(path) as handle:
+            expected = check_records(handle, filename, spec, expected_errors)
+            summaries = [scan_shard(handle, start, end, filename, spec, actual_errors.max_errors)
+                         for start, end in shard_boundaries(handle, rng.randrange(2, 9))]
+        assert merge_shard_summaries(summaries, filename, spec, actual_errors) == expected
+        assert list(actual_errors) == list(expected_errors)
+        assert actual_errors.counts == expected_errors.counts
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import time
+
+'''
+Tests for the start up of cafa4_format_checker.py: checking a small file only loads the
+checker of its ontology, and takes less than a fixed budget from a cold interpreter
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECKER = os.path.join(ROOT, "cafa4_format_checker.py")
+VALID = b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+
+# Seconds, for the fastest of a few runs: about 0.15s on a laptop, 0.25s before the checkers
+# and numpy were imported lazily
+STARTUP_BUDGET = 0.5
+
+
+def test_only_the_needed_modules_are_imported(tmp_path):
+    submission = tmp_path / "ateam_1_9606_go.txt"
+    submission.write_bytes(VALID)
+    script = ("import sys, runpy; sys.argv = ['cafa4_format_checker.py', %r]\n"
+              "try:\n    runpy.run_path(%r, run_name='__main__')\n"
+              "except SystemExit:\n    pass\n"
+              "print(' '.join(sorted(sys.modules)))" % (str(submission), CHECKER))
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, check=True).stdout
+    modules = output.decode().split("\n")[-2].split()
+    assert "cafa_go_format_checker" in modules
+    # bz2 and lzma are not listed, argparse imports them through shutil
+    for lazy in ("cafa_hpo_format_checker", "cafa_do_format_checker", "cafa_columnar_checker", "cafa_ontology_dag",
+                 "numpy", "concurrent.futures.process", "cafa_term_index", "cafa_target_index",
+                 "cafa_verdict_cache", "cafa_duplicate_detector", "sqlite3", "tarfile", "zipfile", "zstandard",
+                 "gzip", "threading", "queue"):
+        assert lazy not in modules
+
+
+def test_small_file_is_checked_within_the_startup_budget(tmp_path):
+    submission = tmp_path / "ateam_1_9606_go.txt"
+    submission.write_bytes(VALID)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, CHECKER, str(submission)], cwd=ROOT, capture_output=True)
+        timings.append(time.perf_counter() - start)
+        assert completed.returncode == 0
+    assert min(timings) < STARTUP_BUDGET
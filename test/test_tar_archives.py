@@ -0,0 +1,70 @@
+import io
+import sys
+import tarfile
+import pytest
+from cafa4_format_checker import validate_submission
+from cafa_batch_validator import collect_submissions
+
+'''
+Tests for the validation of tar archives as they stream
+'''
+
+VALID = b"AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+BROKEN = VALID.replace(b"0.80", b"1.80")
+
+
+def write_tar(path, members, mode="w"):
+    with tarfile.open(str(path), mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+@pytest.mark.parametrize("suffix, mode", [(".tar", "w"), (".tar.gz", "w:gz"), (".tar.xz", "w:xz")])
+def test_members_are_validated_in_archive_order(tmp_path, suffix, mode):
+    members = [("ateam_%s_9606_go.txt" % model, VALID) for model in (1, 2, 3)]
+    assert validate_submission(write_tar(tmp_path / ("ateam" + suffix), members, mode), workers=2).is_valid
+
+    members[1] = ("ateam_2_9606_go.txt", BROKEN)
+    members[2] = ("ateam_3_9606_go.txt", BROKEN)
+    result = validate_submission(write_tar(tmp_path / ("ateam_2" + suffix), members, mode), workers=2)
+    assert result.is_valid is False
+    assert result.message.startswith("Error in ateam_2_9606_go.txt, line 3")
+
+
+def test_member_names_are_checked_as_they_come(tmp_path, capsys):
+    archive = write_tar(tmp_path / "ateam.tar.gz", [("ateam_1_9606_go.txt", VALID), ("bteam_1_9606_go.txt", VALID)],
+                        "w:gz")
+    assert validate_submission(archive).message == "Only one team is allowed per tar archive"
+    assert capsys.readouterr().out == ""
+
+    archive = write_tar(tmp_path / "ateam.tar", [("bteam_1_9606_go.txt", VALID)])
+    assert validate_submission(archive).message == ('Only one team is allowed per tar archive. "ateam" and "bteam" '
+                                                    'do not match.')
+    archive = write_tar(tmp_path / "ateam_x.tar", [])
+    assert "following the underscore should be an integer" in validate_submission(archive).message
+    assert collect_submissions([str(tmp_path)]) == [str(tmp_path / name)
+                                                    for name in ("ateam.tar", "ateam.tar.gz", "ateam_x.tar")]
+
+
+def test_zstd_archive_without_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    (tmp_path / "ateam.tar.zst").write_bytes(b"")
+    result = validate_submission(str(tmp_path / "ateam.tar.zst"))
+    assert result.is_valid is False and "zstandard" in result.message
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_archive_without_prediction_files(tmp_path, workers):
+    empty = write_tar(tmp_path / "ateam.tar", [])
+    result = validate_submission(empty, workers=workers)
+    assert (result.is_valid, result.message) == (False, "Only one team is allowed per tar archive")
+
+    with tarfile.open(str(tmp_path / "ateam.tar.gz"), "w:gz") as archive:
+        directory = tarfile.TarInfo("predictions")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+    result = validate_submission(str(tmp_path / "ateam.tar.gz"), workers=workers)
+    assert (result.is_valid, result.message) == (False, "Only one team is allowed per tar archive")
@@ -0,0 +1,60 @@
+import io
+from cafa_target_counter import TargetTermCounter, term_count_violation
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+
+'''
+Tests for the count of terms per target and model
+'''
+
+FILENAME = "ateam_1_9606_go.txt"
+
+
+def make_submission(models):
+    lines = ["AUTHOR ateam"]
+    for model, predictions in enumerate(models, 1):
+        lines.append("MODEL %s" % model)
+        lines.extend("%s\tGO:%07d\t0.50" % (target, term) for target, term in predictions)
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def test_ungrouped_predictions_are_counted():
+    counter = TargetTermCounter(max_terms=2)
+    for line_num, target in enumerate(["T1000001", b"T1000002", "T1000001", b"T1000001", "T1000002",
+                                       b"T1000001"], 1):
+        counter.add(target, line_num)
+    assert counter.counts.typecode == "I"
+    assert counter.finish() == [term_count_violation(4, "T1000001", 0, 4)]
+
+
+def test_counts_start_again_in_each_model():
+    counter = TargetTermCounter(max_terms=1)
+    counter.new_model(1)
+    counter.add("T1000001", 2)
+    counter.new_model(2)
+    counter.add("T1000001", 4)
+    counter.add("T1000001", 5)
+    violations = counter.finish()
+    assert violations == [term_count_violation(5, "T1000001", 2, 2)]
+    assert counter.describe(violations[0]) == "T1000001 has 2 terms predicted in model 2, at most 1 are allowed"
+
+
+def test_too_many_terms_is_an_error():
+    first = [("T96060000001", term) for term in range(1, 4)]
+    second = [(target, term) for term in range(1, 5) for target in ("T96060000002", "T96060000003")]
+    text = make_submission([first, second])
+
+    assert check_records(io.StringIO(text), FILENAME, GO_SPEC, term_counts=TargetTermCounter(3))[0] is False
+    is_valid, message = check_records(io.BytesIO(text.encode()), FILENAME, GO_SPEC,
+                                      term_counts=TargetTermCounter(3))
+    assert message == ("Error in ateam_1_9606_go.txt, line 13, GO prediction: T96060000002 has 4 terms "
+                       "predicted in model 2, at most 3 are allowed")
+
+    errors = ErrorStore()
+    check_records(io.BytesIO(text.encode()), FILENAME, GO_SPEC, errors, term_counts=TargetTermCounter(3))
+    assert [(error.line_num, error.code) for error in errors] == [
+        (13, ERROR_CODE["too_many_terms"]), (14, ERROR_CODE["too_many_terms"])]
+
+    assert check_records(io.StringIO(text), FILENAME, GO_SPEC, term_counts=TargetTermCounter(4))[0] is True
@@ -0,0 +1,113 @@
+import io
+import pickle
+import pytest
+import cafa_target_index
+from cafa_target_index import load_target_index, parse_fasta_targets, split_target
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_mmap_reader import MappedTextFile
+from cafa_sharded_checker import shard_boundaries, scan_shard, merge_shard_summaries
+from cafa_columnar_checker import columnar_cafa_checker
+
+'''
+Tests for the target index, the check that predicted targets exist and are of the taxonomy
+of the file, and the coverage report
+'''
+
+HUMAN_FASTA = """>T96060000001 1433B_HUMAN
+MTMDKSELVQKAKLAEQAERYDDMAAAMKAVTEQGHELSNEERNLLSVAYKNVVGARRSSWRVISSIEQK
+>T96060000002 1433E_HUMAN
+MDDREDLVYQAKLAEQAERYDEMVESMKKVAGMDVELTVEERNLLSVAYKNVIGARRASWRIISSIEQK
+>T96060000010 1433F_HUMAN
+MGDREQLLQRARLAEQAERYDDMASAMKAVTELNEPLSNEDRNLLSVAYKNVVGARRSSWRVISSIEQK
+>sp|P31946|1433B_HUMAN not a target ID
+MTMDKSELVQKAKLAEQAERYDDMAAAMKAVTEQGHELSNEERNLLSVAYKNVVGARRSSWRVISSIEQK
+"""
+
+OTHER_FASTA = """>T100900000001 1433B_MOUSE
+MTMDKSELVQKAKLAEQAERYDDMAAAMKAVTEQGHELSNEERNLLSVAYKNVVGARRSSWRVISSIEQK
+>EFI12345
+MDDREDLVYQAKLAEQAERYDEMVESMKKVAGMDVELTVEERNLLSVAYKNVIGARRASWRIISSIEQK
+"""
+
+FILENAME = "ateam_1_9606_go.txt"
+TEXT = ("AUTHOR ateam\nMODEL 1\nT96060000001\tGO:0008270\t0.80\nT96060000001\tGO:0003700\t0.50\n"
+        "EFI12345 GO:0003700 0.50\nT96060000002  GO:00001  0.40\nEND\n")
+
+
+@pytest.fixture
+def fasta_paths(tmp_path):
+    paths = [tmp_path / "sp_species.9606.tfa", tmp_path / "other.tfa"]
+    paths[0].write_text(HUMAN_FASTA)
+    paths[1].write_text(OTHER_FASTA)
+    return [str(path) for path in paths]
+
+
+@pytest.fixture
+def target_index(fasta_paths, tmp_path, monkeypatch):
+    monkeypatch.setattr(cafa_target_index, "_loaded_indexes", {})
+    return load_target_index(fasta_paths, str(tmp_path / "cache"))
+
+
+def test_parse_targets_by_group(fasta_paths):
+    assert split_target(b"T96060000010") == ("T9606", 10)
+    assert split_target("EFI12345") == ("EFI/5", 12345)
+    groups = parse_fasta_targets(fasta_paths)
+    assert {group: list(serials) for group, serials in groups.items()} == {
+        "T9606": [1, 2, 10], "T10090": [1], "EFI/5": [12345]}
+
+
+def test_cache_is_reused_without_parsing(fasta_paths, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(cafa_target_index, "_loaded_indexes", {})
+    load_target_index(fasta_paths, cache_dir)
+
+    def fail(*args):
+        raise AssertionError("the FASTA files were parsed again")
+    monkeypatch.setattr(cafa_target_index, "_loaded_indexes", {})
+    monkeypatch.setattr(cafa_target_index, "parse_fasta_targets", fail)
+    target_index = load_target_index(fasta_paths, cache_dir)
+    assert "T96060000010" in target_index and b"T96060000003" not in target_index
+    assert "T100900000001" in pickle.loads(pickle.dumps(target_index))
+
+
+def test_coverage_of_a_valid_file(target_index):
+    is_valid, message = check_records(io.StringIO(TEXT), FILENAME, GO_SPEC, targets=target_index.for_taxonomy(9606))
+    assert is_valid is True
+    assert message.endswith("\nPredicted 2 of the 3 targets of taxonomy 9606 (66.7%)")
+
+
+def test_unknown_and_other_taxonomy_targets_are_errors(target_index):
+    targets = target_index.for_taxonomy(9606)
+    text = TEXT.replace("END\n", "T96060000003 GO:0008270 0.10\n T100900000001 GO:0008270 0.10\nEND\n")
+    is_valid, message = check_records(io.StringIO(text), FILENAME, GO_SPEC, targets=targets)
+    assert is_valid is False
+    assert message == "Error in ateam_1_9606_go.txt, line 7, GO prediction: T96060000003 is not a CAFA target"
+
+    errors = ErrorStore()
+    check_records(io.BytesIO(text.encode()), FILENAME, GO_SPEC, errors, targets=targets)
+    assert [(error.line_num, error.code, error.column) for error in errors] == [
+        (7, ERROR_CODE["unknown_target"], 1), (8, ERROR_CODE["target_taxonomy"], 2)]
+    assert "T100900000001 is a target of taxonomy 10090, not 9606" in errors.messages[1]
+
+
+def test_columnar_and_sharded_checks_agree(target_index, tmp_path):
+    targets = target_index.for_taxonomy(9606)
+    text = TEXT.replace("END\n", "T96060000010\tGO:0008270\t0.30\n" * 50 + "T96060000004\tGO:0000003\t0.10\nEND\n")
+    path = str(tmp_path / FILENAME)
+    for text in (text, TEXT):
+        with open(path, "w") as out_handle:
+            out_handle.write(text)
+        for all_errors in (False, True):
+            expected_errors, sharded_errors = (ErrorStore(), ErrorStore()) if all_errors else (None, None)
+            with MappedTextFile(path) as handle:
+                expected = check_records(handle, FILENAME, GO_SPEC, expected_errors, targets=targets)
+                max_errors = sharded_errors.max_errors if all_errors else None
+                summaries = [scan_shard(handle, start, end, FILENAME, GO_SPEC, max_errors, targets=targets)
+                             for start, end in shard_boundaries(handle, 4)]
+            assert merge_shard_summaries(summaries, FILENAME, GO_SPEC, sharded_errors, targets=targets) == expected
+
+            columnar_errors = ErrorStore() if all_errors else None
+            assert columnar_cafa_checker(io.BytesIO(text.encode()), FILENAME, GO_SPEC, chunk_size=64,
+                                         errors=columnar_errors, targets=targets) == expected
@@ -0,0 +1,148 @@
+import io
+import pickle
+import pytest
+import cafa_term_index
+from cafa_term_index import load_term_index, parse_obo_term_ids
+from cafa_record_engine import check_records
+from cafa_error_store import ErrorStore, ERROR_CODE
+from cafa_go_format_checker import RECORD_SPEC as GO_SPEC
+from cafa_mmap_reader import MappedTextFile
+from cafa_sharded_checker import shard_boundaries, scan_shard, merge_shard_summaries
+from cafa_columnar_checker import columnar_cafa_checker
+from cafa_ontology_dag import parse_obo_parents
+
+'''
+Tests for the ontology term index and the check that predicted terms exist
+'''
+
+OBO = """format-version: 1.2
+ontology: go
+
+[Term]
+id: GO:0008270
+name: zinc ion binding
+alt_id: GO:0003700
+
+[Term]
+id: GO:0000001
+name: obsolete term
+is_obsolete: true
+
+[Typedef]
+id: GO:0000002
+name: not a term
+"""
+
+FILENAME = "ateam_1_9606_go.txt"
+TEXT = ("AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nT96060020120\tGO:0003700\t0.50\n"
+        "T96060020120\tGO:0000002\t0.40\nT96060020120  GO:00001  0.40\nEND\n")
+
+
+@pytest.fixture
+def obo_path(tmp_path):
+    path = tmp_path / "go.obo"
+    path.write_text(OBO)
+    return str(path)
+
+
+@pytest.fixture
+def term_index(obo_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(cafa_term_index, "_loaded_indexes", {})
+    return load_term_index(obo_path, "GO:", str(tmp_path / "cache"))
+
+
+def test_parse_ids_and_alt_ids(obo_path):
+    # The obsolete GO:0000001 is left out
+    assert list(parse_obo_term_ids(obo_path, "GO:")) == [3700, 8270]
+
+
+def test_index_and_dag_have_the_same_terms(obo_path):
+    parents, alt_ids = parse_obo_parents(obo_path, "GO:")
+    assert set(parse_obo_term_ids(obo_path, "GO:")) == set(parents) | set(alt_ids)
+
+
+def test_cache_is_reused_without_parsing(obo_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(cafa_term_index, "_loaded_indexes", {})
+    load_term_index(obo_path, "GO:", cache_dir)
+
+    def fail(*args):
+        raise AssertionError("the OBO file was parsed again")
+    monkeypatch.setattr(cafa_term_index, "_loaded_indexes", {})
+    monkeypatch.setattr(cafa_term_index, "parse_obo_term_ids", fail)
+    term_index = load_term_index(obo_path, "GO:", cache_dir)
+    assert term_index.has_term("GO:0008270") and not term_index.has_term(b"GO:0000002")
+    assert pickle.loads(pickle.dumps(term_index)).has_term("GO:0003700")
+
+
+def test_unknown_term_is_an_error(term_index):
+    is_valid, message = check_records(io.StringIO(TEXT), FILENAME, GO_SPEC, terms=term_index)
+    assert is_valid is False
+    assert message == "Error in ateam_1_9606_go.txt, line 5, GO prediction: GO:0000002 is not a term of the ontology"
+
+    errors = ErrorStore()
+    check_records(io.BytesIO(TEXT.encode()), FILENAME, GO_SPEC, errors, terms=term_index)
+    # GO:00001 is the obsolete GO:0000001
+    assert [(error.line_num, error.code, error.column) for error in errors] == [
+        (5, ERROR_CODE["unknown_term"], 14), (6, ERROR_CODE["unknown_term"], 15)]
+
+
+def test_columnar_and_sharded_checks_agree(term_index, tmp_path):
+    text = TEXT.replace("END\n", "T96060020120\tGO:0008270\t0.30\n" * 50 + "T1234567\tGO:0000003\t0.10\nEND\n")
+    path = str(tmp_path / FILENAME)
+    with open(path, "w") as out_handle:
+        out_handle.write(text)
+    for all_errors in (False, True):
+        expected_errors, sharded_errors = (ErrorStore(), ErrorStore()) if all_errors else (None, None)
+        with MappedTextFile(path) as handle:
+            expected = check_records(handle, FILENAME, GO_SPEC, expected_errors, terms=term_index)
+            max_errors = sharded_errors.max_errors if all_errors else None
+            summaries = [scan_shard(handle, start, end, FILENAME, GO_SPEC, max_errors, term_index)
+                         for start, end in shard_boundaries(handle, 4)]
+        assert merge_shard_summaries(summaries, FILENAME, GO_SPEC, sharded_errors, term_index) == expected
+
+        # Without numpy, this is check_records again
+        columnar_errors = ErrorStore() if all_errors else None
+        assert columnar_cafa_checker(io.BytesIO(text.encode()), FILENAME, GO_SPEC, chunk_size=64,
+                                     errors=columnar_errors, terms=term_index) == expected
+
+
+DOID_OBO = """format-version: 1.2
+ontology: doid
+
+[Term]
+id: DOID:0001816
+name: angiosarcoma
+alt_id: DOID:267
+is_a: DOID:4
+
+[Term]
+id: DOID:4
+name: disease
+"""
+
+
+def test_doid_terms_are_predicted_as_do(tmp_path, monkeypatch):
+    import cafa_ontology_dag
+    from cafa4_format_checker import validate_submission
+    from cafa_ontology_dag import load_ontology_dag
+    monkeypatch.setattr(cafa_term_index, "_loaded_indexes", {})
+    monkeypatch.setattr(cafa_ontology_dag, "_loaded_dags", {})
+    obo_path = tmp_path / "doid.obo"
+    obo_path.write_text(DOID_OBO)
+    cache_dir = str(tmp_path / "cache")
+
+    assert list(parse_obo_term_ids(str(obo_path), "DO:")) == [4, 267, 1816]
+    term_indexes = {"do": load_term_index(str(obo_path), "DO:", cache_dir)}
+    submission = tmp_path / "ateam_1_9606_do.txt"
+    submission.write_text("AUTHOR ateam\nMODEL 1\nT96060020120\tDO:0001816\t0.80\nT96060020120\tDO:0000267\t0.50\n"
+                          "T96060020120\tDO:0000004\t0.90\nEND\n")
+    assert validate_submission(str(submission), term_indexes=term_indexes).is_valid
+
+    dags = {"do": load_ontology_dag(str(obo_path), "DO:", cache_dir)}
+    result = validate_submission(str(submission), term_indexes=term_indexes, dags=dags)
+    assert result.is_valid, result.message
+    submission.write_text("AUTHOR ateam\nMODEL 1\nT96060020120\tDO:0001816\t0.80\nT96060020120\tDO:0000004\t0.10\n"
+                          "END\n")
+    result = validate_submission(str(submission), term_indexes=term_indexes, dags=dags)
+    assert result.is_valid is False and "DO:0000004" in result.message
@@ -0,0 +1,206 @@
+import gzip
+import zipfile
+import pytest
+import cafa4_format_checker
+import cafa_term_index
+import cafa_verdict_cache
+from cafa4_format_checker import validate_submission
+from cafa_term_index import load_term_index, TermIndex
+from cafa_verdict_cache import VerdictCache
+
+'''
+Tests for the cache of the verdicts on files already checked
+'''
+
+OBO = """format-version: 1.2
+
+[Term]
+id: GO:0008270
+"""
+
+VALID = "AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0008270\t0.80\nEND\n"
+INVALID = "AUTHOR ateam\nMODEL 1\nT96060020120\tGO:0003700\t0.80\nEND\n"
+
+
+@pytest.fixture
+def verdicts(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache" / "verdicts.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def term_indexes(tmp_path, monkeypatch):
+    obo_path = tmp_path / "go.obo"
+    obo_path.write_text(OBO)
+    monkeypatch.setattr(cafa_term_index, "_loaded_indexes", {})
+    return {"go": load_term_index(str(obo_path), "GO:", str(tmp_path / "cache"))}
+
+
+def refuse_to_check(*args):
+    raise AssertionError("the file was checked again")
+
+
+def test_unchanged_file_is_not_checked_again(tmp_path, verdicts, term_indexes, monkeypatch):
+    filepath = tmp_path / "ateam_1_9606_go.txt"
+    filepath.write_text(INVALID)
+    first = validate_submission(str(filepath), term_indexes=term_indexes, verdicts=verdicts)
+    assert first.is_valid is False and len(verdicts) == 1
+
+    with monkeypatch.context() as patch:
+        patch.setattr(cafa4_format_checker, "_check_ontology_file", refuse_to_check)
+        assert validate_submission(str(filepath), term_indexes=term_indexes, verdicts=verdicts) == first
+
+    # Another content, or other options, is another verdict
+    filepath.write_text(VALID)
+    assert validate_submission(str(filepath), term_indexes=term_indexes, verdicts=verdicts).is_valid is True
+    assert validate_submission(str(filepath), max_terms=1, verdicts=verdicts).is_valid is True
+    assert len(verdicts) == 3
+
+
+def test_file_under_another_path_is_not_checked_again(tmp_path, verdicts, term_indexes, monkeypatch):
+    first_path = tmp_path / "first" / "ateam_1_9606_go.txt"
+    second_path = tmp_path / "second" / "ateam_1_9606_go.txt"
+    for filepath in (first_path, second_path):
+        filepath.parent.mkdir()
+        filepath.write_text(INVALID)
+    first = validate_submission(str(first_path), term_indexes=term_indexes, verdicts=verdicts)
+    assert str(first_path) in first.message
+
+    monkeypatch.setattr(cafa4_format_checker, "_check_ontology_file", refuse_to_check)
+    second = validate_submission(str(second_path), term_indexes=term_indexes, verdicts=verdicts)
+    assert second.is_valid is False
+    assert second.message == first.message.replace(str(first_path), str(second_path))
+
+
+def test_verdict_depends_on_the_team_in_the_file_name(tmp_path, verdicts):
+    # The DO checker expects the team of the file name in the AUTHOR record
+    text = "AUTHOR teamA\nMODEL 1\nKEYWORDS sequence alignment.\nT96060020120\tDO:0008270\t0.80\nEND\n"
+    valid_path = tmp_path / "teamA_1_9606_do.txt"
+    other_team_path = tmp_path / "teamB_1_9606_do.txt"
+    valid_path.write_text(text)
+    other_team_path.write_text(text)
+    assert validate_submission(str(valid_path), verdicts=verdicts).is_valid is True
+    result = validate_submission(str(other_team_path), verdicts=verdicts)
+    assert result.is_valid is False and "Expected teamB, but found teamA" in result.message
+
+
+def test_zip_members_are_cached_in_worker_processes(tmp_path, verdicts, monkeypatch):
+    archive_path = str(tmp_path / "ateam.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("ateam_1_9606_go.txt", VALID)
+        archive.writestr("ateam_1_10090_go.txt", INVALID.replace("T9606", "T10090"))
+    first = validate_submission(archive_path, workers=2, verdicts=verdicts)
+    assert len(verdicts) == 2
+
+    monkeypatch.setattr(cafa4_format_checker, "_check_ontology_file", refuse_to_check)
+    assert validate_submission(archive_path, workers=1, verdicts=verdicts) == first
+
+
+def test_compressed_files_are_decompressed_once(tmp_path, verdicts, monkeypatch):
+    gz_path = str(tmp_path / "ateam_1_9606_go.txt.gz")
+    with gzip.open(gz_path, "wt") as write_handle:
+        write_handle.write(VALID)
+    archive_path = str(tmp_path / "ateam.zip")
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("ateam_1_9606_go.txt", VALID)
+
+    decompressed = []
+    for reader in (gzip.GzipFile, zipfile.ZipExtFile):
+        def spy_read(self, *args, read=reader.read):
+            data = read(self, *args)
+            decompressed.append(len(data))
+            return data
+        monkeypatch.setattr(reader, "read", spy_read)
+
+    for path in (gz_path, archive_path):
+        del decompressed[:]
+        assert validate_submission(path, workers=1, verdicts=verdicts).is_valid
+        assert sum(decompressed) == len(VALID)
+        # Nor at all when it is seen again
+        del decompressed[:]
+        assert validate_submission(path, workers=1, verdicts=verdicts).is_valid
+        assert sum(decompressed) == 0
+
+
+def test_index_without_digest_is_not_cached(tmp_path, verdicts, term_indexes):
+    filepath = tmp_path / "ateam_1_9606_go.txt"
+    filepath.write_text(VALID)
+    index = term_indexes["go"]
+    unversioned = {"go": TermIndex(bytes(index.bitmap_view()), "GO:")}
+    assert validate_submission(str(filepath), term_indexes=unversioned, verdicts=verdicts).is_valid is True
+    assert len(verdicts) == 0
+
+
+def test_least_recently_used_verdicts_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(cafa_verdict_cache.time, "time", lambda: next(clock))
+    cache = VerdictCache(str(tmp_path / "verdicts.sqlite"), max_bytes=3 * cafa_verdict_cache.ROW_OVERHEAD)
+    for key in ("a", "b", "c"):
+        cache.put(key, True, None)
+    assert cache.get("a") == (True, None)
+    cache.put("d", False, "")
+    # Evicted down to the low-water mark, 270 bytes: two verdicts
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["a", "d"]
+
+    # Then nothing is evicted until the cache is full again
+    evictions = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: evictions.append(1) or evict())
+    cache.put("e", True, None)
+    assert evictions == [] and len(cache) == 3
+    cache.put("f", True, None)
+    assert evictions == [1] and len(cache) == 2
+    cache.close()
+
+
+def test_stored_size_is_kept_by_every_writer(tmp_path):
+    path = str(tmp_path / "verdicts.sqlite")
+    first, second = VerdictCache(path), VerdictCache(path)
+    first.put("a", False, "x" * 10)
+    second.put("b", True, None)
+    # Replaced, then evicted with b
+    second.put("a", False, "x" * 20)
+    first.max_bytes = 2 * cafa_verdict_cache.ROW_OVERHEAD
+    first.put("c", True, None)
+    sizes = first._connect().execute("SELECT SUM(size) FROM verdicts").fetchone()[0]
+    assert first.stored_bytes() == second.stored_bytes() == sizes == cafa_verdict_cache.ROW_OVERHEAD
+    first.close()
+    second.close()
+
+
+def test_incremental_archive_only_reads_changed_members(tmp_path, verdicts, monkeypatch):
+    members = {"ateam_1_9606_go.txt": VALID, "ateam_1_10090_go.txt": VALID.replace("T9606", "T10090")}
+
+    def write_archive(members):
+        archive_path = str(tmp_path / "ateam.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            for name, text in members.items():
+                archive.writestr(name, text)
+        return archive_path
+
+    opened = []
+    zip_open = zipfile.ZipFile.open
+
+    def spy_open(self, name, mode="r", *args, **kwargs):
+        if mode == "r":
+            opened.append(name)
+        return zip_open(self, name, mode, *args, **kwargs)
+    monkeypatch.setattr(zipfile.ZipFile, "open", spy_open)
+
+    assert validate_submission(write_archive(members), workers=1, verdicts=verdicts, incremental=True).is_valid
+    assert sorted(opened) == sorted(members)
+
+    # Only the changed member is read; an invalid archive is not the last valid one
+    del opened[:]
+    members["ateam_1_9606_go.txt"] = VALID.replace("0.80", "1.80")
+    result = validate_submission(write_archive(members), workers=1, verdicts=verdicts, incremental=True)
+    assert result.is_valid is False and opened == ["ateam_1_9606_go.txt"]
+    assert validate_submission(write_archive(members), workers=1, verdicts=verdicts, incremental=True) == result
+
+    del opened[:]
+    members["ateam_1_9606_go.txt"] = VALID.replace("0.80", "0.70")
+    assert validate_submission(write_archive(members), workers=1, verdicts=verdicts, incremental=True).is_valid
+    del opened[:]
+    assert validate_submission(write_archive(members), workers=1, verdicts=verdicts, incremental=True).is_valid
+    assert opened == []